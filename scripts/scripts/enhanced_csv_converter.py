@@ -5,11 +5,11 @@ and generates PRIME category reports matching the required format.
 """
 
 import json
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from datetime import datetime
 import sys
-from collections import Counter
 
 # Import the PRIME categories mapping
 PRIME_CATEGORIES = {
@@ -59,268 +59,235 @@ PRIME_CATEGORIES = {
     "Autos": "Autos", "Other_Adult_and_Web_results": "Other: Adult and Web results"
 }
 
+# Schema fields, in detailed CSV column order
+ANNOTATION_FIELDS = ['ambiguous', 'misspelled_malformed', 'non_market_language']
+
+ENTITY_FIELDS = [
+    'person_notable', 'person_non_notable', 'type_of_person', 'specific_organization',
+    'type_of_organization', 'media_title', 'type_of_media', 'specific_product',
+    'type_of_product', 'specific_place_city', 'specific_place_poi', 'specific_place_address',
+    'specific_place_other', 'type_of_place', 'specific_event', 'type_of_event',
+    'website', 'other_entity'
+]
+
+INTENT_FIELDS = [
+    'website', 'porn_illegal', 'images_videos', 'local_info', 'event_info',
+    'news', 'shopping', 'simple_fact', 'research', 'other_intent'
+]
+
+TOPIC_FIELDS = [
+    'autos', 'education', 'entertainment_books', 'entertainment_games', 'entertainment_movies',
+    'entertainment_music', 'entertainment_tv', 'entertainment_other', 'environment', 'finance',
+    'food_dining', 'government_politics', 'health_medical', 'home_garden', 'jobs', 'legal',
+    'people_search', 'personal_goods', 'pets_animals', 'real_estate', 'religion', 'retailers',
+    'social_networking', 'sports_outdoors', 'tech_electronics', 'transit_traffic',
+    'travel_lodging', 'weather', 'other_topic'
+]
+
 def load_json_results(json_file_path):
     """Load results from JSON file"""
     with open(json_file_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
     return data
 
-def create_detailed_classification_csv(results_data, output_file):
-    """Create detailed CSV with all classification schemas"""
-    
+def extract_prime_category(prime):
+    """PRIME category of a result ('' when missing); older results stored it as a dict"""
+    if isinstance(prime, dict):
+        return prime.get('category', '') or prime.get('prime_category', '')
+    return str(prime) if prime else ''
+
+def _join_entities(entities):
+    """Entity list as a comma-separated string"""
+    if isinstance(entities, list):
+        return ', '.join([str(e) for e in entities])
+    return str(entities)
+
+def _schema_frame(results, schema):
+    """One schema of every result with a column per key present in any result"""
+    return pd.DataFrame([result.get(schema) or {} for result in results], index=pd.RangeIndex(len(results)))
+
+def _truthy(frame):
+    """Cells holding a truthy value (NaN from absent keys counts as False)"""
+    return frame.where(frame.notna(), False).astype(bool)
+
+def _flag_columns(raw, results, schema, fields, prefix):
+    """Flag columns for the CSV: an absent field is False, an explicit null stays an empty cell"""
+    gaps = raw.reindex(columns=fields).isna()
+    flags = raw.reindex(columns=fields).astype(object).where(~gaps, False)
+    # Nulls and absent fields both show up as NaN, so rows with a gap are checked against the raw dict
+    for row in np.flatnonzero(gaps.values.any(axis=1)):
+        values = results[row].get(schema) or {}
+        for position in np.flatnonzero(gaps.values[row]):
+            if fields[position] in values:
+                flags.iat[row, position] = None
+    return flags.infer_objects().add_prefix(prefix)
+
+def _flag_counts(flags):
+    """Rows with a True cell per column
+    
+    Columns are ordered by the first row where they are set, as counting
+    row by row would list them.
+    """
+    counts = flags.sum()
+    first_row = np.where(counts.values > 0, flags.values.argmax(axis=0) if len(flags) else 0, len(flags))
+    return counts.iloc[np.argsort(first_row, kind='stable')]
+
+def flatten_results(results_data):
+    """Flatten all results into one table with a column per schema field
+    
+    Each schema is read from the raw results once into its own frame, and
+    the per-result fields once per column; every CSV and report is then
+    derived from the returned DataFrame. Also returns, per schema, how many
+    results set each key, counted from the raw values (unknown keys
+    included) for the summary.
+    """
     results = results_data.get('results', [])
-    rows = []
-    
-    for result in results:
-        query = result['query']
-        annotation = result.get('annotation_schema', {})
-        entity = result.get('entity_schema', {})
-        intent = result.get('intent_schema', {})
-        topic = result.get('topic_schema', {})
-        prime = result.get('prime_category', {})
-        
-        # Create base row
-        row = {
-            'query_text': query['text'],
-            'query_index': query['index'],
-            'query_word_count': query['word_count'],
-        }
-        
-        # Annotation Schema (3 classifications)
-        row.update({
-            'annotation_ambiguous': annotation.get('ambiguous', False),
-            'annotation_misspelled_malformed': annotation.get('misspelled_malformed', False),
-            'annotation_non_market_language': annotation.get('non_market_language', False),
-        })
-        
-        # Entity Schema (18 classifications) - convert lists to comma-separated strings
-        entity_fields = [
-            'person_notable', 'person_non_notable', 'type_of_person', 'specific_organization',
-            'type_of_organization', 'media_title', 'type_of_media', 'specific_product',
-            'type_of_product', 'specific_place_city', 'specific_place_poi', 'specific_place_address',
-            'specific_place_other', 'type_of_place', 'specific_event', 'type_of_event',
-            'website', 'other_entity'
-        ]
-        
-        for field in entity_fields:
-            entities = entity.get(field, [])
-            if isinstance(entities, list):
-                row[f'entity_{field}'] = ', '.join([str(e) for e in entities]) if entities else ''
-            else:
-                row[f'entity_{field}'] = str(entities) if entities else ''
-        
-        # Intent Schema (10 classifications)
-        intent_fields = [
-            'website', 'porn_illegal', 'images_videos', 'local_info', 'event_info',
-            'news', 'shopping', 'simple_fact', 'research', 'other_intent'
-        ]
-        
-        for field in intent_fields:
-            row[f'intent_{field}'] = intent.get(field, False)
-        
-        # Topic Schema (29 classifications)
-        topic_fields = [
-            'autos', 'education', 'entertainment_books', 'entertainment_games', 'entertainment_movies',
-            'entertainment_music', 'entertainment_tv', 'entertainment_other', 'environment', 'finance',
-            'food_dining', 'government_politics', 'health_medical', 'home_garden', 'jobs', 'legal',
-            'people_search', 'personal_goods', 'pets_animals', 'real_estate', 'religion', 'retailers',
-            'social_networking', 'sports_outdoors', 'tech_electronics', 'transit_traffic',
-            'travel_lodging', 'weather', 'other_topic'
-        ]
-        
-        for field in topic_fields:
-            row[f'topic_{field}'] = topic.get(field, False)
-        
-        # PRIME Category (MECE - exactly one)
-        if isinstance(prime, dict):
-            row['prime_category'] = prime.get('category', '') or prime.get('prime_category', '')
-        else:
-            row['prime_category'] = str(prime) if prime else ''
-        
-        # Meta category for aggregation
-        row['meta_category'] = PRIME_CATEGORIES.get(row['prime_category'], 'Other categories')
-        
-        # Additional fields
-        row.update({
-            'research_notes': result.get('research_notes', ''),
-            'confidence_score': result.get('confidence_score', 0.0),
-            'processing_time_seconds': result.get('processing_time', 0.0),
-            'timestamp': result.get('timestamp', ''),
-        })
-        
-        rows.append(row)
     
-    # Create DataFrame and save
-    df = pd.DataFrame(rows)
+    queries = pd.DataFrame.from_records([result['query'] for result in results],
+                                        columns=['text', 'index', 'word_count'])
+    base = pd.DataFrame({
+        'query_text': queries['text'],
+        'query_index': queries['index'],
+        'query_word_count': queries['word_count'],
+    })
+    
+    field_counts = {}
+    flag_frames = []
+    for schema, fields, prefix in [('annotation_schema', ANNOTATION_FIELDS, 'annotation_'),
+                                   ('intent_schema', INTENT_FIELDS, 'intent_'),
+                                   ('topic_schema', TOPIC_FIELDS, 'topic_')]:
+        raw = _schema_frame(results, schema)
+        field_counts[schema] = _flag_counts(_truthy(raw))
+        flag_frames.append(_flag_columns(raw, results, schema, fields, prefix))
+    annotations, intents, topics = flag_frames
+    
+    # Entity lists become comma-separated strings; only non-empty cells need joining.
+    # The summary counts non-empty lists only, not scalar values.
+    raw = _schema_frame(results, 'entity_schema')
+    filled = _truthy(raw)
+    listed = pd.DataFrame(False, index=raw.index, columns=raw.columns)
+    for column in raw.columns:
+        values = raw.loc[filled[column], column]
+        listed.loc[filled[column], column] = values.map(lambda value: isinstance(value, list)).astype(bool)
+    field_counts['entity_schema'] = _flag_counts(listed)
+    entities = pd.DataFrame(index=raw.index)
+    for field in ENTITY_FIELDS:
+        if field in raw.columns:
+            values = raw.loc[filled[field], field].map(_join_entities)
+            entities[f'entity_{field}'] = values.reindex(raw.index, fill_value='')
+        else:
+            entities[f'entity_{field}'] = ''
+    
+    # Defaults apply to absent keys only; an explicit null stays an empty cell
+    prime_category = pd.Series([extract_prime_category(result.get('prime_category', '')) for result in results],
+                                dtype=object)
+    meta = pd.DataFrame({
+        'prime_category': prime_category,
+        'meta_category': prime_category.map(PRIME_CATEGORIES).fillna('Other categories'),
+        'research_notes': [result.get('research_notes', '') for result in results],
+        'confidence_score': [result.get('confidence_score', 0.0) for result in results],
+        'processing_time_seconds': [result.get('processing_time', 0.0) for result in results],
+        'timestamp': [result.get('timestamp', '') for result in results],
+    })
+    
+    return pd.concat([base, annotations, entities, intents, topics, meta], axis=1), field_counts
+
+def _counts_by_frequency(values):
+    """Value counts, most frequent first; ties keep first-appearance order"""
+    return values.value_counts(sort=False).sort_values(ascending=False, kind='stable')
+
+def create_detailed_classification_csv(df, output_file):
+    """Create detailed CSV with all classification schemas"""
     df.to_csv(output_file, index=False)
     print(f"✅ Detailed classification CSV saved: {output_file}")
     print(f"   Columns: {len(df.columns)}, Rows: {len(df)}")
     
     return df
 
-def create_prime_report(results_data, output_file):
+def create_prime_report(df, output_file):
     """Create PRIME category report matching Prime_report.csv format"""
     
-    results = results_data.get('results', [])
-    total_queries = len(results)
-    
-    # Count PRIME categories
-    prime_counts = Counter()
-    
-    for result in results:
-        prime = result.get('prime_category', {})
-        if isinstance(prime, dict):
-            category = prime.get('category', '') or prime.get('prime_category', '')
-        else:
-            category = str(prime) if prime else 'OTHER_None_of_These'
-        
-        if category:
-            prime_counts[category] += 1
-        else:
-            prime_counts['OTHER_None_of_These'] += 1
+    total_queries = len(df)
     
-    # Create report rows
-    report_rows = []
+    # Results without a category are reported as OTHER_None_of_These
+    prime_counts = _counts_by_frequency(df['prime_category'].replace('', 'OTHER_None_of_These'))
+    categories = prime_counts.index.to_series()
+    percentages = prime_counts / total_queries * 100 if total_queries > 0 else prime_counts * 0.0
     
-    for prime_category, count in prime_counts.items():
-        meta_category = PRIME_CATEGORIES.get(prime_category, 'Other categories')
-        percentage = (count / total_queries) * 100 if total_queries > 0 else 0
-        
-        report_rows.append({
-            'Meta (for aggregations and piechart)': meta_category,
-            'PRIME (known as OYE in previous projects)': prime_category,
-            'Query Count': count,
-            'Percentage of Total': f"{percentage:.1f}%"
-        })
-    
-    # Sort by count (descending)
-    report_rows.sort(key=lambda x: x['Query Count'], reverse=True)
-    
-    # Create DataFrame and save
-    df = pd.DataFrame(report_rows)
-    df.to_csv(output_file, index=False)
+    report = pd.DataFrame({
+        'Meta (for aggregations and piechart)': categories.map(PRIME_CATEGORIES).fillna('Other categories').values,
+        'PRIME (known as OYE in previous projects)': categories.values,
+        'Query Count': prime_counts.values,
+        'Percentage of Total': percentages.map('{:.1f}%'.format).values
+    })
+    report.to_csv(output_file, index=False)
     
     print(f"✅ PRIME category report saved: {output_file}")
-    print(f"   Categories: {len(df)}, Total queries: {total_queries}")
+    print(f"   Categories: {len(report)}, Total queries: {total_queries}")
     
-    return df
+    return report
 
-def create_meta_aggregation_report(results_data, output_file):
+def _meta_definition(meta_category):
+    """Definition of a meta category"""
+    if "Answer" in meta_category:
+        return "Show opinions, advice, recommendations from others"
+    elif "Quickfact" in meta_category:
+        return "Show quick factual answers and definitions"
+    elif "Entertainment" in meta_category:
+        return "Entertainment content including celebrities, movies, music"
+    elif meta_category == "Local":
+        return "Local business listings with maps and contact information"
+    elif meta_category == "Navigational":
+        return "Website navigation and direct access queries"
+    elif meta_category == "Product":
+        return "Product information, prices, sellers, reviews"
+    return f"Queries related to {meta_category.lower()}"
+
+def create_meta_aggregation_report(df, output_file):
     """Create meta category aggregation report"""
     
-    results = results_data.get('results', [])
-    total_queries = len(results)
+    total_queries = len(df)
     
-    # Count by meta categories
-    meta_counts = Counter()
+    meta_counts = _counts_by_frequency(df['meta_category'])
+    percentages = meta_counts / total_queries * 100 if total_queries > 0 else meta_counts * 0.0
     
-    for result in results:
-        prime = result.get('prime_category', {})
-        if isinstance(prime, dict):
-            category = prime.get('category', '') or prime.get('prime_category', '')
-        else:
-            category = str(prime) if prime else 'OTHER_None_of_These'
-        
-        meta_category = PRIME_CATEGORIES.get(category, 'Other categories')
-        meta_counts[meta_category] += 1
-    
-    # Create report rows
-    report_rows = []
-    
-    for meta_category, count in meta_counts.items():
-        percentage = (count / total_queries) * 100 if total_queries > 0 else 0
-        
-        # Create definition based on meta category
-        if "Answer" in meta_category:
-            definition = "Show opinions, advice, recommendations from others"
-        elif "Quickfact" in meta_category:
-            definition = "Show quick factual answers and definitions" 
-        elif "Entertainment" in meta_category:
-            definition = "Entertainment content including celebrities, movies, music"
-        elif meta_category == "Local":
-            definition = "Local business listings with maps and contact information"
-        elif meta_category == "Navigational":
-            definition = "Website navigation and direct access queries"
-        elif meta_category == "Product":
-            definition = "Product information, prices, sellers, reviews"
-        else:
-            definition = f"Queries related to {meta_category.lower()}"
-        
-        report_rows.append({
-            'category - groups include "Answers" equivalents': meta_category,
-            'query volume for meta group': f"{count} ({percentage:.1f}%)",
-            'definition of meta group': definition
-        })
-    
-    # Sort by count (descending)
-    report_rows.sort(key=lambda x: int(x['query volume for meta group'].split('(')[0].split()[0]), reverse=True)
-    
-    # Create DataFrame and save
-    df = pd.DataFrame(report_rows)
-    df.to_csv(output_file, index=False)
+    report = pd.DataFrame({
+        'category - groups include "Answers" equivalents': meta_counts.index,
+        'query volume for meta group': [f"{count} ({percentage:.1f}%)"
+                                        for count, percentage in zip(meta_counts.values, percentages.values)],
+        'definition of meta group': meta_counts.index.map(_meta_definition)
+    })
+    report.to_csv(output_file, index=False)
     
     print(f"✅ Meta aggregation report saved: {output_file}")
-    print(f"   Meta categories: {len(df)}, Total queries: {total_queries}")
+    print(f"   Meta categories: {len(report)}, Total queries: {total_queries}")
     
-    return df
+    return report
 
-def print_classification_summary(results_data):
+def print_classification_summary(df, field_counts):
     """Print summary statistics of classifications"""
     
-    results = results_data.get('results', [])
-    total_queries = len(results)
+    total_queries = len(df)
     
     print(f"\n📊 Classification Summary:")
     print("=" * 50)
     print(f"Total queries classified: {total_queries}")
     
-    # Count annotation issues
-    annotation_counts = Counter()
-    for result in results:
-        annotation = result.get('annotation_schema', {})
-        for key, value in annotation.items():
-            if value:
-                annotation_counts[key] += 1
-    
+    annotation_counts = field_counts['annotation_schema']
     print(f"\nAnnotation Issues:")
-    for issue, count in annotation_counts.items():
+    for issue, count in annotation_counts[annotation_counts > 0].items():
         print(f"  {issue}: {count} ({count/total_queries*100:.1f}%)")
     
-    # Count top entities
-    entity_counts = Counter()
-    for result in results:
-        entity = result.get('entity_schema', {})
-        for key, value in entity.items():
-            if value and (isinstance(value, list) and len(value) > 0):
-                entity_counts[key] += 1
-    
-    print(f"\nTop Entity Types:")
-    for entity_type, count in entity_counts.most_common(5):
-        print(f"  {entity_type}: {count} queries")
-    
-    # Count intents
-    intent_counts = Counter()
-    for result in results:
-        intent = result.get('intent_schema', {})
-        for key, value in intent.items():
-            if value:
-                intent_counts[key] += 1
-    
-    print(f"\nTop Intents:")
-    for intent, count in intent_counts.most_common(5):
-        print(f"  {intent}: {count} queries")
-    
-    # Count topics
-    topic_counts = Counter()
-    for result in results:
-        topic = result.get('topic_schema', {})
-        for key, value in topic.items():
-            if value:
-                topic_counts[key] += 1
-    
-    print(f"\nTop Topics:")
-    for topic, count in topic_counts.most_common(5):
-        print(f"  {topic}: {count} queries")
+    sections = [
+        ("Top Entity Types", field_counts['entity_schema']),
+        ("Top Intents", field_counts['intent_schema']),
+        ("Top Topics", field_counts['topic_schema']),
+    ]
+    for title, counts in sections:
+        top = counts[counts > 0].sort_values(ascending=False, kind='stable').head(5)
+        print(f"\n{title}:")
+        for name, count in top.items():
+            print(f"  {name}: {count} queries")
 
 def main():
     """Main function to convert JSON to multiple CSV formats"""
@@ -341,20 +308,23 @@ def main():
         total_results = results_data.get('metadata', {}).get('total_results', 0)
         print(f"✅ Loaded {total_results} results")
         
+        # Flatten once; every output below is computed from this table
+        detailed_df, field_counts = flatten_results(results_data)
+        
         # Create detailed classification CSV
         detailed_csv = output_dir / "detailed_classifications.csv"
-        detailed_df = create_detailed_classification_csv(results_data, detailed_csv)
+        create_detailed_classification_csv(detailed_df, detailed_csv)
         
         # Create PRIME category report
         prime_report_csv = output_dir / "prime_category_report.csv"
-        prime_df = create_prime_report(results_data, prime_report_csv)
+        prime_df = create_prime_report(detailed_df, prime_report_csv)
         
         # Create meta aggregation report
         meta_report_csv = output_dir / "meta_aggregation_report.csv"
-        meta_df = create_meta_aggregation_report(results_data, meta_report_csv)
+        meta_df = create_meta_aggregation_report(detailed_df, meta_report_csv)
         
         # Print summary
-        print_classification_summary(results_data)
+        print_classification_summary(detailed_df, field_counts)
         
         print(f"\n✅ All reports generated successfully!")
         print(f"📁 Files created:")
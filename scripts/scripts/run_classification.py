@@ -10,6 +10,10 @@ import time
 from pathlib import Path
 from typing import List
 import argparse
+import csv
+import dataclasses
+import itertools
+import json
 import logging
 
 # Add src directory to Python path
@@ -18,11 +22,25 @@ src_dir = script_dir.parent / "src"
 sys.path.insert(0, str(src_dir))
 
 from qcl.classification.classifier import QueryClassifier
+from qcl.classification.local_model import HashedNgramVectorizer, LocalModel
+from qcl.classification.retrieval import create_retriever
+from qcl.classification.rules import RulesClassifier
+from qcl.classification.semantic_cache import SemanticCache
 from qcl.core.config import Config
-from qcl.data.loaders import load_queries_from_csv, save_results, load_guidelines_from_pdf
+from qcl.data.cache import ClassificationCache
+from qcl.data.chunking import TokenChunker
+from qcl.data.loaders import (
+    load_queries_from_csv, iter_queries_from_csv, save_results, load_guidelines_from_pdf,
+    JsonlResultWriter, DeadLetterWriter, load_completed_indices, compact_jsonl_results, iter_labelled_rows
+)
 from qcl.data.models import Query
 from qcl.core.config import get_config, setup_logging
 from qcl.data.models import ClassificationResult
+from qcl.pipeline.batch_api import BatchJobRunner
+from qcl.pipeline.dedup import (
+    QueryNormalizer, StreamingDeduplicator, deduplicate_queries, fan_out_results, dead_letter_failed_duplicates
+)
+from qcl.pipeline.executor import AdaptiveConcurrency, ConcurrentClassifier
 
 
 
@@ -38,13 +56,19 @@ def main():
     # Get configuration
     config = get_config()
     
-    # Validate configuration
-    if not config.validate():
+    # Validate configuration (the local model commands never call the API)
+    if args.command not in ("train-local", "classify-local") and not config.validate():
         sys.exit(1)
     
     try:
         if args.command == "classify":
             run_classification(args, config, logger)
+        elif args.command == "classify-batch":
+            run_batch_classification(args, config, logger)
+        elif args.command == "train-local":
+            train_local_model(args, config, logger)
+        elif args.command == "classify-local":
+            run_local_classification(args, config, logger)
         elif args.command == "validate":
             validate_data(args, config, logger)
         else:
@@ -74,6 +98,78 @@ def create_parser():
     classify_parser.add_argument("--output", type=Path, required=True, help="Path to output JSON file")
     classify_parser.add_argument("--max-queries", type=int, help="Maximum number of queries to process")
     classify_parser.add_argument("--batch-size", type=int, help="Batch size for processing")
+    classify_parser.add_argument("--batched", action="store_true", help="Classify --batch-size queries per LLM call")
+    classify_parser.add_argument("--concurrency", type=int, help="Maximum number of classification calls in flight")
+    classify_parser.add_argument("--adaptive", action="store_true",
+                                 help="Adjust concurrency to observed latency and throttling (starts at --concurrency)")
+    classify_parser.add_argument("--hedge", action="store_true",
+                                 help="Send a duplicate request when a call is slower than most recent ones")
+    classify_parser.add_argument("--cascade", action="store_true",
+                                 help="Try the cheaper cascade model first; escalate low-confidence or invalid answers")
+    classify_parser.add_argument("--cascade-threshold", type=float,
+                                 help="Minimum confidence to keep the cheaper model's answer (implies --cascade)")
+    classify_parser.add_argument("--no-cache", action="store_true", help="Bypass the on-disk classification cache")
+    classify_parser.add_argument("--semantic-cache", action="store_true",
+                                 help="Reuse the cached answer of a near-duplicate query on an exact cache miss")
+    classify_parser.add_argument("--semantic-threshold", type=float,
+                                 help="Minimum similarity for near-duplicate reuse (implies --semantic-cache)")
+    classify_parser.add_argument("--rules", action="store_true",
+                                 help="Answer known sites, chains and QUICKFACT patterns locally without the LLM")
+    classify_parser.add_argument("--local-model", action="store_true",
+                                 help="Answer queries the trained local model is confident about without the LLM")
+    classify_parser.add_argument("--retrieval", choices=["first", "embedding", "bm25"],
+                                 help="How guideline chunks are chosen for each prompt")
+    classify_parser.add_argument("--no-dedupe", action="store_true", help="Classify duplicate queries separately")
+    classify_parser.add_argument("--structured", action="store_true",
+                                 help="Enforce the classification JSON Schema with structured outputs")
+    classify_parser.add_argument("--compact-responses", action="store_true",
+                                 help="Have the model list only applicable labels (fewer output tokens)")
+    classify_parser.add_argument("--resume", action="store_true",
+                                 help="Skip queries already present in the JSONL checkpoint of --output")
+    classify_parser.add_argument("--no-compact", action="store_true",
+                                 help="Leave results in the JSONL checkpoint only")
+    
+    # Offline Batch API command
+    batch_parser = subparsers.add_parser("classify-batch", help="Classify queries through the OpenAI Batch API")
+    batch_parser.add_argument("--queries", type=Path, required=True, help="Path to queries CSV file")
+    batch_parser.add_argument("--guidelines", type=Path, required=True, help="Path to guidelines PDF file")
+    batch_parser.add_argument("--output", type=Path, required=True, help="Path to output JSON file")
+    batch_parser.add_argument("--max-queries", type=int, help="Maximum number of queries to process")
+    batch_parser.add_argument("--work-dir", type=Path,
+                              help="Directory for request files and resume state (default: under processed_dir)")
+    batch_parser.add_argument("--poll-interval", type=float, help="Seconds between batch status checks")
+    batch_parser.add_argument("--timeout", type=float, help="Stop polling after this many seconds (resume later)")
+    batch_parser.add_argument("--no-cache", action="store_true", help="Bypass the on-disk classification cache")
+    batch_parser.add_argument("--rules", action="store_true",
+                              help="Answer known sites, chains and QUICKFACT patterns locally without the LLM")
+    batch_parser.add_argument("--retrieval", choices=["first", "embedding", "bm25"],
+                              help="How guideline chunks are chosen for each prompt")
+    batch_parser.add_argument("--no-dedupe", action="store_true", help="Classify duplicate queries separately")
+    batch_parser.add_argument("--structured", action="store_true",
+                              help="Enforce the classification JSON Schema with structured outputs")
+    batch_parser.add_argument("--compact-responses", action="store_true",
+                              help="Have the model list only applicable labels (fewer output tokens)")
+    
+    # Local model commands
+    train_local_parser = subparsers.add_parser("train-local",
+                                               help="Train the local model on previously classified CSVs")
+    train_local_parser.add_argument("--data", type=Path, nargs="+",
+                                    help="Classified CSV files to learn from (default: every CSV in output_dir)")
+    train_local_parser.add_argument("--model", type=Path, help="Where to save the model (default: local_model.path)")
+    train_local_parser.add_argument("--precision", type=float,
+                                    help="Held-out precision the confidence threshold is calibrated to")
+    train_local_parser.add_argument("--epochs", type=int, help="Training passes over the data")
+    
+    classify_local_parser = subparsers.add_parser("classify-local",
+                                                  help="Classify queries with the local model only")
+    classify_local_parser.add_argument("--queries", type=Path, required=True, help="Path to queries CSV file")
+    classify_local_parser.add_argument("--output", type=Path, required=True, help="Path to output JSON file")
+    classify_local_parser.add_argument("--model", type=Path, help="Trained model file (default: local_model.path)")
+    classify_local_parser.add_argument("--threshold", type=float,
+                                       help="Override the calibrated confidence threshold")
+    classify_local_parser.add_argument("--max-queries", type=int, help="Maximum number of queries to process")
+    classify_local_parser.add_argument("--no-compact", action="store_true",
+                                       help="Leave results in the JSONL checkpoint only")
     
     # Validation command
     validate_parser = subparsers.add_parser("validate", help="Validate input data")
@@ -83,6 +179,56 @@ def create_parser():
     return parser
 
 
+def load_guidelines(guidelines_file, config):
+    """Load guideline chunks, reusing the parsed copy in processed_dir when enabled"""
+    cache_dir = config.processed_dir if config.guidelines_cache else None
+    if config.chunk_mode == "tokens":
+        chunker = TokenChunker.from_config(config)
+    elif config.chunk_mode == "words":
+        chunker = None
+    else:
+        raise ValueError(f"Unknown chunk mode: {config.chunk_mode}")
+    return load_guidelines_from_pdf(guidelines_file, config.chunk_size, config.chunk_overlap,
+                                    cache_dir=cache_dir, workers=config.pdf_workers, chunker=chunker)
+
+
+def stream_queries(args, config, logger, skip_indices=None):
+    """Lazily read, limit and filter queries from the CSV"""
+    queries = iter_queries_from_csv(args.queries, config.csv_chunk_size)
+    
+    # Limit queries if specified
+    if config.max_queries:
+        logger.info(f"Limited to {config.max_queries} queries for processing")
+        queries = itertools.islice(queries, config.max_queries)
+    
+    # Drop queries finished by a previous run
+    if skip_indices:
+        logger.info(f"Resuming: skipping {len(skip_indices)} queries already in the checkpoint")
+        queries = (query for query in queries if query.index not in skip_indices)
+    
+    return queries
+
+
+def prepare_queries(args, config, logger):
+    """Load, limit and deduplicate the queries to classify"""
+    logger.info(f"Loading queries from {args.queries}")
+    queries = load_queries_from_csv(args.queries, config.csv_chunk_size)
+    
+    # Limit queries if specified
+    if config.max_queries:
+        queries = queries[:config.max_queries]
+        logger.info(f"Limited to {len(queries)} queries for processing")
+    
+    # Collapse duplicate queries so each one is classified once
+    dedup = None
+    to_classify = queries
+    if config.dedupe_queries:
+        dedup = deduplicate_queries(queries, QueryNormalizer.from_config(config))
+        to_classify = dedup.unique_queries
+    
+    return queries, dedup, to_classify
+
+
 def run_classification(args, config, logger):
     """Run the classification pipeline"""
     
@@ -91,64 +237,449 @@ def run_classification(args, config, logger):
         config.max_queries = args.max_queries
     if args.batch_size:
         config.batch_size = args.batch_size
+    if args.batched:
+        config.batched_prompts = True
+    if args.concurrency:
+        config.concurrent_requests = args.concurrency
+    if args.adaptive:
+        config.adaptive_concurrency = True
+    if args.hedge:
+        config.hedge_requests = True
+    if args.cascade or args.cascade_threshold is not None:
+        config.cascade_enabled = True
+    if args.cascade_threshold is not None:
+        config.cascade_threshold = args.cascade_threshold
+    if args.no_cache:
+        config.cache_enabled = False
+    if args.semantic_cache or args.semantic_threshold is not None:
+        config.semantic_cache_enabled = True
+    if args.semantic_threshold is not None:
+        config.semantic_cache_threshold = args.semantic_threshold
+    if config.semantic_cache_enabled and not config.cache_enabled:
+        logger.warning("The semantic cache reads from the classification cache; it is off with --no-cache")
+    if args.rules:
+        config.rules_enabled = True
+    if args.local_model:
+        config.local_model_enabled = True
+    if args.retrieval:
+        config.guideline_retrieval = args.retrieval
+    if args.structured:
+        config.structured_outputs = True
+    if args.compact_responses:
+        config.compact_responses = True
+    if args.no_dedupe:
+        config.dedupe_queries = False
+    if args.no_compact:
+        config.compact_output = False
     
-    logger.info(f"Loading queries from {args.queries}")
-    queries = load_queries_from_csv(args.queries)
+    # Results stream into a JSONL checkpoint next to the output file
+    checkpoint = args.output if args.output.suffix == ".jsonl" else args.output.with_suffix(".jsonl")
+    completed = set()
+    if args.resume:
+        completed = load_completed_indices(checkpoint)
+    elif checkpoint.exists():
+        logger.warning(f"Overwriting existing checkpoint {checkpoint} (use --resume to continue it)")
+        checkpoint.unlink()
     
-    # Limit queries if specified
-    if config.max_queries:
-        queries = queries[:config.max_queries]
-        logger.info(f"Limited to {len(queries)} queries for processing")
+    # Queries that still fail after retries are listed here and retried by --resume
+    dead_letter_file = args.output.with_name(f"{args.output.stem}.dead_letter.jsonl")
+    if dead_letter_file.exists():
+        dead_letter_file.unlink()
+    dead_letter = DeadLetterWriter(dead_letter_file)
     
     logger.info(f"Loading guidelines from {args.guidelines}")
-    guidelines = load_guidelines_from_pdf(args.guidelines, config.chunk_size, config.chunk_overlap)
+    guidelines = load_guidelines(args.guidelines, config)
     
     # Initialize classifier
     logger.info("Initializing classifier")
-    classifier = QueryClassifier(config)
+    cache = ClassificationCache.from_config(config) if config.cache_enabled else None
+    rules = RulesClassifier.from_config(config) if config.rules_enabled else None
+    local_model = LocalModel.load(config.local_model_path) if config.local_model_enabled else None
+    classifier = QueryClassifier(config, cache=cache, dead_letter=dead_letter, rules=rules, local_model=local_model)
+    classifier.retriever = create_retriever(config, classifier.client, guidelines,
+                                            classifier.rate_limiter, classifier.retry_policy)
+    runner = ConcurrentClassifier(
+        classifier,
+        max_workers=config.concurrent_requests,
+        batch_size=config.batch_size if config.batched_prompts else 1,
+        controller=AdaptiveConcurrency.from_config(config) if config.adaptive_concurrency else None
+    )
+    
+    # Queries stream from the CSV straight into the workers; duplicates are
+    # collapsed on the fly so each unique query is classified once
+    read_count = 0
+    
+    def counted(queries):
+        nonlocal read_count
+        for query in queries:
+            read_count += 1
+            yield query
+    
+    queries = counted(stream_queries(args, config, logger, skip_indices=completed))
+    dedup = None
+    to_classify = queries
+    if config.dedupe_queries:
+        dedup = StreamingDeduplicator(QueryNormalizer.from_config(config), dead_letter=dead_letter)
+        to_classify = dedup.unique(queries)
     
     # Process queries
-    logger.info(f"Starting classification of {len(queries)} queries")
-    results = []
+    if config.adaptive_concurrency:
+        logger.info(f"Starting classification (adaptive concurrency, starting at {runner.concurrency})")
+    else:
+        logger.info(f"Starting classification ({config.concurrent_requests} concurrent requests)")
     
+    written = 0
+    latency_total = 0.0
     start_time = time.time()
-    
-    for i, query in enumerate(queries):
-        logger.info(f"Processing query {i+1}/{len(queries)}: '{query.text}'")
-        
-        try:
-            query_start = time.time()
-            
-            # Classify the query
-            result = classifier.classify_query(query, guidelines)
-            result.processing_time = time.time() - query_start
-            
-            results.append(result)
-            
-            logger.info(f"✓ Classified as: {result.prime_category.get('category', 'Unknown')} "
-                       f"(confidence: {result.confidence_score:.2f}, time: {result.processing_time:.2f}s)")
-            
-            # Add delay to respect rate limits
-            time.sleep(60 / config.requests_per_minute)
+    try:
+        with JsonlResultWriter(checkpoint, config.checkpoint_fsync_every, config.checkpoint_fsync_interval) as writer:
+            for done, (position, query, result) in enumerate(runner.iter_completed(to_classify, guidelines), 1):
+                if result is not None:
+                    logger.info(f"✓ [{done}/{read_count} read, {runner.concurrency} in flight] '{query.text}' "
+                                f"classified as: {result.prime_category} "
+                                f"(confidence: {result.confidence_score:.2f}, time: {result.processing_time:.2f}s)")
+                    latency_total += result.processing_time
+                
+                offset = None
+                if result is not None:
+                    offset = writer.write(result)
+                    written += 1
+                if dedup is not None:
+                    # Late duplicates are fanned out from the checkpoint, so finished results are not kept in memory
+                    for fanned_result in dedup.complete(result, query, offset) + dedup.drain_late(writer.read):
+                        writer.write(fanned_result)
+                        written += 1
             
-        except Exception as e:
-            logger.error(f"✗ Failed to classify query '{query.text}': {e}")
-            continue
+            if dedup is not None:
+                for fanned_result in dedup.drain_late(writer.read):
+                    writer.write(fanned_result)
+                    written += 1
+    finally:
+        dead_letter.close()
+        classifier.close()
+        if cache is not None:
+            cache.close()
     
     total_time = time.time() - start_time
     
     # Save results
-    logger.info(f"Saving results to {args.output}")
-    save_results(results, args.output)
+    if config.compact_output and checkpoint != args.output:
+        logger.info(f"Compacting {checkpoint} into {args.output}")
+        compact_jsonl_results(checkpoint, args.output)
     
     # Print summary
     logger.info("=" * 50)
     logger.info("CLASSIFICATION SUMMARY")
     logger.info("=" * 50)
+    logger.info(f"Total queries processed: {written}")
+    logger.info(f"Total time: {total_time:.2f} seconds")
+    if written:
+        logger.info(f"Average time per query: {total_time/written:.2f} seconds")
+    if runner.stats.completed:
+        logger.info(f"Average API latency: {latency_total/runner.stats.completed:.2f} seconds")
+    if read_count:
+        logger.info(f"Success rate: {written/read_count*100:.1f}%")
+    logger.info(f"Throughput: {runner.stats.queries_per_minute:.1f} queries/min "
+                f"({runner.stats.queries_per_second:.2f} queries/s)")
+    if runner.controller is not None:
+        controller = runner.controller
+        logger.info(f"Adaptive concurrency: final {controller.limit}, peak {controller.peak} "
+                    f"({controller.increases} increases, {controller.decreases} decreases)")
+    retries = classifier.retry_policy.stats
+    logger.info(f"Retries: {retries.retries} retries ({retries.backoff_seconds:.1f}s backoff), "
+                f"{retries.recovered} calls recovered, {retries.exhausted} gave up, "
+                f"{retries.permanent} permanent errors")
+    if dead_letter.written:
+        logger.warning(f"{dead_letter.written} queries failed and were written to {dead_letter_file}; "
+                       f"run again with --resume to retry them")
+    if classifier.hedger is not None:
+        hedging = classifier.hedger.stats
+        p50, p95, p99 = hedging.latency_percentiles(hedged=True)
+        u50, u95, u99 = hedging.latency_percentiles(hedged=False)
+        logger.info(f"Hedging: {hedging.hedges} of {hedging.requests} calls hedged, "
+                    f"{hedging.hedge_wins} won by the duplicate")
+        logger.info(f"Call latency p50/p95/p99: {p50:.2f}/{p95:.2f}/{p99:.2f}s hedged vs "
+                    f"{u50:.2f}/{u95:.2f}/{u99:.2f}s for the first request alone")
+    if len(classifier.tiers) > 1:
+        log_cascade_summary(classifier, config, logger)
+    pool = classifier.http_pool.stats
+    logger.info(f"HTTP pool: {pool.requests} requests over {pool.connections_opened} connections "
+                f"({pool.reuse_rate:.1%} reused, {pool.tls_handshakes} TLS handshakes, "
+                f"{pool.http2_requests} over HTTP/2)")
+    limiter = classifier.rate_limiter
+    logger.info(f"Rate limiter: {limiter.total_wait:.1f}s waiting, "
+                f"{limiter.estimated_tokens} tokens reserved, {limiter.actual_tokens} tokens used")
+    usage = classifier.usage
+    logger.info(f"API usage: {usage.calls} calls, {usage.prompt_tokens} prompt tokens, "
+                f"{usage.completion_tokens} completion tokens")
+    logger.info(f"Prompt cache: {usage.cached_prompt_tokens} cached prompt tokens "
+                f"({usage.cached_prompt_ratio:.1%} of prompt tokens)")
+    if usage.compact_queries:
+        saved_tokens = usage.verbose_completion_tokens_per_query - usage.completion_tokens_per_query
+        saved_ms = saved_tokens * usage.seconds_per_completion_token * 1000
+        logger.info(f"Compact responses: {usage.completion_tokens_per_query:.0f} completion tokens/query vs "
+                    f"~{usage.verbose_completion_tokens_per_query:.0f} in verbose format "
+                    f"({saved_tokens:.0f} fewer, ~{saved_ms:.0f} ms/query less generation time)")
+    if usage.batched_queries:
+        saved = usage.single_prompt_tokens_per_query - usage.batch_prompt_tokens_per_query
+        logger.info(f"Batched prompts: {usage.batch_prompt_tokens_per_query:.0f} prompt tokens/query vs "
+                    f"~{usage.single_prompt_tokens_per_query:.0f} in single-query mode "
+                    f"({saved:.0f} saved per query, {usage.requeued} re-queued)")
+    if dedup is not None:
+        logger.info(f"Deduplication: {dedup.unique_count} unique of {dedup.total_queries} queries, "
+                    f"{dedup.duplicates} API calls saved")
+    if rules is not None:
+        log_rules_summary(rules, logger)
+    if local_model is not None:
+        log_local_model_summary(local_model, logger)
+    if cache is not None:
+        logger.info(f"Cache: {cache.stats.hits} hits, {cache.stats.misses} misses "
+                    f"({cache.stats.hit_rate*100:.1f}% hit rate), {cache.stats.evictions} evicted")
+    if classifier.semantic_cache is not None:
+        audit_file = args.output.with_name(f"{args.output.stem}.semantic_audit.jsonl")
+        log_semantic_cache_summary(classifier.semantic_cache, audit_file, logger)
+    logger.info(f"Checkpoint: {checkpoint}")
+    if config.compact_output or checkpoint == args.output:
+        logger.info(f"Results saved to: {args.output}")
+
+
+def log_rules_summary(rules: RulesClassifier, logger):
+    """Log how much traffic the rules fast path answered"""
+    stats = rules.stats
+    by_rule = ", ".join(f"{rule} {count}" for rule, count in sorted(stats.by_rule.items()))
+    logger.info(f"Rules fast path: {stats.matched} of {stats.checked} queries answered locally "
+                f"({stats.hit_rate:.1%}, {stats.microseconds_per_query:.0f} µs/query)"
+                + (f" - {by_rule}" if by_rule else ""))
+
+
+def log_semantic_cache_summary(semantic_cache: SemanticCache, audit_file: Path, logger):
+    """Log near-duplicate reuse and write the sampled reuse audits"""
+    stats = semantic_cache.stats
+    logger.info(f"Semantic cache: {stats.hits} of {stats.lookups} exact misses reused a near-duplicate "
+                f"({stats.hit_rate:.1%}, mean similarity {stats.mean_similarity:.3f} >= {semantic_cache.threshold}, "
+                f"{stats.microseconds_per_lookup:.0f} µs/lookup, {stats.stale} stale)")
+    if not stats.audits:
+        return
+    with open(audit_file, "w", encoding="utf-8") as f:
+        for audit in stats.audits:
+            f.write(json.dumps(dict(dataclasses.asdict(audit), agrees=audit.agrees), ensure_ascii=False) + "\n")
+    logger.info(f"Semantic cache audit: {stats.false_reuse} of {len(stats.audits)} sampled hits would have "
+                f"reused a different PRIME category ({stats.false_reuse_rate:.1%}); details in {audit_file}")
+
+
+def log_cascade_summary(classifier: QueryClassifier, config, logger):
+    """Log per-tier hit rate, latency and cost, and the cost of sending everything to the last tier"""
+    total_cost = 0.0
+    for tier in classifier.tiers:
+        cost = tier.cost(config.model_prices)
+        if cost is not None:
+            total_cost += cost
+        logger.info(f"Cascade tier {tier.model}: {tier.accepted} of {tier.queries} queries answered "
+                    f"({tier.hit_rate:.1%}), {tier.escalated_low_confidence} low confidence, "
+                    f"{tier.escalated_invalid} invalid category, {tier.escalated_error} errors escalated, "
+                    f"{tier.failed} failed; {tier.mean_latency:.2f}s/call, "
+                    + (f"${cost:.4f}" if cost is not None else "no price configured"))
+    # Every query reaches the first tier, so its tokens at the last tier's prices approximate a single-model run
+    first, last = classifier.tiers[0], classifier.tiers[-1]
+    baseline = dataclasses.replace(first, model=last.model).cost(config.model_prices)
+    if baseline:
+        logger.info(f"Cascade cost: ${total_cost:.4f} vs ~${baseline:.4f} with {last.model} alone "
+                    f"({1 - total_cost / baseline:.1%} saved)")
+
+
+def log_local_model_summary(model: LocalModel, logger):
+    """Log how much traffic the local model answered"""
+    stats = model.stats
+    logger.info(f"Local model: {stats.confident} of {stats.checked} queries answered locally "
+                f"({stats.coverage:.1%} at confidence >= {model.threshold:.2f}, "
+                f"{stats.queries_per_second * 3600:,.0f} queries/hour)")
+
+
+def train_local_model(args, config, logger):
+    """Fit the local model on previously classified CSV exports and save it"""
+    data_files = args.data or sorted(config.output_dir.glob("*.csv"))
+    model_path = args.model or config.local_model_path
+    precision = args.precision or config.local_model_precision
+    epochs = args.epochs or config.local_model_epochs
+    
+    # Later files do not override labels already seen for the same query
+    normalizer = QueryNormalizer.from_config(config)
+    records = {}
+    for data_file in data_files:
+        rows = list(iter_labelled_rows(data_file))
+        if not rows:
+            logger.warning(f"No labelled rows in {data_file}; skipping")
+            continue
+        logger.info(f"Loaded {len(rows)} labelled rows from {data_file}")
+        for row in rows:
+            records.setdefault(normalizer.normalize(row["query"]), row)
+    if not records:
+        raise ValueError("No labelled rows to train on")
+    
+    logger.info(f"Training on {len(records)} unique queries ({epochs} epochs, "
+                f"{config.local_model_features} hashed features)")
+    start_time = time.time()
+    model = LocalModel.train(list(records.values()), HashedNgramVectorizer(config.local_model_features),
+                             epochs=epochs, precision=precision)
+    model.save(model_path)
+    
+    metrics = model.metrics
+    logger.info("=" * 50)
+    logger.info("LOCAL MODEL SUMMARY")
+    logger.info("=" * 50)
+    logger.info(f"Training time: {time.time() - start_time:.1f} seconds")
+    logger.info(f"Held-out PRIME accuracy: {metrics['holdout_accuracy']:.1%} "
+                f"on {metrics['holdout_rows']:.0f} queries")
+    logger.info(f"Confidence threshold: {model.threshold:.3f} (target precision {precision:.0%}) -> "
+                f"{metrics['holdout_coverage']:.1%} of held-out queries answered locally "
+                f"at {metrics['holdout_precision']:.1%} precision")
+    logger.info(f"Held-out intent F1: {metrics['intent_f1']:.2f}, topic F1: {metrics['topic_f1']:.2f}")
+    logger.info(f"Model saved to: {model_path}")
+
+
+def run_local_classification(args, config, logger):
+    """Classify queries with the local model; unconfident ones are listed for the LLM"""
+    if args.max_queries:
+        config.max_queries = args.max_queries
+    
+    model = LocalModel.load(args.model or config.local_model_path)
+    if args.threshold is not None:
+        model.threshold = args.threshold
+    logger.info(f"Loaded local model (confidence threshold {model.threshold:.3f})")
+    
+    checkpoint = args.output if args.output.suffix == ".jsonl" else args.output.with_suffix(".jsonl")
+    if checkpoint.exists():
+        checkpoint.unlink()
+    # Queries the model is unsure about, ready for `classify --queries`; their original indices are kept
+    fallthrough_file = args.output.with_name(f"{args.output.stem}.llm_queries.csv")
+    
+    queries = stream_queries(args, config, logger)
+    read_count = 0
+    written = 0
+    start_time = time.time()
+    # Results arrive by the thousand, so sync per chunk rather than every few results
+    with JsonlResultWriter(checkpoint, config.csv_chunk_size, config.checkpoint_fsync_interval) as writer, \
+            open(fallthrough_file, "w", newline="", encoding="utf-8") as fallthrough:
+        fallthrough_writer = csv.writer(fallthrough)
+        fallthrough_writer.writerow(["index", "query"])
+        while True:
+            chunk = list(itertools.islice(queries, config.csv_chunk_size))
+            if not chunk:
+                break
+            read_count += len(chunk)
+            for query, data in zip(chunk, model.classify_batch([query.text for query in chunk])):
+                if data is None:
+                    fallthrough_writer.writerow([query.index, query.text])
+                    continue
+                writer.write(QueryClassifier.build_result(query, data))
+                written += 1
+            logger.info(f"{read_count} queries read, {written} classified locally")
+    total_time = time.time() - start_time
+    
+    if not args.no_compact and checkpoint != args.output:
+        compact_jsonl_results(checkpoint, args.output)
+    
+    logger.info("=" * 50)
+    logger.info("LOCAL CLASSIFICATION SUMMARY")
+    logger.info("=" * 50)
+    logger.info(f"Total queries read: {read_count}")
+    logger.info(f"Classified locally: {written} ({written / max(read_count, 1):.1%})")
+    logger.info(f"Total time: {total_time:.2f} seconds ({read_count / max(total_time, 1e-9) * 3600:,.0f} queries/hour)")
+    log_local_model_summary(model, logger)
+    logger.info(f"Left for the LLM: {read_count - written} queries in {fallthrough_file}")
+    logger.info(f"Results saved to: {args.output if not args.no_compact else checkpoint}")
+
+
+def run_batch_classification(args, config, logger):
+    """Run classification as offline Batch API jobs, resuming any previous run"""
+    
+    # Override config with command line args
+    if args.max_queries:
+        config.max_queries = args.max_queries
+    if args.poll_interval:
+        config.batch_api_poll_interval = args.poll_interval
+    if args.no_cache:
+        config.cache_enabled = False
+    if args.rules:
+        config.rules_enabled = True
+    if args.retrieval:
+        config.guideline_retrieval = args.retrieval
+    if args.structured:
+        config.structured_outputs = True
+    if args.compact_responses:
+        config.compact_responses = True
+    if args.no_dedupe:
+        config.dedupe_queries = False
+    
+    queries, dedup, to_classify = prepare_queries(args, config, logger)
+    
+    # Failed requests and unparseable responses are listed here instead of getting a default result
+    dead_letter_file = args.output.with_name(f"{args.output.stem}.dead_letter.jsonl")
+    if dead_letter_file.exists():
+        dead_letter_file.unlink()
+    dead_letter = DeadLetterWriter(dead_letter_file)
+    
+    logger.info(f"Loading guidelines from {args.guidelines}")
+    guidelines = load_guidelines(args.guidelines, config)
+    
+    cache = ClassificationCache.from_config(config) if config.cache_enabled else None
+    rules = RulesClassifier.from_config(config) if config.rules_enabled else None
+    classifier = QueryClassifier(config, cache=cache, dead_letter=dead_letter, rules=rules)
+    classifier.retriever = create_retriever(config, classifier.client, guidelines,
+                                            classifier.rate_limiter, classifier.retry_policy)
+    work_dir = args.work_dir or config.processed_dir / "batch_jobs" / args.output.stem
+    runner = BatchJobRunner(
+        classifier,
+        work_dir,
+        max_requests_per_job=config.batch_api_max_requests,
+        poll_interval=config.batch_api_poll_interval,
+        dead_letter=dead_letter
+    )
+    
+    start_time = time.time()
+    try:
+        # Rule-matched and cached queries never need to go into a batch
+        results = []
+        uncached = []
+        for query in to_classify:
+            cached = classifier.get_cached_result(query, guidelines)
+            if cached is not None:
+                results.append(cached)
+            else:
+                uncached.append(query)
+        logger.info(f"{len(results)} queries served locally (rules/cache), {len(uncached)} sent to the Batch API")
+        
+        if uncached:
+            results.extend(runner.run(uncached, guidelines, timeout=args.timeout))
+        if dedup is not None:
+            dead_letter_failed_duplicates(results, dedup, dead_letter)
+    finally:
+        dead_letter.close()
+        classifier.close()
+        if cache is not None:
+            cache.close()
+    
+    results.sort(key=lambda r: r.query.index)
+    if dedup is not None:
+        results = fan_out_results(results, dedup)
+    
+    total_time = time.time() - start_time
+    
+    logger.info(f"Saving results to {args.output}")
+    save_results(results, args.output)
+    
+    logger.info("=" * 50)
+    logger.info("BATCH CLASSIFICATION SUMMARY")
+    logger.info("=" * 50)
     logger.info(f"Total queries processed: {len(results)}")
     logger.info(f"Total time: {total_time:.2f} seconds")
-    logger.info(f"Average time per query: {total_time/len(results):.2f} seconds")
-    logger.info(f"Success rate: {len(results)/len(queries)*100:.1f}%")
+    if queries:
+        logger.info(f"Success rate: {len(results)/len(queries)*100:.1f}%")
+    if dead_letter.written:
+        logger.warning(f"{dead_letter.written} queries failed and were written to {dead_letter_file}")
+    if rules is not None:
+        log_rules_summary(rules, logger)
+    logger.info(f"Batch state: {runner.state_file}")
     logger.info(f"Results saved to: {args.output}")
 
 
@@ -170,8 +701,7 @@ def validate_data(args, config, logger):
         logger.info(f"  Average word count: {avg_words:.1f} words")
         
         # Check for duplicates
-        unique_queries = set(q.text.lower() for q in queries)
-        duplicates = len(queries) - len(unique_queries)
+        duplicates = deduplicate_queries(queries, QueryNormalizer.from_config(config)).duplicates
         if duplicates > 0:
             logger.warning(f"  Found {duplicates} duplicate queries")
         
@@ -182,7 +712,7 @@ def validate_data(args, config, logger):
     # Validate guidelines if provided
     if args.guidelines:
         try:
-            guidelines = load_guidelines_from_pdf(args.guidelines)
+            guidelines = load_guidelines(args.guidelines, config)
             logger.info(f"✓ Guidelines file valid: {guidelines['chunk_count']} chunks created")
             logger.info(f"  Total text length: {guidelines['total_text_length']} characters")
         except Exception as e:
@@ -10,25 +10,181 @@ from qcl.data.prime_categories_mapping import (
     TOPIC_SCHEMA
 )
 
+import hashlib
 import logging
 import json  
 import time
 import re
+import threading
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from openai import OpenAI
 
+from ..core.hedging import RequestHedger
+from ..core.http import HttpClientPool
+from ..core.rate_limit import RateLimiter
+from ..core.retry import RetryPolicy, RetryError, ResponseParseError, was_rejected
+from .compact import COMPACT_INSTRUCTIONS, is_compact, expand_compact_classification
+from .response_schema import classification_response_format, batch_response_format
+from .semantic_cache import SemanticCache, SemanticHit
+from ..data.cache import ClassificationCache, cache_key
 from ..data.models import Query, ClassificationResult
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on completion tokens for a single batched request
+MAX_BATCH_COMPLETION_TOKENS = 32768
+
+# Stands in for the template's placeholders so the instructions stay identical
+# for every query; the real values are appended after them
+DEFERRED_PLACEHOLDER = "(given at the end of this prompt)"
+
+CONTEXT_SECTION = """GUIDELINES CONTEXT:
+{guidelines_context}"""
+
+QUERY_SECTION = 'QUERY TO CLASSIFY: "{query_text}"'
+
+BATCH_INSTRUCTIONS = """BATCH MODE: Classify EACH of the following queries independently, following all of the instructions above.
+
+Queries to classify (index: query):
+{query_list}
+
+Respond with a JSON array containing exactly one object per query. Each object must use the response format specified above and add an "index" field holding the query's index from the list. Respond ONLY with the JSON array - no other text."""
+
+
+@dataclass
+class UsageStats:
+    """Token usage across all API calls made by a classifier"""
+    calls: int = 0
+    queries: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    batched_queries: int = 0
+    batched_prompt_tokens: int = 0
+    single_prompt_tokens_estimate: int = 0
+    requeued: int = 0
+    cached_prompt_tokens: int = 0
+    api_seconds: float = 0.0
+    compact_queries: int = 0
+    verbose_completion_tokens_estimate: int = 0
+
+    @property
+    def cached_prompt_ratio(self) -> float:
+        """Share of prompt tokens served from the provider's prompt cache"""
+        return self.cached_prompt_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    @property
+    def completion_tokens_per_query(self) -> float:
+        return self.completion_tokens / self.queries if self.queries else 0.0
+
+    @property
+    def verbose_completion_tokens_per_query(self) -> float:
+        """Estimated completion tokens per query had the verbose format been used"""
+        return self.verbose_completion_tokens_estimate / self.compact_queries if self.compact_queries else 0.0
+
+    @property
+    def seconds_per_completion_token(self) -> float:
+        """Observed API time per completion token (an upper bound on decode time)"""
+        return self.api_seconds / self.completion_tokens if self.completion_tokens else 0.0
+
+    @property
+    def batch_prompt_tokens_per_query(self) -> float:
+        return self.batched_prompt_tokens / self.batched_queries if self.batched_queries else 0.0
+
+    @property
+    def single_prompt_tokens_per_query(self) -> float:
+        return self.single_prompt_tokens_estimate / self.batched_queries if self.batched_queries else 0.0
+
+
+@dataclass
+class TierStats:
+    """Outcome of one model tier (a cascade has several, cheapest first)"""
+    model: str
+    queries: int = 0
+    accepted: int = 0
+    failed: int = 0
+    escalated_low_confidence: int = 0
+    escalated_invalid: int = 0
+    escalated_error: int = 0
+    calls: int = 0
+    seconds: float = 0.0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def escalated(self) -> int:
+        return self.escalated_low_confidence + self.escalated_invalid + self.escalated_error
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of the queries reaching this tier that were answered here"""
+        return self.accepted / self.queries if self.queries else 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        return self.seconds / self.calls if self.calls else 0.0
+
+    def cost(self, prices: Dict[str, Dict[str, float]]) -> Optional[float]:
+        """USD spent on this tier from per-million-token prices, None if the model is not priced"""
+        price = prices.get(self.model)
+        if price is None:
+            return None
+        uncached = self.prompt_tokens - self.cached_prompt_tokens
+        return (uncached * price["input"]
+                + self.cached_prompt_tokens * price.get("cached_input", price["input"])
+                + self.completion_tokens * price["output"]) / 1e6
+
+
 class QueryClassifier:
     """Simple GPT-4.1 based query classifier"""
 
-    def __init__(self, config):
+    def __init__(self, config, cache: Optional[ClassificationCache] = None, retriever=None, dead_letter=None,
+                 rules=None, local_model=None):
         self.config = config
-        self.client = OpenAI(api_key=config.openai_api_key)
+        # One pooled keep-alive HTTP client shared by all worker threads
+        self.http_pool = HttpClientPool.from_config(config)
+        self.client = OpenAI(api_key=config.openai_api_key, base_url=config.openai_base_url,
+                             http_client=self.http_pool.client, timeout=self.http_pool.timeout)
+        # Chat calls are retried by RetryPolicy, so the SDK's own retries are off for them
+        self.chat_client = self.client.with_options(max_retries=0)
+        self.rate_limiter = RateLimiter.from_config(config)
+        self.retry_policy = RetryPolicy.from_config(config)
+        # Races a duplicate against calls slower than recent latencies (optional)
+        self.hedger = RequestHedger.from_config(config) if config.hedge_requests else None
+        self.cache = cache
+        # Reuses the cached answer of a near-duplicate query on an exact miss (optional, needs the cache)
+        self.semantic_cache = (SemanticCache.from_config(config, cache, self.client, self.rate_limiter, self.retry_policy)
+                               if config.semantic_cache_enabled and cache is not None else None)
+        # Optional RulesClassifier that answers unambiguous queries without the API
+        self.rules = rules
+        # Optional LocalModel used where it is confident
+        self.local_model = local_model
+        # Optional sink (DeadLetterWriter) for queries that fail for good
+        self.dead_letter = dead_letter
+        # Optional guideline retriever; set after the guidelines are indexed
+        self.retriever = retriever
+        self.usage = UsageStats()
+        # Model tiers tried in order; a cascade puts the cheaper model first
+        models = [config.cascade_model, config.openai_model] if config.cascade_enabled else [config.openai_model]
+        self.tiers = [TierStats(model) for model in models]
+        self._tier_by_model = {tier.model: tier for tier in self.tiers}
+        self._usage_lock = threading.Lock()
         self.classification_prompt = self._load_classification_prompt()
+        self.static_prompt = self._build_static_prompt()
+        # JSON Schema response formats when structured outputs are enabled
+        compact = config.compact_responses
+        self.response_format = classification_response_format(compact) if config.structured_outputs else None
+        self.batch_response_format = batch_response_format(compact) if config.structured_outputs else None
+    
+    def close(self):
+        """Close the pooled HTTP connections"""
+        if self.hedger is not None:
+            self.hedger.close()
+        if self.semantic_cache is not None:
+            self.semantic_cache.close()
+        self.http_pool.close()
     
     def _load_classification_prompt(self) -> str:
         """Load the classification prompt template"""
@@ -221,149 +377,576 @@ CRITICAL REQUIREMENTS:
 4. PRIME category must be one of the 114 official categories
 5. Respond ONLY with valid JSON - no other text"""
     
-    def classify_query(self, query: Query, guidelines: Dict[str, Any]) -> ClassificationResult:
-        """Classify a single query"""
+    def _build_static_prompt(self) -> str:
+        """The template's instructions and schemas with the per-query parts deferred
+        
+        Every request starts with this same text, so the provider can serve
+        it from its prompt cache; context and queries follow it.
+        """
+        prompt = self.classification_prompt.format(
+            query_text=DEFERRED_PLACEHOLDER,
+            guidelines_context=DEFERRED_PLACEHOLDER
+        ).strip()
+        if self.config.compact_responses:
+            prompt += "\n\n" + COMPACT_INSTRUCTIONS
+        return prompt
+    
+    def _assemble_prompt(self, guidelines_context: str, query_section: str) -> str:
+        """Static prefix first, then guideline context, then the variable query part"""
+        return "\n\n".join([
+            self.static_prompt,
+            CONTEXT_SECTION.format(guidelines_context=guidelines_context),
+            query_section
+        ])
+    
+    def _build_prompt(self, query_text: str, guidelines_context: str) -> str:
+        return self._assemble_prompt(guidelines_context, QUERY_SECTION.format(query_text=query_text))
+    
+    def _get_guidelines_context(self, guidelines: Dict[str, Any], queries: List[Query]) -> Tuple[str, bool]:
+        """Select the guideline text sent with a prompt for the given queries
+        
+        Returns the text and whether it is a fallback: the leading chunks
+        used because retrieval failed.
+        """
+        if self.retriever is not None:
+            try:
+                return self.retriever.context_for([query.text for query in queries]), False
+            except Exception as e:
+                logger.warning(f"Guideline retrieval failed, using leading chunks: {e}")
+        
+        # Simple approach - use first few chunks
+        return "\n\n".join(guidelines["chunks"][:3]), self.retriever is not None  # Use first 3 chunks
+    
+    def _get_guidelines_contexts(self, guidelines: Dict[str, Any], queries: List[Query]) -> Tuple[List[str], bool]:
+        """Select the guideline text for each query's own prompt, retrieving for all of them at once"""
+        if self.retriever is not None:
+            try:
+                return self.retriever.contexts_for_each([query.text for query in queries]), False
+            except Exception as e:
+                logger.warning(f"Guideline retrieval failed, using leading chunks: {e}")
+        return ["\n\n".join(guidelines["chunks"][:3])] * len(queries), self.retriever is not None
+    
+    def _get_context_fingerprint(self, guidelines: Dict[str, Any], fallback: bool = False) -> str:
+        """Stand-in for the guidelines context in cache keys
+        
+        With a retriever the context is a deterministic function of the
+        query and the index, so cache lookups need no retrieval call. An
+        answer built from the leading chunks after retrieval failed
+        (`fallback`) is keyed by those chunks instead.
+        """
+        if self.retriever is not None and not fallback:
+            return self.retriever.cache_token
+        return "\n\n".join(guidelines["chunks"][:3])
+    
+    def _cache_model(self) -> str:
+        """Model in cache keys; a cascade is keyed by its whole tier chain"""
+        if len(self.tiers) > 1:
+            return " > ".join(tier.model for tier in self.tiers) + f" @{self.config.cascade_threshold}"
+        return self.config.openai_model
+    
+    def _get_cache_key(self, query: Query, guidelines: Dict[str, Any], fallback: bool = False) -> str:
+        return cache_key(query.text, self.static_prompt + QUERY_SECTION,
+                         self._get_context_fingerprint(guidelines, fallback),
+                         self._cache_model(), self.config.temperature)
+    
+    def _get_cache_namespace(self, guidelines: Dict[str, Any], fallback: bool = False) -> str:
+        """Key of the prompt/model settings alone; near-duplicates are only reused within one namespace"""
+        return cache_key("", self.static_prompt + QUERY_SECTION, self._get_context_fingerprint(guidelines, fallback),
+                         self._cache_model(), self.config.temperature)
+    
+    def _semantic_lookup(self, query: Query, guidelines: Dict[str, Any]) -> Optional[SemanticHit]:
+        if self.semantic_cache is None:
+            return None
+        return self.semantic_cache.lookup(query.text, self._get_cache_namespace(guidelines))
+    
+    def _record_semantic_audit(self, query: Query, hit: SemanticHit, result: ClassificationResult):
+        """Compare a near-duplicate's reused answer with the query's own classification"""
+        cached_category = self.build_result(query, hit.data).prime_category
+        self.semantic_cache.record_audit(query.text, hit, cached_category, result.prime_category)
+    
+    def _store(self, query: Query, guidelines: Dict[str, Any], key: str, classification_data: Dict[str, Any],
+               fallback: bool = False):
+        """Cache a fresh answer, and index its query for near-duplicate reuse
+        
+        An answer whose prompt fell back to the leading chunks is stored
+        under their key, so runs where retrieval works never reuse it.
+        """
+        if self.cache is None:
+            return
+        if fallback:
+            key = self._get_cache_key(query, guidelines, fallback=True)
+        self.cache.put(key, classification_data, query.text)
+        if self.semantic_cache is not None:
+            self.semantic_cache.add(query.text, key, self._get_cache_namespace(guidelines, fallback))
+    
+    def _build_messages(self, prompt: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": "You are an expert query classification analyst. Respond only with valid JSON."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def classify_query(self, query: Query, guidelines: Dict[str, Any]) -> Optional[ClassificationResult]:
+        """Classify a single query
+        
+        Transient failures (throttling, timeouts, 5xx, unparseable output)
+        are retried with backoff. A query that still fails is written to the
+        dead-letter sink and None is returned instead of a default result.
+        """
+        
+        local = self._local_result(query)
+        if local is not None:
+            return local
         
-        # Get relevant guideline context (simple approach - use first few chunks)
-        guidelines_context = "\n\n".join(guidelines["chunks"][:3])  # Use first 3 chunks
+        key = None
+        audit = None
+        if self.cache is not None:
+            key = self._get_cache_key(query, guidelines)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return self.build_result(query, cached)
+            hit = self._semantic_lookup(query, guidelines)
+            if hit is not None:
+                if not self.semantic_cache.should_audit():
+                    return self.build_result(query, hit.reused_data())
+                audit = hit
+        
+        result = self._classify_uncached(query, guidelines, key)
+        if audit is not None and result is not None:
+            self._record_semantic_audit(query, audit, result)
+        return result
+    
+    def _classify_uncached(self, query: Query, guidelines: Dict[str, Any], key: Optional[str] = None,
+                           first_tier: int = 0) -> Optional[ClassificationResult]:
+        """Call the API for one query, escalating through the model tiers from `first_tier`"""
+        
+        # Get relevant guideline context
+        guidelines_context, fallback = self._get_guidelines_context(guidelines, [query])
         
         # Build the prompt
-        prompt = self.classification_prompt.format(
-            query_text=query.text,
-            guidelines_context=guidelines_context
-        )
+        prompt = self._build_prompt(query.text, guidelines_context)
         
-        # Call OpenAI API
-        try:
-            response = self.client.chat.completions.create(
-                model=self.config.openai_model,
-                messages=[
-                    {"role": "system", "content": "You are an expert query classification analyst. Respond only with valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=self.config.max_tokens,
-                temperature=self.config.temperature
-            )
-            
-            # Parse the response using the enhanced parser
-            response_text = response.choices[0].message.content.strip()
-            classification_data = self._parse_llm_response(response_text)
+        messages = self._build_messages(prompt)
+        
+        for tier_number in range(first_tier, len(self.tiers)):
+            tier = self.tiers[tier_number]
+            final = tier_number == len(self.tiers) - 1
             
-            # Ensure prime_category is a string (not a dict)
-            if isinstance(classification_data.get("prime_category"), dict):
-                prime_cat = classification_data["prime_category"]
-                if "category" in prime_cat:
-                    classification_data["prime_category"] = prime_cat["category"]
-                else:
-                    classification_data["prime_category"] = "OTHER_None_of_These"
+            def attempt(model: str = tier.model) -> Dict[str, Any]:
+                response_text = self._call_api(messages, response_format=self.response_format, model=model)
+                classification_data = self._parse_response(response_text)
+                if classification_data is None:
+                    raise ResponseParseError(f"Failed to parse LLM response: {response_text[:200]}...")
+                return classification_data
             
-            # Create the result
-            result = ClassificationResult(
-                query=query,
-                annotation_schema=classification_data.get("annotation_schema", {}),
-                entity_schema=classification_data.get("entity_schema", {}),
-                intent_schema=classification_data.get("intent_schema", {}),
-                topic_schema=classification_data.get("topic_schema", {}),
-                prime_category=classification_data.get("prime_category", "OTHER_None_of_These"),
-                research_notes=classification_data.get("research_notes", ""),
-                confidence_score=classification_data.get("confidence_score", 0.5)
-            )
+            # Call OpenAI API
+            description = f"Classifying '{query.text}'" + (f" with {tier.model}" if len(self.tiers) > 1 else "")
+            call_start = time.time()
+            try:
+                classification_data = self.retry_policy.call(attempt, description)
+            except RetryError as e:
+                outcome = "failed" if final else "error"
+                self._record_tier(tier, 1, time.time() - call_start, {outcome: 1})
+                if final:
+                    self._record_failure(query, e)
+                    return None
+                logger.warning(f"Escalating '{query.text}' past {tier.model}: {e}")
+                continue
             
-            return result
+            outcome = "accepted" if final else self._escalation_reason(classification_data)
+            self._record_tier(tier, 1, time.time() - call_start, {outcome: 1})
+            if outcome == "accepted":
+                break
+        
+        # Only cleanly parsed responses reach this point, so they are safe to cache
+        self._store(query, guidelines, key, classification_data, fallback)
+        
+        return self.build_result(query, classification_data)
+    
+    def _escalation_reason(self, classification_data: Dict[str, Any]) -> str:
+        """Why a non-final tier's answer should go to the next tier ("accepted" if it should not)"""
+        prime_category = classification_data.get("prime_category")
+        if not isinstance(prime_category, str) or not validate_prime_category(prime_category):
+            return "invalid"
+        try:
+            confidence = float(classification_data.get("confidence_score", 0.0))
+        except (TypeError, ValueError):
+            confidence = 0.0
+        if confidence < self.config.cascade_threshold:
+            return "low_confidence"
+        return "accepted"
+    
+    def _record_tier(self, tier: TierStats, queries: int, seconds: float, outcomes: Dict[str, int]):
+        """Add one call's queries, latency and outcomes to a tier's stats"""
+        with self._usage_lock:
+            tier.queries += queries
+            tier.calls += 1
+            tier.seconds += seconds
+            tier.accepted += outcomes.get("accepted", 0)
+            tier.failed += outcomes.get("failed", 0)
+            tier.escalated_low_confidence += outcomes.get("low_confidence", 0)
+            tier.escalated_invalid += outcomes.get("invalid", 0)
+            tier.escalated_error += outcomes.get("error", 0)
+    
+    def _record_failure(self, query: Query, error: RetryError):
+        """Log a query that could not be classified and send it to the dead-letter sink"""
+        logger.error(f"✗ Giving up on '{query.text}': {error}")
+        if self.dead_letter is not None:
+            self.dead_letter.write(query, error.last_error, error.attempts, error.retryable)
+    
+    def classify_batch(self, queries: List[Query], guidelines: Dict[str, Any]) -> List[Optional[ClassificationResult]]:
+        """Classify several queries with one prompt
+        
+        The model answers with a JSON array keyed by query index. Queries
+        whose element is missing or malformed are re-classified on their own.
+        Results are returned in the order of `queries`; None marks a query
+        that failed for good.
+        """
+        results: Dict[int, Optional[ClassificationResult]] = {}
+        
+        pending = []
+        keys = {}
+        audits: Dict[int, SemanticHit] = {}
+        for query in queries:
+            local = self._local_result(query)
+            if local is not None:
+                results[query.index] = local
+                continue
+            if self.cache is not None:
+                keys[query.index] = self._get_cache_key(query, guidelines)
+                cached = self.cache.get(keys[query.index])
+                if cached is not None:
+                    results[query.index] = self.build_result(query, cached)
+                    continue
+                hit = self._semantic_lookup(query, guidelines)
+                if hit is not None:
+                    if not self.semantic_cache.should_audit():
+                        results[query.index] = self.build_result(query, hit.reused_data())
+                        continue
+                    audits[query.index] = hit
+            pending.append(query)
+        
+        # Each tier answers what it can; the rest moves on to the next tier as a smaller batch
+        tier_number = 0
+        while len(pending) > 1 and tier_number < len(self.tiers):
+            tier = self.tiers[tier_number]
+            final = tier_number == len(self.tiers) - 1
+            call_start = time.time()
+            elements, fallback = self._call_batch(pending, guidelines, tier.model)
+            call_seconds = time.time() - call_start
             
-        except Exception as e:
-            logger.error(f"OpenAI API error: {e}")
-            # Return a default classification on error using the new format
-            return ClassificationResult(
-                query=query,
-                annotation_schema={"ambiguous": False, "misspelled_malformed": False, "non_market_language": False},
-                entity_schema={},
-                intent_schema={"research": True, "other_intent": False},
-                topic_schema={"other_topic": True},
-                prime_category="OTHER_None_of_These",
-                research_notes=f"Classification failed due to API error: {e}",
-                confidence_score=0.0
+            escalated = []
+            outcomes: Dict[str, int] = {}
+            for query in pending:
+                data = elements.get(query.index)
+                if not self._is_valid_classification(data):
+                    # Dropped or garbled element - re-queue it on its own at this tier
+                    with self._usage_lock:
+                        self.usage.requeued += 1
+                    results[query.index] = self._classify_uncached(query, guidelines, keys.get(query.index),
+                                                                   first_tier=tier_number)
+                    continue
+                outcome = "accepted" if final else self._escalation_reason(data)
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+                if outcome != "accepted":
+                    escalated.append(query)
+                    continue
+                self._store(query, guidelines, keys.get(query.index), data, fallback)
+                results[query.index] = self.build_result(query, data)
+            # Re-queued queries are counted by their own single calls
+            self._record_tier(tier, sum(outcomes.values()), call_seconds, outcomes)
+            pending = escalated
+            tier_number += 1
+        
+        for query in pending:
+            results[query.index] = self._classify_uncached(query, guidelines, keys.get(query.index),
+                                                           first_tier=tier_number)
+        
+        for query in queries:
+            if query.index in audits and results[query.index] is not None:
+                self._record_semantic_audit(query, audits[query.index], results[query.index])
+        
+        return [results[query.index] for query in queries]
+    
+    def _call_batch(self, pending: List[Query], guidelines: Dict[str, Any],
+                    model: str) -> Tuple[Dict[int, Dict[str, Any]], bool]:
+        """One batched call for `pending` with `model`
+        
+        Returns the elements keyed by query index (empty on failure) and
+        whether the guideline context was a fallback.
+        """
+        guidelines_context, fallback = self._get_guidelines_context(guidelines, pending)
+        query_list = "\n".join(f'{query.index}: {json.dumps(query.text, ensure_ascii=False)}' for query in pending)
+        prompt = self._assemble_prompt(guidelines_context, BATCH_INSTRUCTIONS.format(query_list=query_list))
+        messages = self._build_messages(prompt)
+        max_tokens = min(self.config.max_tokens * len(pending), MAX_BATCH_COMPLETION_TOKENS)
+        
+        try:
+            response_text = self.retry_policy.call(
+                lambda: self._call_api(messages, max_tokens=max_tokens, batch_size=len(pending),
+                                       response_format=self.batch_response_format, model=model),
+                f"Batch of {len(pending)} queries"
             )
+        except RetryError as e:
+            logger.error(f"OpenAI API error on batch of {len(pending)} queries: {e}")
+            return {}, fallback
+        self._record_single_mode_estimate(pending, guidelines_context)
+        return self._parse_batch_response(response_text), fallback
+    
+    def _record_single_mode_estimate(self, queries: List[Query], guidelines_context: str):
+        """Track what the batched queries would have cost as single-query prompts"""
+        estimate = sum(
+            self.rate_limiter.estimate_tokens(self._build_messages(self._build_prompt(query.text, guidelines_context)))
+            for query in queries
+        )
+        with self._usage_lock:
+            self.usage.single_prompt_tokens_estimate += estimate
+    
+    def _parse_batch_response(self, response_content: str) -> Dict[int, Dict[str, Any]]:
+        """Parse a batched response into classification data keyed by query index"""
+        data = None
+        try:
+            data = json.loads(response_content)
+        except json.JSONDecodeError:
+            json_match = re.search(r'\[.*\]', response_content, re.DOTALL)
+            if json_match:
+                try:
+                    data = json.loads(json_match.group(0))
+                except json.JSONDecodeError:
+                    pass
+        
+        # Tolerate the array being wrapped in an object
+        if isinstance(data, dict):
+            data = next((value for value in data.values() if isinstance(value, list)), None)
+        
+        if not isinstance(data, list):
+            logger.warning(f"Failed to parse batched LLM response: {response_content[:200]}...")
+            return {}
+        
+        elements = {}
+        for element in data:
+            if not isinstance(element, dict):
+                continue
+            element = self._expand_if_compact(element)
+            try:
+                elements[int(element.pop("index"))] = element
+            except (KeyError, TypeError, ValueError):
+                continue
+        return elements
+    
+    def _is_valid_classification(self, data: Any) -> bool:
+        """Check that parsed classification data has the fields we rely on"""
+        return (
+            isinstance(data, dict)
+            and isinstance(data.get("prime_category"), (str, dict))
+            and isinstance(data.get("intent_schema", {}), dict)
+            and isinstance(data.get("topic_schema", {}), dict)
+        )
     
-    def _get_default_classification(self) -> Dict[str, Any]:
-        """Get a default classification when parsing fails - UPDATED FORMAT"""
-        return {
-            "annotation_schema": {
-                "ambiguous": False,
-                "misspelled_malformed": False,
-                "non_market_language": False
-            },
-            "entity_schema": {
-                "person_notable": [],
-                "person_non_notable": [],
-                "type_of_person": [],
-                "specific_organization": [],
-                "type_of_organization": [],
-                "media_title": [],
-                "type_of_media": [],
-                "specific_product": [],
-                "type_of_product": [],
-                "specific_place_city": [],
-                "specific_place_poi": [],
-                "specific_place_address": [],
-                "specific_place_other": [],
-                "type_of_place": [],
-                "specific_event": [],
-                "type_of_event": [],
-                "website": [],
-                "other_entity": []
-            },
-            "intent_schema": {
-                "website": False,
-                "porn_illegal": False,
-                "images_videos": False,
-                "local_info": False,
-                "event_info": False,
-                "news": False,
-                "shopping": False,
-                "simple_fact": False,
-                "research": True,  # Default to True since it's a research intent
-                "other_intent": False
-            },
-            "topic_schema": {
-                "autos": False,
-                "education": False,
-                "entertainment_books": False,
-                "entertainment_games": False,
-                "entertainment_movies": False,
-                "entertainment_music": False,
-                "entertainment_tv": False,
-                "entertainment_other": False,
-                "environment": False,
-                "finance": False,
-                "food_dining": False,
-                "government_politics": False,
-                "health_medical": False,
-                "home_garden": False,
-                "jobs": False,
-                "legal": False,
-                "people_search": False,
-                "personal_goods": False,
-                "pets_animals": False,
-                "real_estate": False,
-                "religion": False,
-                "retailers": False,
-                "social_networking": False,
-                "sports_outdoors": False,
-                "tech_electronics": False,
-                "transit_traffic": False,
-                "travel_lodging": False,
-                "weather": False,
-                "other_topic": True  # Default to True
-            },
-            "prime_category": "OTHER_None_of_These",  # String, not dict!
-            "research_notes": "Failed to parse classification response - using default",
-            "confidence_score": 0.0
+    def build_request_bodies(self, queries: List[Query],
+                             guidelines: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], bool]:
+        """Chat completions request bodies for queries, as used by offline batch jobs
+        
+        The guideline contexts of all the queries are retrieved together,
+        so embedding retrieval costs one embeddings request per 100 queries
+        rather than one per query. Also returns whether the contexts are a
+        fallback after retrieval failed; pass it on to result_from_response.
+        """
+        contexts, fallback = self._get_guidelines_contexts(guidelines, queries)
+        bodies = []
+        for query, context in zip(queries, contexts):
+            body = {
+                "model": self.config.openai_model,
+                "messages": self._build_messages(self._build_prompt(query.text, context)),
+                "max_tokens": self.config.max_tokens,
+                "temperature": self.config.temperature
+            }
+            if self.response_format is not None:
+                body["response_format"] = self.response_format
+            bodies.append(body)
+        return bodies, fallback
+    
+    def request_fingerprint(self, guidelines: Dict[str, Any]) -> str:
+        """Hash of every setting besides the query that shapes build_request_bodies"""
+        digest = hashlib.sha256()
+        for part in (self.static_prompt + QUERY_SECTION, self._get_context_fingerprint(guidelines),
+                     self.config.openai_model, repr(float(self.config.temperature)), str(self.config.max_tokens),
+                     json.dumps(self.response_format, sort_keys=True)):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+    
+    def result_from_response(self, query: Query, response_text: str, guidelines: Optional[Dict[str, Any]] = None,
+                             fallback: bool = False) -> Optional[ClassificationResult]:
+        """Turn raw response text into a result, caching it when it parses cleanly
+        
+        An unparseable response is dead-lettered like an online failure and
+        gives None, so a later run classifies the query again. `fallback`
+        marks a request built with the leading chunks after retrieval failed.
+        """
+        classification_data = self._parse_response(response_text.strip())
+        if classification_data is None:
+            error = ResponseParseError(f"Failed to parse LLM response: {response_text[:200]}...")
+            self._record_failure(query, RetryError(error, attempts=1, retryable=True))
+            return None
+        if self.cache is not None and guidelines is not None:
+            self._store(query, guidelines, self._get_cache_key(query, guidelines), classification_data, fallback)
+        return self.build_result(query, classification_data)
+    
+    def _local_result(self, query: Query) -> Optional[ClassificationResult]:
+        """Result from the rules fast path or a confident local model, if either has one"""
+        for local in (self.rules, self.local_model):
+            if local is None:
+                continue
+            data = local.classify(query.text)
+            if data is not None:
+                return self.build_result(query, data)
+        return None
+    
+    def get_cached_result(self, query: Query, guidelines: Dict[str, Any]) -> Optional[ClassificationResult]:
+        """Return a local (rules/model), cached or near-duplicate result for the query without calling the API"""
+        local = self._local_result(query)
+        if local is not None:
+            return local
+        if self.cache is None:
+            return None
+        cached = self.cache.get(self._get_cache_key(query, guidelines))
+        if cached is None:
+            hit = self._semantic_lookup(query, guidelines)
+            cached = hit.reused_data() if hit is not None else None
+        return self.build_result(query, cached) if cached is not None else None
+    
+    @staticmethod
+    def build_result(query: Query, classification_data: Dict[str, Any]) -> ClassificationResult:
+        """Create a ClassificationResult from parsed classification data"""
+        prime_category = classification_data.get("prime_category", "OTHER_None_of_These")
+        
+        # Ensure prime_category is a string (not a dict)
+        if isinstance(prime_category, dict):
+            prime_category = prime_category.get("category", "OTHER_None_of_These")
+        
+        return ClassificationResult(
+            query=query,
+            annotation_schema=classification_data.get("annotation_schema", {}),
+            entity_schema=classification_data.get("entity_schema", {}),
+            intent_schema=classification_data.get("intent_schema", {}),
+            topic_schema=classification_data.get("topic_schema", {}),
+            prime_category=prime_category,
+            research_notes=classification_data.get("research_notes", ""),
+            confidence_score=classification_data.get("confidence_score", 0.5)
+        )
+    
+    def _call_api(self, messages: List[Dict[str, Any]], max_tokens: Optional[int] = None, batch_size: int = 1,
+                  response_format: Optional[Dict[str, Any]] = None, model: Optional[str] = None) -> str:
+        """Send a chat request within the shared rate limit and return the response text"""
+        max_tokens = max_tokens or self.config.max_tokens
+        queries = max(batch_size, 1)
+        estimated_tokens = self.rate_limiter.estimate_tokens(
+            messages, self.rate_limiter.expected_completion(max_tokens, queries))
+        self.rate_limiter.acquire(estimated_tokens)
+        
+        request = {
+            "model": model or self.config.openai_model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": self.config.temperature
         }
-
-    def _parse_llm_response(self, response_content: str) -> Dict[str, Any]:
+        if response_format is not None:
+            request["response_format"] = response_format
+        if self.hedger is None:
+            return self._send_chat(request, estimated_tokens, batch_size, queries)
+        
+        def send(is_hedge: bool) -> str:
+            if not is_hedge:
+                return self._send_chat(request, estimated_tokens, batch_size, queries)
+            # The duplicate pays its own way under the rate limit; its queries are not counted twice
+            self.rate_limiter.acquire(estimated_tokens)
+            return self._send_chat(request, estimated_tokens, 0, queries)
+        
+        return self.hedger.call(send)
+    
+    def _send_chat(self, request: Dict[str, Any], estimated_tokens: int, batch_size: int, queries: int = 1) -> str:
+        """Make one chat completion call whose rate-limit slot is already acquired
+        
+        `batch_size` is the number of queries counted in the usage totals
+        (0 for a hedge duplicate); `queries` is how many the request holds.
+        """
+        call_start = time.time()
+        try:
+            raw_response = self.chat_client.chat.completions.with_raw_response.create(**request)
+        except Exception as e:
+            response = getattr(e, "response", None)
+            if response is not None:
+                self.rate_limiter.update_from_headers(response.headers)
+            # Only refused requests give their tokens back; a timed-out one may still have run and been billed
+            if was_rejected(e):
+                self.rate_limiter.record_usage(estimated_tokens, 0)
+            raise
+        call_seconds = time.time() - call_start
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        
+        response = raw_response.parse()
+        usage = getattr(response, "usage", None)
+        self.rate_limiter.record_usage(estimated_tokens, usage.total_tokens if usage else None,
+                                       usage.completion_tokens if usage else None, queries)
+        self._record_usage(usage, batch_size, call_seconds, request["model"])
+        
+        message = response.choices[0].message
+        if message.content is None:
+            raise ValueError(f"No response content (refusal: {getattr(message, 'refusal', None)})")
+        return message.content.strip()
+    
+    def _record_usage(self, usage, batch_size: int, call_seconds: float = 0.0, model: Optional[str] = None):
+        """Add the token usage of one API call to the running totals and its model's tier"""
+        with self._usage_lock:
+            self.usage.calls += 1
+            self.usage.queries += batch_size
+            self.usage.api_seconds += call_seconds
+            if usage is None:
+                return
+            self.usage.prompt_tokens += usage.prompt_tokens
+            self.usage.completion_tokens += usage.completion_tokens
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = getattr(details, "cached_tokens", None) or 0
+            self.usage.cached_prompt_tokens += cached_tokens
+            tier = self._tier_by_model.get(model)
+            if tier is not None:
+                tier.prompt_tokens += usage.prompt_tokens
+                tier.cached_prompt_tokens += cached_tokens
+                tier.completion_tokens += usage.completion_tokens
+            if batch_size > 1:
+                self.usage.batched_queries += batch_size
+                self.usage.batched_prompt_tokens += usage.prompt_tokens
+    
+    def _parse_response(self, response_content: str) -> Optional[Dict[str, Any]]:
+        """Parse classification data from response text, or None if it is unusable
+        
+        Structured-output responses are guaranteed to match the schema, so
+        they are decoded in one pass with no extraction fallbacks.
+        """
+        if self.response_format is None:
+            data = self._try_parse_json(response_content)
+        else:
+            try:
+                data = json.loads(response_content)
+            except json.JSONDecodeError:
+                return None
+        return self._expand_if_compact(data) if isinstance(data, dict) else None
+    
+    def _expand_if_compact(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Expand compact response data, recording what the verbose format would have cost"""
+        if not self.config.compact_responses or not is_compact(data):
+            return data
+        expanded = expand_compact_classification(data)
+        verbose = {key: value for key, value in expanded.items() if key != "index"}
+        estimate = self.rate_limiter.count_tokens(json.dumps(verbose, indent=2, ensure_ascii=False))
+        with self._usage_lock:
+            self.usage.compact_queries += 1
+            self.usage.verbose_completion_tokens_estimate += estimate
+        return expanded
+    
+    def _try_parse_json(self, response_content: str) -> Optional[Dict[str, Any]]:
         """
-        Parse LLM response content and handle various response formats
+        Extract the JSON object from LLM response content, or None if there is none
         """
         try:
             # First, try to parse the entire response as JSON
@@ -390,6 +973,4 @@ CRITICAL REQUIREMENTS:
         except json.JSONDecodeError:
             pass
         
-        # If all parsing fails, log the issue and return default
-        logger.warning(f"Failed to parse LLM response: {response_content[:200]}...")
-        return self._get_default_classification()
+        return None
@@ -0,0 +1,71 @@
+"""Compact response contract: the model lists only what applies"""
+
+from typing import Any, Dict
+
+from qcl.data.prime_categories_mapping import (
+    ANNOTATION_SCHEMA,
+    ENTITY_SCHEMA,
+    INTENT_SCHEMA,
+    TOPIC_SCHEMA
+)
+
+# Appended to the prompt instructions; replaces the verbose JSON format
+COMPACT_INSTRUCTIONS = """COMPACT RESPONSE FORMAT: Do NOT use the full JSON format shown above. List only the classifications that apply, using the exact schema names above:
+
+{
+  "annotations": ["misspelled_malformed"],
+  "entities": [{"type": "website", "name": "gmail"}],
+  "intents": ["website"],
+  "topics": ["tech_electronics"],
+  "prime_category": "EXACT_PRIME_CATEGORY_NAME",
+  "research_notes": "Brief explanation of classification decisions",
+  "confidence_score": 0.95
+}
+
+Leave out everything that does not apply - no false flags and no empty entity types. Respond ONLY with valid JSON - no other text."""
+
+
+# Keys of the full response format; a compact reply has none of them
+SCHEMA_KEYS = ("annotation_schema", "entity_schema", "intent_schema", "topic_schema")
+
+
+def is_compact(data: Any) -> bool:
+    """Whether parsed response data uses the compact contract
+
+    Every compact key may be left out when nothing applies, so a reply is
+    compact when it has none of the full format's schema keys.
+    """
+    return isinstance(data, dict) and not any(key in data for key in SCHEMA_KEYS)
+
+
+def expand_compact_classification(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Expand a compact response into the full schema dicts
+
+    Names outside the schemas are dropped. Entities may be given either
+    as a list of {"type", "name"} objects or as a {type: [names]} dict.
+    """
+    annotations = set(data.get("annotations") or [])
+    intents = set(data.get("intents") or [])
+    topics = set(data.get("topics") or [])
+
+    entity_schema = {name: [] for name in ENTITY_SCHEMA}
+    entities = data.get("entities") or []
+    if isinstance(entities, dict):
+        entities = [{"type": entity_type, "name": name}
+                    for entity_type, names in entities.items() for name in (names or [])]
+    for entity in entities:
+        if isinstance(entity, dict) and entity.get("type") in entity_schema and entity.get("name"):
+            entity_schema[entity["type"]].append(entity["name"])
+
+    expanded = {
+        "annotation_schema": {name: name in annotations for name in ANNOTATION_SCHEMA},
+        "entity_schema": entity_schema,
+        "intent_schema": {name: name in intents for name in INTENT_SCHEMA},
+        "topic_schema": {name: name in topics for name in TOPIC_SCHEMA},
+        "prime_category": data.get("prime_category"),
+        "research_notes": data.get("research_notes", ""),
+        "confidence_score": data.get("confidence_score", 0.5)
+    }
+    if "index" in data:
+        expanded["index"] = data["index"]
+    return expanded
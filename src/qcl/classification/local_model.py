@@ -0,0 +1,334 @@
+"""Local hashed n-gram linear model distilled from LLM classifications"""
+
+import logging
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from qcl.data.prime_categories_mapping import INTENT_SCHEMA, TOPIC_SCHEMA
+from .rules import build_classification, normalize
+
+logger = logging.getLogger(__name__)
+
+
+class HashedNgramVectorizer:
+    """Maps a query to hashed word and character n-gram features
+
+    Word 1..`word_ngrams`-grams and character `char_ngrams` ranges of each
+    padded word are hashed (crc32, stable across runs) into
+    `n_features` buckets. Rows are binary and scaled to unit length.
+    """
+
+    def __init__(self, n_features: int = 65536, word_ngrams: int = 2, char_ngrams: Tuple[int, int] = (3, 5)):
+        self.n_features = n_features
+        self.word_ngrams = word_ngrams
+        self.char_ngrams = char_ngrams
+
+    def _hash(self, feature: str) -> int:
+        return zlib.crc32(feature.encode("utf-8")) % self.n_features
+
+    def features(self, text: str) -> np.ndarray:
+        """Sorted unique feature indices for one query"""
+        words = normalize(text).split()
+        # The length bucket keeps every row non-empty
+        grams = [f"len:{min(len(words), 6)}"]
+        for n in range(1, self.word_ngrams + 1):
+            grams += ["w:" + " ".join(words[i:i + n]) for i in range(len(words) - n + 1)]
+        low, high = self.char_ngrams
+        for word in words:
+            padded = f"<{word}>"
+            for n in range(low, high + 1):
+                grams += ["c:" + padded[i:i + n] for i in range(len(padded) - n + 1)]
+        return np.unique(np.fromiter((self._hash(gram) for gram in grams), dtype=np.int64, count=len(grams)))
+
+    def transform(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """CSR-style (indices, indptr, row scale) for a batch of queries"""
+        rows = [self.features(text) for text in texts]
+        lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        indices = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        return indices, indptr, 1.0 / np.sqrt(np.maximum(lengths, 1))
+
+
+def _scores(weights: np.ndarray, bias: np.ndarray, indices: np.ndarray, indptr: np.ndarray,
+            scale: np.ndarray) -> np.ndarray:
+    """Linear scores for CSR rows (no row may be empty)"""
+    return np.add.reduceat(weights[indices], indptr[:-1], axis=0) * scale[:, None] + bias
+
+
+def _softmax(scores: np.ndarray) -> np.ndarray:
+    exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def _sigmoid(scores: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-scores))
+
+
+@dataclass
+class LinearHead:
+    """One output head: softmax over classes, or independent one-vs-rest sigmoids"""
+    labels: List[str]
+    weights: np.ndarray
+    bias: np.ndarray
+    multilabel: bool
+
+    def probabilities(self, indices: np.ndarray, indptr: np.ndarray, scale: np.ndarray) -> np.ndarray:
+        scores = _scores(self.weights, self.bias, indices, indptr, scale)
+        return _sigmoid(scores) if self.multilabel else _softmax(scores)
+
+
+def train_head(rows: List[np.ndarray], targets: np.ndarray, labels: List[str], n_features: int,
+               multilabel: bool, epochs: int = 15, learning_rate: float = 0.5, l2: float = 1e-5,
+               batch_size: int = 64, seed: int = 0) -> LinearHead:
+    """Fit one head with mini-batch AdaGrad and sparse updates"""
+    rng = np.random.default_rng(seed)
+    weights = np.zeros((n_features, len(labels)), dtype=np.float32)
+    bias = np.zeros(len(labels), dtype=np.float32)
+    weight_sq = np.full_like(weights, 1e-8)
+    bias_sq = np.full_like(bias, 1e-8)
+
+    for _ in range(epochs):
+        order = rng.permutation(len(rows))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            batch_rows = [rows[i] for i in batch]
+            lengths = np.fromiter((len(row) for row in batch_rows), dtype=np.int64, count=len(batch_rows))
+            indptr = np.concatenate(([0], np.cumsum(lengths)))
+            indices = np.concatenate(batch_rows)
+            scale = (1.0 / np.sqrt(lengths)).astype(np.float32)
+
+            scores = _scores(weights, bias, indices, indptr, scale)
+            probabilities = _sigmoid(scores) if multilabel else _softmax(scores)
+            error = (probabilities - targets[batch]) / len(batch)
+
+            # Only the features present in the batch get a gradient
+            features, inverse = np.unique(indices, return_inverse=True)
+            row_of = np.repeat(np.arange(len(batch)), lengths)
+            grad = np.zeros((len(features), len(labels)), dtype=np.float32)
+            np.add.at(grad, inverse, error[row_of] * scale[row_of, None])
+            grad += l2 * weights[features]
+
+            weight_sq[features] += grad ** 2
+            weights[features] -= learning_rate * grad / np.sqrt(weight_sq[features])
+            bias_grad = error.sum(axis=0)
+            bias_sq += bias_grad ** 2
+            bias -= learning_rate * bias_grad / np.sqrt(bias_sq)
+
+    return LinearHead(labels, weights, bias, multilabel)
+
+
+def calibrate_threshold(confidence: np.ndarray, correct: np.ndarray, precision: float) -> float:
+    """Lowest confidence cut-off whose accepted predictions reach `precision`
+
+    Returns 1.0 (accept nothing) if no cut-off is precise enough.
+    """
+    order = np.argsort(-confidence)
+    running = np.cumsum(correct[order]) / np.arange(1, len(order) + 1)
+    good = np.nonzero(running >= precision)[0]
+    if not len(good):
+        return 1.0
+    return float(confidence[order][good[-1]])
+
+
+@dataclass
+class LocalPrediction:
+    prime_category: str
+    confidence: float
+    intents: List[str]
+    topics: List[str]
+
+
+@dataclass
+class LocalModelStats:
+    """How many queries the local model answered, and how quickly"""
+    checked: int = 0
+    confident: int = 0
+    seconds: float = 0.0
+
+    @property
+    def coverage(self) -> float:
+        return self.confident / self.checked if self.checked else 0.0
+
+    @property
+    def queries_per_second(self) -> float:
+        return self.checked / self.seconds if self.seconds else 0.0
+
+
+class LocalModel:
+    """Predicts PRIME category, intents and topics without calling the API
+
+    The PRIME head is a softmax over the categories seen in training; intents
+    and topics are one-vs-rest sigmoid heads. A query is answered locally only
+    when the PRIME probability reaches `threshold`, which `train` calibrates
+    on held-out rows to a target precision. The model does not extract
+    entities or annotations, so its answers leave entity_schema empty and
+    every annotation flag False.
+    """
+
+    def __init__(self, vectorizer: HashedNgramVectorizer, prime: LinearHead, intents: LinearHead,
+                 topics: LinearHead, threshold: float = 1.0, metrics: Optional[Dict[str, float]] = None):
+        self.vectorizer = vectorizer
+        self.prime = prime
+        self.intents = intents
+        self.topics = topics
+        self.threshold = threshold
+        self.metrics = metrics or {}
+        self.stats = LocalModelStats()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _fit(cls, rows: List[np.ndarray], records: List[Dict[str, Any]], vectorizer: HashedNgramVectorizer,
+             epochs: int) -> "LocalModel":
+        primes = sorted({record["prime_category"] for record in records})
+        prime_index = {label: i for i, label in enumerate(primes)}
+        intent_labels, topic_labels = list(INTENT_SCHEMA), list(TOPIC_SCHEMA)
+
+        prime_targets = np.zeros((len(records), len(primes)), dtype=np.float32)
+        intent_targets = np.zeros((len(records), len(intent_labels)), dtype=np.float32)
+        topic_targets = np.zeros((len(records), len(topic_labels)), dtype=np.float32)
+        for i, record in enumerate(records):
+            prime_targets[i, prime_index[record["prime_category"]]] = 1
+            for name in record["intents"]:
+                intent_targets[i, intent_labels.index(name)] = 1
+            for name in record["topics"]:
+                topic_targets[i, topic_labels.index(name)] = 1
+
+        n_features = vectorizer.n_features
+        return cls(
+            vectorizer,
+            train_head(rows, prime_targets, primes, n_features, multilabel=False, epochs=epochs),
+            train_head(rows, intent_targets, intent_labels, n_features, multilabel=True, epochs=epochs),
+            train_head(rows, topic_targets, topic_labels, n_features, multilabel=True, epochs=epochs)
+        )
+
+    @classmethod
+    def train(cls, records: List[Dict[str, Any]], vectorizer: HashedNgramVectorizer, epochs: int = 15,
+              precision: float = 0.9, holdout: float = 0.2) -> "LocalModel":
+        """Fit on the training split and calibrate the threshold on the held-out split
+
+        `records` are {"query", "prime_category", "intents", "topics"} dicts
+        (see qcl.data.loaders.iter_labelled_rows). The held-out split is
+        chosen by query hash, so it is the same on every run. The returned
+        model is the one that was calibrated; a refit on every row would be
+        more confident than the threshold and metrics assume.
+        """
+        rows = [vectorizer.features(record["query"]) for record in records]
+        held_out = np.array([zlib.crc32(record["query"].encode("utf-8")) % 1000 < holdout * 1000
+                             for record in records])
+        train_ids, test_ids = np.nonzero(~held_out)[0], np.nonzero(held_out)[0]
+
+        model = cls._fit([rows[i] for i in train_ids], [records[i] for i in train_ids], vectorizer, epochs)
+        predictions = model.predict([records[i]["query"] for i in test_ids])
+        confidence = np.array([p.confidence for p in predictions])
+        correct = np.array([p.prime_category == records[i]["prime_category"] for p, i in zip(predictions, test_ids)])
+        threshold = calibrate_threshold(confidence, correct, precision) if len(test_ids) else 1.0
+        accepted = confidence >= threshold
+
+        def micro_f1(predicted: List[List[str]], key: str) -> float:
+            true_positive = predicted_count = actual_count = 0
+            for labels, i in zip(predicted, test_ids):
+                actual = set(records[i][key])
+                true_positive += len(actual & set(labels))
+                predicted_count += len(labels)
+                actual_count += len(actual)
+            return 2 * true_positive / (predicted_count + actual_count) if predicted_count + actual_count else 0.0
+
+        metrics = {
+            "train_rows": float(len(train_ids)),
+            "holdout_rows": float(len(test_ids)),
+            "holdout_accuracy": float(correct.mean()) if len(test_ids) else 0.0,
+            "holdout_coverage": float(accepted.mean()) if len(test_ids) else 0.0,
+            "holdout_precision": float(correct[accepted].mean()) if accepted.any() else 0.0,
+            "intent_f1": micro_f1([p.intents for p in predictions], "intents"),
+            "topic_f1": micro_f1([p.topics for p in predictions], "topics"),
+        }
+
+        model.threshold = threshold
+        model.metrics = metrics
+        return model
+
+    def predict(self, texts: Sequence[str]) -> List[LocalPrediction]:
+        """Predict a batch of queries at once"""
+        if not texts:
+            return []
+        indices, indptr, scale = self.vectorizer.transform(texts)
+        prime = self.prime.probabilities(indices, indptr, scale)
+        intents = self.intents.probabilities(indices, indptr, scale) >= 0.5
+        topics = self.topics.probabilities(indices, indptr, scale) >= 0.5
+        best = prime.argmax(axis=1)
+        return [
+            LocalPrediction(
+                prime_category=self.prime.labels[best[i]],
+                confidence=float(prime[i, best[i]]),
+                intents=[self.intents.labels[j] for j in np.nonzero(intents[i])[0]],
+                topics=[self.topics.labels[j] for j in np.nonzero(topics[i])[0]]
+            )
+            for i in range(len(texts))
+        ]
+
+    def classification_data(self, prediction: LocalPrediction) -> Dict[str, Any]:
+        """Full classification data for a prediction (no entities, no annotation flags)"""
+        return build_classification(prediction.prime_category, intents=prediction.intents,
+                                    topics=prediction.topics, confidence=round(prediction.confidence, 4),
+                                    notes=f"Local model prediction (confidence {prediction.confidence:.2f})")
+
+    def classify_batch(self, texts: Sequence[str]) -> List[Optional[Dict[str, Any]]]:
+        """Classification data for confident predictions, None for the rest"""
+        start = time.perf_counter()
+        predictions = self.predict(texts)
+        results = [self.classification_data(p) if p.confidence >= self.threshold else None for p in predictions]
+        with self._lock:
+            self.stats.checked += len(texts)
+            self.stats.confident += sum(result is not None for result in results)
+            self.stats.seconds += time.perf_counter() - start
+        return results
+
+    def classify(self, query_text: str) -> Optional[Dict[str, Any]]:
+        """Classification data if the model is confident, otherwise None to use the LLM"""
+        return self.classify_batch([query_text])[0]
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {
+            "n_features": np.array(self.vectorizer.n_features),
+            "word_ngrams": np.array(self.vectorizer.word_ngrams),
+            "char_ngrams": np.array(self.vectorizer.char_ngrams),
+            "threshold": np.array(self.threshold),
+            "metric_names": np.array(list(self.metrics), dtype=str),
+            "metric_values": np.array(list(self.metrics.values()), dtype=np.float64),
+        }
+        for name in ("prime", "intents", "topics"):
+            head = getattr(self, name)
+            arrays[f"{name}_labels"] = np.array(head.labels, dtype=str)
+            arrays[f"{name}_weights"] = head.weights
+            arrays[f"{name}_bias"] = head.bias
+        # Write next to the target and swap in, so a crash never leaves a torn model
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        tmp_path.replace(path)
+        logger.info(f"Saved local model to {path}")
+
+    @classmethod
+    def load(cls, path: Path) -> "LocalModel":
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"Local model not found: {path} (run train-local first)")
+        with np.load(path, allow_pickle=False) as data:
+            vectorizer = HashedNgramVectorizer(int(data["n_features"]), int(data["word_ngrams"]),
+                                               tuple(int(n) for n in data["char_ngrams"]))
+            heads = {
+                name: LinearHead(data[f"{name}_labels"].tolist(), data[f"{name}_weights"], data[f"{name}_bias"],
+                                 multilabel=name != "prime")
+                for name in ("prime", "intents", "topics")
+            }
+            metrics = dict(zip(data["metric_names"].tolist(), data["metric_values"].tolist()))
+            return cls(vectorizer, heads["prime"], heads["intents"], heads["topics"],
+                       threshold=float(data["threshold"]), metrics=metrics)
@@ -0,0 +1,94 @@
+"""JSON Schemas for structured-output classification responses"""
+
+from typing import Any, Dict
+
+from qcl.data.prime_categories_mapping import (
+    PRIME_CATEGORIES,
+    ANNOTATION_SCHEMA,
+    ENTITY_SCHEMA,
+    INTENT_SCHEMA,
+    TOPIC_SCHEMA
+)
+
+
+def _object(properties: Dict[str, Any]) -> Dict[str, Any]:
+    """Strict-mode object: every property required, nothing extra allowed"""
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False
+    }
+
+
+def _flags(schema: Dict[str, str]) -> Dict[str, Any]:
+    return _object({name: {"type": "boolean", "description": description} for name, description in schema.items()})
+
+
+def _entity_lists(schema: Dict[str, str]) -> Dict[str, Any]:
+    return _object({
+        name: {"type": "array", "items": {"type": "string"}, "description": description}
+        for name, description in schema.items()
+    })
+
+
+def classification_properties() -> Dict[str, Any]:
+    """Properties of one classification object"""
+    return {
+        "annotation_schema": _flags(ANNOTATION_SCHEMA),
+        "entity_schema": _entity_lists(ENTITY_SCHEMA),
+        "intent_schema": _flags(INTENT_SCHEMA),
+        "topic_schema": _flags(TOPIC_SCHEMA),
+        "prime_category": {"type": "string", "enum": list(PRIME_CATEGORIES)},
+        "research_notes": {"type": "string"},
+        "confidence_score": {"type": "number"}
+    }
+
+
+def compact_classification_properties() -> Dict[str, Any]:
+    """Properties of one compact classification (only what applies is listed)"""
+    entity = _object({
+        "type": {"type": "string", "enum": list(ENTITY_SCHEMA)},
+        "name": {"type": "string"}
+    })
+    return {
+        "annotations": {"type": "array", "items": {"type": "string", "enum": list(ANNOTATION_SCHEMA)}},
+        "entities": {"type": "array", "items": entity},
+        "intents": {"type": "array", "items": {"type": "string", "enum": list(INTENT_SCHEMA)}},
+        "topics": {"type": "array", "items": {"type": "string", "enum": list(TOPIC_SCHEMA)}},
+        "prime_category": {"type": "string", "enum": list(PRIME_CATEGORIES)},
+        "research_notes": {"type": "string"},
+        "confidence_score": {"type": "number"}
+    }
+
+
+def _properties(compact: bool) -> Dict[str, Any]:
+    return compact_classification_properties() if compact else classification_properties()
+
+
+def classification_response_format(compact: bool = False) -> Dict[str, Any]:
+    """`response_format` for a single-query classification"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "query_classification",
+            "strict": True,
+            "schema": _object(_properties(compact))
+        }
+    }
+
+
+def batch_response_format(compact: bool = False) -> Dict[str, Any]:
+    """`response_format` for a batched prompt: {"results": [classification + index, ...]}
+
+    Structured outputs need an object at the root, so the array is wrapped.
+    """
+    item = _object({"index": {"type": "integer"}, **_properties(compact)})
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "query_classification_batch",
+            "strict": True,
+            "schema": _object({"results": {"type": "array", "items": item}})
+        }
+    }
@@ -0,0 +1,297 @@
+"""Guideline chunk retrieval for prompt context"""
+
+import hashlib
+import logging
+import math
+import pickle
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..core.retry import was_rejected
+from ..data.loaders import load_cached_embeddings, save_cached_embeddings
+
+logger = logging.getLogger(__name__)
+
+# Chunks sent per embeddings request
+EMBEDDING_BATCH_SIZE = 100
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens used by the lexical retriever"""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def _chunks_fingerprint(chunks: List[str], *parts: str) -> str:
+    """Hash identifying a chunk list (plus any settings that affect the index)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    for chunk in chunks:
+        digest.update(chunk.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def _request_embeddings(client, model: str, texts: List[str], rate_limiter=None) -> List[List[float]]:
+    """One embeddings request, taking its slot in the shared rate limit"""
+    estimated_tokens = sum(rate_limiter.count_tokens(text) for text in texts) if rate_limiter is not None else 0
+    if rate_limiter is not None:
+        rate_limiter.acquire(estimated_tokens)
+    try:
+        response = client.embeddings.create(model=model, input=texts)
+    except Exception as e:
+        if rate_limiter is not None:
+            rate_limiter.record_usage(estimated_tokens, 0 if was_rejected(e) else None)
+        raise
+    # No update_from_headers here: the x-ratelimit-* headers describe the embedding model's limits, not the chat model's
+    if rate_limiter is not None:
+        usage = getattr(response, "usage", None)
+        rate_limiter.record_usage(estimated_tokens, usage.total_tokens if usage else None)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+def embed_texts(client, model: str, texts: List[str], rate_limiter=None, retry_policy=None) -> np.ndarray:
+    """Embed texts with the OpenAI embeddings API and return unit-length rows
+
+    With a RateLimiter each request counts against the shared budget; with
+    a RetryPolicy throttling and other transient errors are retried (pass
+    a client with SDK retries off, as for chat calls).
+    """
+    vectors = []
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        batch = texts[start:start + EMBEDDING_BATCH_SIZE]
+        if retry_policy is None:
+            vectors.extend(_request_embeddings(client, model, batch, rate_limiter))
+        else:
+            vectors.extend(retry_policy.call(lambda: _request_embeddings(client, model, batch, rate_limiter),
+                                             f"Embedding {len(batch)} texts with {model}"))
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores: np.ndarray, k: int) -> List[int]:
+    """Indices of the k highest scores, best first"""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return []
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])].tolist()
+
+
+class EmbeddingRetriever:
+    """Picks the guideline chunks most similar to a query by embedding cosine similarity
+
+    Chunk embeddings are computed once per chunk set and model, then kept
+    as a row-normalized NumPy matrix in the processed data directory.
+    Query embeddings go through the classifier's rate limiter and retry
+    policy when they are given.
+    """
+
+    def __init__(self, client, model: str = "text-embedding-3-small", top_k: int = 3,
+                 cache_dir: Optional[Path] = None, rate_limiter=None, retry_policy=None):
+        # RetryPolicy does the retrying, so the SDK's own retries are off
+        self.client = client.with_options(max_retries=0) if retry_policy is not None else client
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.model = model
+        self.top_k = top_k
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.chunks: List[str] = []
+        self.matrix: Optional[np.ndarray] = None
+        self.fingerprint = ""
+
+    @classmethod
+    def from_config(cls, config, client, rate_limiter=None, retry_policy=None) -> "EmbeddingRetriever":
+        return cls(client, model=config.embedding_model, top_k=config.retrieval_top_k,
+                   cache_dir=config.processed_dir, rate_limiter=rate_limiter, retry_policy=retry_policy)
+
+    @property
+    def cache_token(self) -> str:
+        """Identifies this retrieval setup in classification cache keys"""
+        return f"embedding:{self.model}:{self.top_k}:{self.fingerprint}"
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts and return unit-length rows"""
+        return embed_texts(self.client, self.model, texts, self.rate_limiter, self.retry_policy)
+
+    def index(self, guidelines: Dict[str, Any]):
+        """Embed the guideline chunks, reusing cached vectors when available"""
+        self.chunks = guidelines["chunks"]
+        fingerprint = _chunks_fingerprint(self.chunks, self.model)
+        self.fingerprint = fingerprint
+        cache_file = self.cache_dir / f"guideline_embeddings_{fingerprint[:16]}.pkl" if self.cache_dir else None
+
+        if cache_file is not None:
+            cached = load_cached_embeddings(cache_file)
+            if cached and cached.get("fingerprint") == fingerprint:
+                self.matrix = cached["matrix"]
+                return
+
+        logger.info(f"Embedding {len(self.chunks)} guideline chunks with {self.model}")
+        self.matrix = self._embed(self.chunks)
+        if cache_file is not None:
+            save_cached_embeddings({"fingerprint": fingerprint, "model": self.model, "matrix": self.matrix}, cache_file)
+
+    def retrieve(self, query_text: str, k: Optional[int] = None) -> List[int]:
+        """Indices of the top-k chunks for one query"""
+        return self.retrieve_batch([query_text], k)[0]
+
+    def retrieve_batch(self, query_texts: List[str], k: Optional[int] = None) -> List[List[int]]:
+        """Top-k chunk indices for each query, scored in a single matrix multiply"""
+        k = k or self.top_k
+        scores = self._embed(query_texts) @ self.matrix.T
+        return [_top_k(row, k) for row in scores]
+
+    def retrieve_shared(self, query_texts: List[str], k: Optional[int] = None) -> List[int]:
+        """Top-k chunks for a group of queries that share one prompt"""
+        k = k or self.top_k
+        scores = self._embed(query_texts) @ self.matrix.T
+        return _top_k(scores.max(axis=0), k)
+
+    def context_for(self, query_texts: List[str]) -> str:
+        """Guideline context for one or more queries"""
+        if len(query_texts) == 1:
+            indices = self.retrieve(query_texts[0])
+        else:
+            indices = self.retrieve_shared(query_texts)
+        return "\n\n".join(self.chunks[i] for i in indices)
+
+    def contexts_for_each(self, query_texts: List[str]) -> List[str]:
+        """Separate guideline context for each query, retrieved in one batch"""
+        return ["\n\n".join(self.chunks[i] for i in indices) for indices in self.retrieve_batch(query_texts)]
+
+
+class BM25Retriever:
+    """Offline lexical retriever scoring guideline chunks with BM25
+
+    The inverted index stores, for every term, the chunks containing it
+    and their precomputed BM25 term weights, so a lookup is a handful of
+    vector additions with no network access. The index is built once per
+    chunk set and persisted in the processed data directory.
+    """
+
+    def __init__(self, top_k: int = 3, k1: float = 1.5, b: float = 0.75, cache_dir: Optional[Path] = None):
+        self.top_k = top_k
+        self.k1 = k1
+        self.b = b
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.chunks: List[str] = []
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.fingerprint = ""
+
+    @classmethod
+    def from_config(cls, config) -> "BM25Retriever":
+        return cls(top_k=config.retrieval_top_k, k1=config.bm25_k1, b=config.bm25_b,
+                   cache_dir=config.processed_dir)
+
+    @property
+    def cache_token(self) -> str:
+        """Identifies this retrieval setup in classification cache keys"""
+        return f"bm25:{self.k1}:{self.b}:{self.top_k}:{self.fingerprint}"
+
+    def _build_postings(self) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """Inverted index of term -> (chunk ids, BM25 weights)"""
+        doc_terms = [Counter(tokenize(chunk)) for chunk in self.chunks]
+        doc_lengths = np.array([sum(terms.values()) for terms in doc_terms], dtype=np.float32)
+        avg_length = float(doc_lengths.mean()) if len(doc_lengths) and doc_lengths.mean() > 0 else 1.0
+        length_norm = self.k1 * (1 - self.b + self.b * doc_lengths / avg_length)
+
+        term_docs: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_id, terms in enumerate(doc_terms):
+            for term, tf in terms.items():
+                term_docs.setdefault(term, []).append((doc_id, tf))
+
+        num_docs = len(self.chunks)
+        postings = {}
+        for term, entries in term_docs.items():
+            doc_ids = np.array([doc_id for doc_id, _ in entries], dtype=np.int32)
+            tfs = np.array([tf for _, tf in entries], dtype=np.float32)
+            idf = math.log((num_docs - len(entries) + 0.5) / (len(entries) + 0.5) + 1)
+            weights = idf * tfs * (self.k1 + 1) / (tfs + length_norm[doc_ids])
+            postings[term] = (doc_ids, weights.astype(np.float32))
+        return postings
+
+    def index(self, guidelines: Dict[str, Any]):
+        """Build the inverted index, reusing the persisted one when the chunks match"""
+        self.chunks = guidelines["chunks"]
+        self.fingerprint = _chunks_fingerprint(self.chunks, "bm25", repr(self.k1), repr(self.b))
+        cache_file = self.cache_dir / f"guideline_bm25_{self.fingerprint[:16]}.pkl" if self.cache_dir else None
+
+        if cache_file is not None and cache_file.exists():
+            with open(cache_file, "rb") as f:
+                cached = pickle.load(f)
+            if cached.get("fingerprint") == self.fingerprint:
+                self.postings = cached["postings"]
+                return
+
+        logger.info(f"Building BM25 index over {len(self.chunks)} guideline chunks")
+        self.postings = self._build_postings()
+        if cache_file is not None:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(cache_file, "wb") as f:
+                pickle.dump({"fingerprint": self.fingerprint, "postings": self.postings}, f)
+            logger.info(f"BM25 index cached to {cache_file}")
+
+    def score(self, query_text: str) -> np.ndarray:
+        """BM25 score of every chunk for a query"""
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term in set(tokenize(query_text)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                doc_ids, weights = posting
+                scores[doc_ids] += weights
+        return scores
+
+    def _select(self, scores: np.ndarray, k: int) -> List[int]:
+        # Nothing matched - fall back to the leading chunks
+        if not scores.any():
+            return list(range(min(k, len(self.chunks))))
+        return _top_k(scores, k)
+
+    def retrieve(self, query_text: str, k: Optional[int] = None) -> List[int]:
+        """Indices of the top-k chunks for one query"""
+        return self._select(self.score(query_text), k or self.top_k)
+
+    def retrieve_batch(self, query_texts: List[str], k: Optional[int] = None) -> List[List[int]]:
+        """Top-k chunk indices for each query"""
+        return [self.retrieve(text, k) for text in query_texts]
+
+    def retrieve_shared(self, query_texts: List[str], k: Optional[int] = None) -> List[int]:
+        """Top-k chunks for a group of queries that share one prompt"""
+        scores = np.max([self.score(text) for text in query_texts], axis=0)
+        return self._select(scores, k or self.top_k)
+
+    def context_for(self, query_texts: List[str]) -> str:
+        """Guideline context for one or more queries"""
+        if len(query_texts) == 1:
+            indices = self.retrieve(query_texts[0])
+        else:
+            indices = self.retrieve_shared(query_texts)
+        return "\n\n".join(self.chunks[i] for i in indices)
+
+    def contexts_for_each(self, query_texts: List[str]) -> List[str]:
+        """Separate guideline context for each query, retrieved in one batch"""
+        return ["\n\n".join(self.chunks[i] for i in indices) for indices in self.retrieve_batch(query_texts)]
+
+
+def create_retriever(config, client, guidelines: Dict[str, Any], rate_limiter=None, retry_policy=None):
+    """Build and index the retriever selected by `guideline_retrieval` (None = leading chunks)"""
+    mode = config.guideline_retrieval
+    if mode in (None, "", "first"):
+        return None
+    if mode == "embedding":
+        retriever = EmbeddingRetriever.from_config(config, client, rate_limiter, retry_policy)
+    elif mode == "bm25":
+        retriever = BM25Retriever.from_config(config)
+    else:
+        raise ValueError(f"Unknown guideline retrieval mode: {mode}")
+    retriever.index(guidelines)
+    return retriever
@@ -0,0 +1,309 @@
+"""Rules/lexicon pre-classifier that answers unambiguous queries without the LLM"""
+
+import logging
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import yaml
+
+from qcl.data import lexicon
+from qcl.data.prime_categories_mapping import ANNOTATION_SCHEMA, ENTITY_SCHEMA, INTENT_SCHEMA, TOPIC_SCHEMA
+
+logger = logging.getLogger(__name__)
+
+# Lexicon hits are near-certain; pattern hits leave a little more room
+LEXICON_CONFIDENCE = 0.99
+PATTERN_CONFIDENCE = 0.95
+
+# Candidate place text; _place() only accepts names from the gazetteer
+_PLACE = r"(?P<place>[^\W\d_][\w.,' -]{1,60})"
+
+
+def normalize(text: str) -> str:
+    """Casefold, NFKC and whitespace-collapse a query; drop a leading www."""
+    text = " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+    return text[4:] if text.startswith("www.") else text
+
+
+def build_classification(prime_category: str, intents: Iterable[str] = (), topics: Iterable[str] = (),
+                         entities: Optional[Dict[str, List[str]]] = None, notes: str = "",
+                         confidence: float = LEXICON_CONFIDENCE) -> Dict[str, Any]:
+    """Full classification data in the same shape the LLM returns"""
+    intents, topics = set(intents), set(topics)
+    entity_schema = {name: [] for name in ENTITY_SCHEMA}
+    for entity_type, names in (entities or {}).items():
+        entity_schema[entity_type] = list(names)
+    return {
+        "annotation_schema": {name: False for name in ANNOTATION_SCHEMA},
+        "entity_schema": entity_schema,
+        "intent_schema": {name: name in intents for name in INTENT_SCHEMA},
+        "topic_schema": {name: name in topics for name in TOPIC_SCHEMA},
+        "prime_category": prime_category,
+        "research_notes": notes,
+        "confidence_score": confidence
+    }
+
+
+class PhraseTrie:
+    """Token trie mapping phrases to values"""
+
+    _END = None  # key under which a node stores the value of the phrase ending there
+
+    def __init__(self):
+        self._root: Dict[Any, Any] = {}
+        self.size = 0
+
+    def add(self, phrase: str, value: Any):
+        node = self._root
+        for token in phrase.split():
+            node = node.setdefault(token, {})
+        if self._END not in node:
+            self.size += 1
+        node[self._END] = value
+
+    def longest(self, tokens: List[str], start: int = 0) -> Optional[Tuple[int, Any]]:
+        """(end, value) of the longest phrase starting at tokens[start], if any"""
+        node = self._root
+        match = None
+        for position in range(start, len(tokens)):
+            node = node.get(tokens[position])
+            if node is None:
+                break
+            if self._END in node:
+                match = (position + 1, node[self._END])
+        return match
+
+    def covers(self, tokens: List[str], start: int = 0) -> Optional[List[Any]]:
+        """Values of consecutive phrases covering tokens[start:] exactly, or None"""
+        values = []
+        while start < len(tokens):
+            match = self.longest(tokens, start)
+            if match is None:
+                return None
+            start, value = match
+            values.append(value)
+        return values
+
+
+@dataclass
+class LexiconEntry:
+    """A known site or chain"""
+    name: str
+    domain: str
+    organization: str = ""
+    topics: List[str] = field(default_factory=list)
+    kind: str = "site"  # "site", "chain" or "adult"
+
+
+@dataclass
+class RulesStats:
+    """How many queries the fast path answered, and how quickly"""
+    checked: int = 0
+    matched: int = 0
+    seconds: float = 0.0
+    by_rule: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.matched / self.checked if self.checked else 0.0
+
+    @property
+    def microseconds_per_query(self) -> float:
+        return self.seconds / self.checked * 1e6 if self.checked else 0.0
+
+
+class RulesClassifier:
+    """Classifies navigational and QUICKFACT queries from a compiled lexicon
+
+    A query matches only when it is entirely a known site or chain (or one
+    of its domains/aliases), optionally followed by modifiers such as
+    "login" or "near me", or when it fits a QUICKFACT pattern (weather,
+    time, unit conversion, zip code) naming a place from the gazetteer.
+    Everything else returns None and goes to the LLM.
+    """
+
+    def __init__(self, entries: Iterable[LexiconEntry], aliases: Optional[Dict[str, str]] = None,
+                 places: Optional[Iterable[str]] = None):
+        self.names = PhraseTrie()
+        by_name = {}
+        for entry in entries:
+            by_name[entry.name] = entry
+            self.names.add(entry.name, entry)
+        for entry in by_name.values():
+            # A bare domain belongs to the first entry hosted on it
+            domain = entry.domain.split("/")[0]
+            if self.names.longest([domain]) is None:
+                self.names.add(domain, entry)
+        for alias, name in (aliases or {}).items():
+            if name in by_name:
+                self.names.add(alias, by_name[name])
+
+        self.places = PhraseTrie()
+        for place in lexicon.STATE_ABBREVIATIONS:
+            self.places.add(place, "abbreviation")
+        for place in lexicon.REGIONS:
+            self.places.add(place, "region")
+        for place in list(lexicon.CITIES) + list(places or []):
+            self.places.add(normalize(place), "city")
+
+        self.modifiers = PhraseTrie()
+        for modifier in lexicon.SITE_MODIFIERS:
+            self.modifiers.add(modifier, "site")
+        for modifier in lexicon.LOCAL_MODIFIERS:
+            self.modifiers.add(modifier, "local")
+
+        units = "|".join(re.escape(unit) for unit in sorted(lexicon.UNITS, key=len, reverse=True))
+        amount = r"(?:\d+(?:[.,]\d+)?|a|an|one)"
+        self.patterns = [
+            ("zip_code", re.compile(r"^\d{5}(?:-\d{4})?$"), self._zip_code),
+            ("zip_code", re.compile(rf"^(?:zip code|zipcode|zip|postal code)(?: (?:for|of|in))? {_PLACE}$"), self._zip_code),
+            ("zip_code", re.compile(rf"^{_PLACE} (?:zip code|zipcode|zip|postal code)$"), self._zip_code),
+            ("weather", re.compile(r"^(?:weather|forecast|weather forecast|weather today|weather tomorrow)$"), self._weather),
+            ("weather", re.compile(rf"^(?:weather|forecast|weather forecast)(?: (?:in|for|at))? {_PLACE}$"), self._weather),
+            ("weather", re.compile(rf"^{_PLACE} (?:weather|forecast|weather forecast)$"), self._weather),
+            ("time", re.compile(rf"^(?:what time is it|current time|local time|time now|time)(?: now)? in {_PLACE}$"), self._time),
+            ("time", re.compile(r"^(?:what time is it|what's the time|current time)(?: now)?$"), self._time),
+            ("conversion", re.compile(rf"^(?:convert )?(?:{amount} ?)?(?P<source>{units}) (?:to|in|into|=) (?P<target>{units})$"),
+             self._conversion),
+            ("conversion", re.compile(rf"^how many (?P<target>{units}) (?:are )?in (?:{amount} )?(?P<source>{units})$"),
+             self._conversion),
+        ]
+
+        self.stats = RulesStats()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> "RulesClassifier":
+        sites = dict(lexicon.SITES)
+        chains = dict(lexicon.CHAINS)
+        adult_sites = dict(lexicon.ADULT_SITES)
+        aliases = dict(lexicon.ALIASES)
+        places = []
+
+        if config.rules_lexicon_file:
+            with open(config.rules_lexicon_file, "r", encoding="utf-8") as f:
+                extra = yaml.safe_load(f) or {}
+            sites.update(extra.get("sites") or {})
+            chains.update(extra.get("chains") or {})
+            adult_sites.update(extra.get("adult_sites") or {})
+            aliases.update(extra.get("aliases") or {})
+            places += extra.get("places") or []
+            logger.info(f"Loaded lexicon additions from {config.rules_lexicon_file}")
+
+        entries = [LexiconEntry(name, domain, organization, list(topics), "site")
+                   for name, (domain, organization, topics) in sites.items()]
+        entries += [LexiconEntry(name, domain, organization, list(topics), "chain")
+                    for name, (domain, organization, topics) in chains.items()]
+        entries += [LexiconEntry(name, domain, kind="adult") for name, domain in adult_sites.items()]
+        return cls(entries, aliases, places)
+
+    def classify(self, query_text: str) -> Optional[Dict[str, Any]]:
+        """Classification data for an unambiguous query, or None to use the LLM"""
+        start = time.perf_counter()
+        text = normalize(query_text)
+        rule, data = self._match_lexicon(text)
+        if data is None:
+            rule, data = self._match_patterns(text)
+        if data is not None:
+            data["research_notes"] = f"Rules fast path: {data['research_notes']}"
+
+        with self._lock:
+            self.stats.checked += 1
+            self.stats.seconds += time.perf_counter() - start
+            if data is not None:
+                self.stats.matched += 1
+                self.stats.by_rule[rule] = self.stats.by_rule.get(rule, 0) + 1
+        return data
+
+    def _match_lexicon(self, text: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        tokens = text.split()
+        match = self.names.longest(tokens)
+        if match is None:
+            return "", None
+        end, entry = match
+        modifiers = self.modifiers.covers(tokens, end)
+        if modifiers is None:
+            return "", None
+
+        if entry.kind == "adult":
+            return "adult_site", build_classification(
+                "OTHER_Adult", intents=["website", "porn_illegal", "images_videos"],
+                entities={"website": [entry.domain]}, notes=f"known adult site {entry.domain}"
+            )
+
+        entities = {"website": [entry.domain]}
+        if entry.organization:
+            entities["specific_organization"] = [entry.organization]
+        if entry.kind == "chain" and "local" in modifiers:
+            return "local_chain", build_classification(
+                "Local_Chain", intents=["local_info"], topics=entry.topics, entities=entities,
+                notes=f"store lookup for chain {entry.organization or entry.name}"
+            )
+        if "local" in modifiers:
+            # "near me" after a site that is not a chain is not navigational
+            return "", None
+        return "site", build_classification(
+            "Navigational", intents=["website"], topics=entry.topics, entities=entities,
+            notes=f"navigational query for {entry.domain}"
+        )
+
+    def _match_patterns(self, text: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        for rule, pattern, build in self.patterns:
+            match = pattern.match(text)
+            if match is None:
+                continue
+            data = build(match)
+            if data is not None:
+                return rule, data
+        return "", None
+
+    def _place(self, match: re.Match) -> Optional[Dict[str, List[str]]]:
+        """Place entities for the matched place; None unless it is in the gazetteer
+
+        A place is a city or region, optionally qualified by a region or
+        state abbreviation ("austin tx", "paris, france").
+        """
+        place = match.groupdict().get("place")
+        if not place:
+            return {}
+        place = place.strip(" ,")
+        kinds = self.places.covers(place.replace(",", " ").split())
+        if not kinds or len(kinds) > 2 or kinds[0] == "abbreviation":
+            return None
+        if len(kinds) == 2 and kinds[1] == "city":
+            return None
+        entity_type = "specific_place_city" if kinds[0] == "city" else "specific_place_other"
+        return {entity_type: [place]}
+
+    def _zip_code(self, match: re.Match) -> Optional[Dict[str, Any]]:
+        entities = self._place(match)
+        if entities is None:
+            return None
+        return build_classification("QUICKFACT_Zip_Code", intents=["simple_fact"],
+                                    entities=entities or {"specific_place_address": [match.group(0)]},
+                                    notes="zip code lookup", confidence=PATTERN_CONFIDENCE)
+
+    def _weather(self, match: re.Match) -> Optional[Dict[str, Any]]:
+        entities = self._place(match)
+        if entities is None:
+            return None
+        return build_classification("Weather", intents=["simple_fact"], topics=["weather"], entities=entities,
+                                    notes="weather lookup", confidence=PATTERN_CONFIDENCE)
+
+    def _time(self, match: re.Match) -> Optional[Dict[str, Any]]:
+        entities = self._place(match)
+        if entities is None:
+            return None
+        return build_classification("QUICKFACT_Time", intents=["simple_fact"], entities=entities,
+                                    notes="current time lookup", confidence=PATTERN_CONFIDENCE)
+
+    def _conversion(self, match: re.Match) -> Optional[Dict[str, Any]]:
+        if match.group("source") == match.group("target"):
+            return None
+        return build_classification("QUICKFACT_Conversion", intents=["simple_fact"],
+                                    notes=f"unit conversion {match.group('source')} to {match.group('target')}",
+                                    confidence=PATTERN_CONFIDENCE)
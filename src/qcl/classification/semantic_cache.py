@@ -0,0 +1,388 @@
+"""Semantic cache: reuse the classification of a near-duplicate earlier query"""
+
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .local_model import HashedNgramVectorizer
+from .retrieval import embed_texts
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per matrix product when (re)assigning vectors to clusters
+_ASSIGN_BLOCK = 65536
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+class NgramEmbedder:
+    """Offline embedding from hashed word and character n-grams
+
+    Typos and extra words keep most of a query's character n-grams, so
+    "amazn prime" stays close to "amazon prime" without any API call.
+    Binary n-gram vectors give lower cosines than dense embeddings: a typo
+    or an extra word scores about 0.78-0.88, while related but different
+    queries ("amazon prime" vs "amazon music") stay below 0.7.
+    """
+
+    # Calibrated on near-duplicate pairs like "amazon prime" / "amazn prime" (0.783)
+    default_threshold = 0.78
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+        self.vectorizer = HashedNgramVectorizer(n_features=dimensions, word_ngrams=1, char_ngrams=(2, 4))
+
+    @property
+    def name(self) -> str:
+        return f"ngram{self.dimensions}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        indices, indptr, _ = self.vectorizer.transform(texts)
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        matrix[np.repeat(np.arange(len(texts)), np.diff(indptr)), indices] = 1.0
+        return _unit_rows(matrix)
+
+
+class OpenAIEmbedder:
+    """Embedding from the OpenAI embeddings API (one request per lookup)"""
+
+    # Starting point for text-embedding-3 models; check the audit false-reuse rate
+    default_threshold = 0.85
+
+    def __init__(self, client, model: str = "text-embedding-3-small", rate_limiter=None, retry_policy=None):
+        # RetryPolicy does the retrying, so the SDK's own retries are off
+        self.client = client.with_options(max_retries=0) if retry_policy is not None else client
+        self.model = model
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+
+    @property
+    def name(self) -> str:
+        return self.model
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return embed_texts(self.client, self.model, list(texts), self.rate_limiter, self.retry_policy)
+
+
+class VectorIndex:
+    """Approximate nearest-neighbour index over unit vectors (inner product)
+
+    While the index holds at most `exact_limit` rows a lookup is one exact
+    matrix-vector product. Past that the rows are clustered with spherical
+    k-means into about sqrt(n) lists (IVF) and a lookup only scores the
+    rows in the `nprobe` lists whose centroids are nearest the query.
+    Centroids are retrained each time the index doubles in size.
+    """
+
+    def __init__(self, dimensions: int, exact_limit: int = 20000, nprobe: int = 8):
+        self.dimensions = dimensions
+        self.exact_limit = exact_limit
+        self.nprobe = nprobe
+        self.keys: List[str] = []
+        self.texts: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        self._rows: Dict[str, int] = {}
+        self._vectors = np.zeros((1024, dimensions), dtype=np.float32)
+        self._lists = np.zeros(1024, dtype=np.int32)
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    def add(self, vector: np.ndarray, key: str, text: str):
+        if key in self._rows:
+            return
+        size = len(self.keys)
+        if size == len(self._vectors):
+            self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+            self._lists = np.concatenate([self._lists, np.zeros_like(self._lists)])
+        self._vectors[size] = vector
+        if self.centroids is not None:
+            self._lists[size] = int(np.argmax(self.centroids @ vector))
+        self._rows[key] = size
+        self.keys.append(key)
+        self.texts.append(text)
+        if size + 1 > self.exact_limit and size + 1 >= 2 * self._trained_size:
+            self.train()
+
+    def search(self, vector: np.ndarray) -> Optional[Tuple[int, float]]:
+        """(row, similarity) of the nearest stored vector, or None if nothing is in reach"""
+        size = len(self.keys)
+        if not size:
+            return None
+        vectors = self._vectors[:size]
+        if self.centroids is None:
+            scores = vectors @ vector
+            best = int(np.argmax(scores))
+            return best, float(scores[best])
+
+        centroid_scores = self.centroids @ vector
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        candidates = np.flatnonzero(np.isin(self._lists[:size], probes))
+        if not len(candidates):
+            return None
+        scores = vectors[candidates] @ vector
+        best = int(np.argmax(scores))
+        return int(candidates[best]), float(scores[best])
+
+    def train(self, iterations: int = 10, seed: int = 0):
+        """Cluster the stored vectors into IVF lists"""
+        start = time.time()
+        size = len(self.keys)
+        vectors = self._vectors[:size]
+        n_lists = max(1, int(np.sqrt(size)))
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(size, min(size, 64 * n_lists), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # An empty cluster keeps its previous centroid
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+
+        for block in range(0, size, _ASSIGN_BLOCK):
+            end = min(block + _ASSIGN_BLOCK, size)
+            self._lists[block:end] = np.argmax(vectors[block:end] @ centroids.T, axis=1)
+        self.centroids = centroids
+        self._trained_size = size
+        logger.info(f"Trained semantic index: {size} queries in {n_lists} lists ({time.time() - start:.2f}s)")
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        size = len(self.keys)
+        arrays = {
+            "vectors": self._vectors[:size],
+            "keys": np.array(self.keys, dtype=str),
+            "texts": np.array(self.texts, dtype=str),
+            "lists": self._lists[:size],
+            "centroids": self.centroids if self.centroids is not None else np.zeros((0, self.dimensions), np.float32),
+            "trained_size": np.array(self._trained_size),
+        }
+        # Write next to the target and swap in, so a crash never leaves a torn index
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: Path, dimensions: int, exact_limit: int = 20000, nprobe: int = 8) -> "VectorIndex":
+        index = cls(dimensions, exact_limit=exact_limit, nprobe=nprobe)
+        with np.load(path, allow_pickle=False) as data:
+            vectors = data["vectors"]
+            if vectors.shape[1] != dimensions:
+                raise ValueError(f"Semantic index {path} has {vectors.shape[1]}-d vectors, expected {dimensions}")
+            capacity = max(1024, len(vectors))
+            index._vectors = np.zeros((capacity, dimensions), dtype=np.float32)
+            index._vectors[:len(vectors)] = vectors
+            index._lists = np.zeros(capacity, dtype=np.int32)
+            index._lists[:len(vectors)] = data["lists"]
+            index.keys = data["keys"].tolist()
+            index.texts = data["texts"].tolist()
+            index.centroids = data["centroids"] if len(data["centroids"]) else None
+            index._trained_size = int(data["trained_size"])
+        index._rows = {key: row for row, key in enumerate(index.keys)}
+        return index
+
+
+@dataclass
+class SemanticHit:
+    """A near-duplicate's cached classification"""
+    data: Dict[str, Any]
+    neighbour_text: str
+    similarity: float
+
+    def reused_data(self) -> Dict[str, Any]:
+        """The classification to give the new query
+
+        Entities and research notes describe the neighbour's text, so the
+        entities are cleared and the notes say where the answer came from.
+        """
+        data = dict(self.data)
+        data["entity_schema"] = {name: [] for name in self.data.get("entity_schema") or {}}
+        data["research_notes"] = (f"Semantic cache: reused the classification of '{self.neighbour_text}' "
+                                  f"(similarity {self.similarity:.3f}); entities not extracted")
+        return data
+
+
+@dataclass
+class SemanticAudit:
+    """A sampled hit that was classified anyway, to check the reuse"""
+    query_text: str
+    neighbour_text: str
+    similarity: float
+    cached_category: str
+    fresh_category: str
+
+    @property
+    def agrees(self) -> bool:
+        return self.cached_category == self.fresh_category
+
+
+@dataclass
+class SemanticCacheStats:
+    """Lookups, hits and reuse audits for a run"""
+    lookups: int = 0
+    hits: int = 0
+    stale: int = 0  # neighbour found but its exact cache entry was evicted
+    seconds: float = 0.0
+    similarity_total: float = 0.0
+    audits: List[SemanticAudit] = field(default_factory=list)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    @property
+    def mean_similarity(self) -> float:
+        return self.similarity_total / self.hits if self.hits else 0.0
+
+    @property
+    def microseconds_per_lookup(self) -> float:
+        return self.seconds / self.lookups * 1e6 if self.lookups else 0.0
+
+    @property
+    def false_reuse(self) -> int:
+        return sum(1 for audit in self.audits if not audit.agrees)
+
+    @property
+    def false_reuse_rate(self) -> float:
+        """Share of audited hits whose fresh PRIME category differed from the reused one"""
+        return self.false_reuse / len(self.audits) if self.audits else 0.0
+
+
+class SemanticCache:
+    """Reuses the cached answer of the nearest previously classified query
+
+    Sits behind the exact ClassificationCache: on an exact miss the query
+    is embedded and looked up in a vector index of earlier queries, and
+    the neighbour's cached classification is reused when their cosine
+    similarity is at least `threshold` (by default the embedder's
+    calibrated `default_threshold`). Each prompt/model setup (cache
+    namespace) has its own index file. A random `audit_rate` share of hits
+    is classified anyway so the false-reuse rate can be measured.
+    """
+
+    def __init__(self, cache, embedder, index_dir: Path, threshold: Optional[float] = None, audit_rate: float = 0.05,
+                 exact_limit: int = 20000, nprobe: int = 8, save_every: int = 1000, seed: Optional[int] = None):
+        self.cache = cache
+        self.embedder = embedder
+        self.index_dir = Path(index_dir)
+        self.threshold = threshold if threshold is not None else embedder.default_threshold
+        self.audit_rate = audit_rate
+        self.exact_limit = exact_limit
+        self.nprobe = nprobe
+        self.save_every = save_every
+        self.stats = SemanticCacheStats()
+        self._indexes: Dict[str, VectorIndex] = {}
+        self._unsaved: Dict[str, int] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, cache, client, rate_limiter=None, retry_policy=None) -> "SemanticCache":
+        if config.semantic_cache_embedder == "openai":
+            embedder = OpenAIEmbedder(client, config.embedding_model, rate_limiter, retry_policy)
+        else:
+            embedder = NgramEmbedder(config.semantic_cache_dimensions)
+        return cls(
+            cache,
+            embedder,
+            config.processed_dir,
+            threshold=config.semantic_cache_threshold,
+            audit_rate=config.semantic_cache_audit_rate,
+            exact_limit=config.semantic_cache_exact_limit,
+            nprobe=config.semantic_cache_nprobe
+        )
+
+    def _index_file(self, namespace: str) -> Path:
+        return self.index_dir / f"semantic_index_{self.embedder.name}_{namespace[:16]}.npz"
+
+    def _index(self, namespace: str, dimensions: int) -> VectorIndex:
+        """The namespace's index, loaded from disk on first use (call with the lock held)"""
+        index = self._indexes.get(namespace)
+        if index is None:
+            index_file = self._index_file(namespace)
+            if index_file.exists():
+                index = VectorIndex.load(index_file, dimensions, self.exact_limit, self.nprobe)
+                logger.info(f"Loaded semantic index with {len(index)} queries from {index_file}")
+            else:
+                index = VectorIndex(dimensions, self.exact_limit, self.nprobe)
+            self._indexes[namespace] = index
+        return index
+
+    def lookup(self, query_text: str, namespace: str) -> Optional[SemanticHit]:
+        """Cached classification of a near-duplicate of the query, or None"""
+        start = time.perf_counter()
+        vector = self.embedder.embed([query_text])[0]
+        with self._lock:
+            index = self._index(namespace, len(vector))
+            match = index.search(vector)
+            key = text = None
+            similarity = 0.0
+            if match is not None and match[1] >= self.threshold:
+                key, text, similarity = index.keys[match[0]], index.texts[match[0]], match[1]
+
+        data = self.cache.get(key, record_stats=False) if key is not None else None
+        with self._lock:
+            self.stats.lookups += 1
+            self.stats.seconds += time.perf_counter() - start
+            if key is not None and data is None:
+                self.stats.stale += 1
+            if data is None:
+                return None
+            self.stats.hits += 1
+            self.stats.similarity_total += similarity
+        return SemanticHit(data, text, similarity)
+
+    def should_audit(self) -> bool:
+        """Whether to classify this hit anyway and compare"""
+        with self._lock:
+            return self._random.random() < self.audit_rate
+
+    def record_audit(self, query_text: str, hit: SemanticHit, cached_category: str, fresh_category: str):
+        audit = SemanticAudit(query_text, hit.neighbour_text, hit.similarity, cached_category, fresh_category)
+        if not audit.agrees:
+            logger.warning(f"Semantic cache false reuse: '{query_text}' ~ '{hit.neighbour_text}' "
+                           f"({hit.similarity:.3f}) cached {cached_category}, fresh {fresh_category}")
+        with self._lock:
+            self.stats.audits.append(audit)
+
+    def add(self, query_text: str, key: str, namespace: str):
+        """Index a query whose classification was just stored in the exact cache under `key`"""
+        vector = self.embedder.embed([query_text])[0]
+        with self._lock:
+            index = self._index(namespace, len(vector))
+            if key in index:
+                return
+            index.add(vector, key, query_text)
+            self._unsaved[namespace] = self._unsaved.get(namespace, 0) + 1
+            if self._unsaved[namespace] >= self.save_every:
+                self._save(namespace)
+
+    def _save(self, namespace: str):
+        self._indexes[namespace].save(self._index_file(namespace))
+        self._unsaved[namespace] = 0
+
+    def close(self):
+        """Persist any indexes with unsaved additions"""
+        with self._lock:
+            for namespace, unsaved in self._unsaved.items():
+                if unsaved:
+                    self._save(namespace)
+                    logger.info(f"Saved semantic index with {len(self._indexes[namespace])} queries "
+                                f"to {self._index_file(namespace)}")
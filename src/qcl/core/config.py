@@ -4,7 +4,7 @@ import os
 import yaml
 from pathlib import Path
 from typing import Dict, Any, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -21,19 +21,111 @@ class Config:
     # OpenAI
     openai_api_key: str = ""
     openai_model: str = "gpt-4.1"
+    openai_base_url: Optional[str] = None
     max_tokens: int = 4000
     temperature: float = 0.1
+    structured_outputs: bool = False  # send a JSON Schema response_format
+    compact_responses: bool = False  # model lists only what applies; expanded locally
     
     # Processing
     batch_size: int = 10
+    batched_prompts: bool = False
     max_queries: Optional[int] = None
+    csv_chunk_size: int = 10000
     chunk_size: int = 800
     chunk_overlap: int = 400
+    guidelines_cache: bool = True
+    pdf_workers: int = 0  # 0 = one extraction process per core
+    chunk_mode: str = "words"  # "words" (chunk_size/chunk_overlap) or "tokens"
+    chunk_tokens: int = 512
+    chunk_token_overlap: int = 64
+    chunk_respect_headings: bool = True
+    
+    # Guideline retrieval ("first" = leading chunks, "embedding", "bm25")
+    guideline_retrieval: str = "first"
+    retrieval_top_k: int = 3
+    embedding_model: str = "text-embedding-3-small"
+    bm25_k1: float = 1.5
+    bm25_b: float = 0.75
+    
+    # Query deduplication
+    dedupe_queries: bool = True
+    dedupe_lowercase: bool = True
+    dedupe_collapse_whitespace: bool = True
+    dedupe_unicode_nfkc: bool = True
 
     # Rate limiting
     requests_per_minute: int = 50
+    tokens_per_minute: Optional[int] = None  # None = taken from the API's rate-limit headers
+    expected_completion_tokens: int = 400  # per query, reserved until real completions are seen
     concurrent_requests: int = 5
-    retry_attempts: int = 3
+    adaptive_concurrency: bool = False
+    min_concurrent_requests: int = 1
+    max_concurrent_requests: int = 50
+    latency_p95_target: Optional[float] = None  # None = relative to the best observed p50
+    max_error_rate: float = 0.05
+    retry_attempts: int = 3  # retries after the first attempt
+    retry_base_delay: float = 1.0
+    retry_max_delay: float = 60.0
+    
+    # HTTP connection pool
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 50
+    http_keepalive_expiry: float = 30.0
+    http_connect_timeout: float = 5.0
+    http_read_timeout: float = 120.0
+    http2: bool = True
+    
+    # Rules/lexicon fast path ahead of the LLM
+    rules_enabled: bool = False
+    rules_lexicon_file: Optional[Path] = None  # YAML additions to the built-in lexicon
+    
+    # Local model distilled from past classifications
+    local_model_enabled: bool = False
+    local_model_path: Path = Path("data/processed/local_model.npz")
+    local_model_features: int = 65536  # hashed n-gram buckets
+    local_model_epochs: int = 15
+    local_model_precision: float = 0.9  # held-out precision the confidence threshold is calibrated to
+    
+    # Semantic cache: reuse the cached answer of a near-duplicate query
+    semantic_cache_enabled: bool = False
+    semantic_cache_embedder: str = "ngram"  # "ngram" (offline) or "openai" (embedding_model)
+    semantic_cache_dimensions: int = 512  # ngram embedder only
+    semantic_cache_threshold: Optional[float] = None  # minimum cosine similarity; None = the embedder's calibrated default
+    semantic_cache_audit_rate: float = 0.05  # share of hits classified anyway to measure false reuse
+    semantic_cache_exact_limit: int = 20000  # exact scan up to this many indexed queries, IVF beyond
+    semantic_cache_nprobe: int = 8  # IVF lists scored per lookup
+    
+    # Model cascade: a cheaper model first, escalating low-confidence or invalid answers
+    cascade_enabled: bool = False
+    cascade_model: str = "gpt-4.1-mini"
+    cascade_threshold: float = 0.85  # cheaper-tier answers below this confidence go to openai_model
+    # USD per 1M tokens, used for per-tier cost reports
+    model_prices: Dict[str, Dict[str, float]] = field(default_factory=lambda: {
+        "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+        "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+        "gpt-4.1-nano": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+    })
+    
+    # Hedged requests
+    hedge_requests: bool = False
+    hedge_percentile: float = 0.95  # hedge calls slower than this share of recent ones
+    hedge_budget: float = 0.05  # at most this share of calls get a duplicate
+    hedge_min_samples: int = 20
+    
+    # OpenAI Batch API
+    batch_api_max_requests: int = 50000
+    batch_api_poll_interval: float = 60.0
+    
+    # Result cache
+    cache_enabled: bool = True
+    cache_max_entries: Optional[int] = 100000
+    cache_max_age_days: Optional[float] = 30
+    
+    # Output checkpointing
+    checkpoint_fsync_every: int = 50
+    checkpoint_fsync_interval: float = 5.0
+    compact_output: bool = True
     
     # Paths
     data_dir: Path = Path("data")
@@ -65,6 +157,7 @@ class Config:
         self.openai_api_key = os.getenv("OPENAI_API_KEY", "")
         self.environment = os.getenv("QCL_ENV", "development")
         self.debug = os.getenv("QCL_DEBUG", "true").lower() == "true"
+        self.openai_base_url = os.getenv("OPENAI_BASE_URL") or None
         
         if os.getenv("BATCH_SIZE"):
             self.batch_size = int(os.getenv("BATCH_SIZE"))
@@ -72,6 +165,8 @@ class Config:
             self.max_queries = int(os.getenv("MAX_QUERIES"))
         if os.getenv("REQUESTS_PER_MINUTE"):
             self.requests_per_minute = int(os.getenv("REQUESTS_PER_MINUTE"))
+        if os.getenv("TOKENS_PER_MINUTE"):
+            self.tokens_per_minute = int(os.getenv("TOKENS_PER_MINUTE"))
     
     def _load_from_file(self):
         """Load settings from YAML config file"""
@@ -85,21 +180,124 @@ class Config:
                 if 'openai' in config_data:
                     openai_config = config_data['openai']
                     self.openai_model = openai_config.get('model', self.openai_model)
+                    self.openai_base_url = openai_config.get('base_url', self.openai_base_url)
                     self.max_tokens = openai_config.get('max_tokens', self.max_tokens)
                     self.temperature = openai_config.get('temperature', self.temperature)
+                    self.structured_outputs = openai_config.get('structured_outputs', self.structured_outputs)
+                    self.compact_responses = openai_config.get('compact_responses', self.compact_responses)
                 
                 if 'processing' in config_data:
                     proc_config = config_data['processing']
                     self.batch_size = proc_config.get('batch_size', self.batch_size)
+                    self.batched_prompts = proc_config.get('batched_prompts', self.batched_prompts)
                     self.max_queries = proc_config.get('max_queries', self.max_queries)
+                    self.csv_chunk_size = proc_config.get('csv_chunk_size', self.csv_chunk_size)
                     self.chunk_size = proc_config.get('chunk_size', self.chunk_size)
                     self.chunk_overlap = proc_config.get('chunk_overlap', self.chunk_overlap)
+                    self.guidelines_cache = proc_config.get('guidelines_cache', self.guidelines_cache)
+                    self.pdf_workers = proc_config.get('pdf_workers', self.pdf_workers)
+                    self.chunk_mode = proc_config.get('chunk_mode', self.chunk_mode)
+                    self.chunk_tokens = proc_config.get('chunk_tokens', self.chunk_tokens)
+                    self.chunk_token_overlap = proc_config.get('chunk_token_overlap', self.chunk_token_overlap)
+                    self.chunk_respect_headings = proc_config.get('chunk_respect_headings', self.chunk_respect_headings)
+                
+                if 'retrieval' in config_data:
+                    retrieval_config = config_data['retrieval']
+                    self.guideline_retrieval = retrieval_config.get('mode', self.guideline_retrieval)
+                    self.retrieval_top_k = retrieval_config.get('top_k', self.retrieval_top_k)
+                    self.embedding_model = retrieval_config.get('embedding_model', self.embedding_model)
+                    self.bm25_k1 = retrieval_config.get('bm25_k1', self.bm25_k1)
+                    self.bm25_b = retrieval_config.get('bm25_b', self.bm25_b)
+                
+                if 'dedupe' in config_data:
+                    dedupe_config = config_data['dedupe']
+                    self.dedupe_queries = dedupe_config.get('enabled', self.dedupe_queries)
+                    self.dedupe_lowercase = dedupe_config.get('lowercase', self.dedupe_lowercase)
+                    self.dedupe_collapse_whitespace = dedupe_config.get('collapse_whitespace', self.dedupe_collapse_whitespace)
+                    self.dedupe_unicode_nfkc = dedupe_config.get('unicode_nfkc', self.dedupe_unicode_nfkc)
                 
                 if 'rate_limit' in config_data:
                     rate_config = config_data['rate_limit']
                     self.requests_per_minute = rate_config.get('requests_per_minute', self.requests_per_minute)
+                    self.tokens_per_minute = rate_config.get('tokens_per_minute', self.tokens_per_minute)
+                    self.expected_completion_tokens = rate_config.get('expected_completion_tokens',
+                                                                      self.expected_completion_tokens)
                     self.concurrent_requests = rate_config.get('concurrent_requests', self.concurrent_requests)
+                    self.adaptive_concurrency = rate_config.get('adaptive_concurrency', self.adaptive_concurrency)
+                    self.min_concurrent_requests = rate_config.get('min_concurrent_requests', self.min_concurrent_requests)
+                    self.max_concurrent_requests = rate_config.get('max_concurrent_requests', self.max_concurrent_requests)
+                    self.latency_p95_target = rate_config.get('latency_p95_target', self.latency_p95_target)
+                    self.max_error_rate = rate_config.get('max_error_rate', self.max_error_rate)
                     self.retry_attempts = rate_config.get('retry_attempts', self.retry_attempts)
+                    self.retry_base_delay = rate_config.get('retry_base_delay', self.retry_base_delay)
+                    self.retry_max_delay = rate_config.get('retry_max_delay', self.retry_max_delay)
+                
+                if 'http' in config_data:
+                    http_config = config_data['http']
+                    self.http_max_connections = http_config.get('max_connections', self.http_max_connections)
+                    self.http_max_keepalive_connections = http_config.get('max_keepalive_connections', self.http_max_keepalive_connections)
+                    self.http_keepalive_expiry = http_config.get('keepalive_expiry', self.http_keepalive_expiry)
+                    self.http_connect_timeout = http_config.get('connect_timeout', self.http_connect_timeout)
+                    self.http_read_timeout = http_config.get('read_timeout', self.http_read_timeout)
+                    self.http2 = http_config.get('http2', self.http2)
+                
+                if 'rules' in config_data:
+                    rules_config = config_data['rules']
+                    self.rules_enabled = rules_config.get('enabled', self.rules_enabled)
+                    lexicon_file = rules_config.get('lexicon_file')
+                    if lexicon_file:
+                        self.rules_lexicon_file = Path(lexicon_file)
+                
+                if 'local_model' in config_data:
+                    local_config = config_data['local_model']
+                    self.local_model_enabled = local_config.get('enabled', self.local_model_enabled)
+                    self.local_model_path = Path(local_config.get('path', self.local_model_path))
+                    self.local_model_features = local_config.get('features', self.local_model_features)
+                    self.local_model_epochs = local_config.get('epochs', self.local_model_epochs)
+                    self.local_model_precision = local_config.get('precision', self.local_model_precision)
+                
+                if 'semantic_cache' in config_data:
+                    semantic_config = config_data['semantic_cache']
+                    self.semantic_cache_enabled = semantic_config.get('enabled', self.semantic_cache_enabled)
+                    self.semantic_cache_embedder = semantic_config.get('embedder', self.semantic_cache_embedder)
+                    self.semantic_cache_dimensions = semantic_config.get('dimensions', self.semantic_cache_dimensions)
+                    self.semantic_cache_threshold = semantic_config.get('threshold', self.semantic_cache_threshold)
+                    self.semantic_cache_audit_rate = semantic_config.get('audit_rate', self.semantic_cache_audit_rate)
+                    self.semantic_cache_exact_limit = semantic_config.get('exact_limit', self.semantic_cache_exact_limit)
+                    self.semantic_cache_nprobe = semantic_config.get('nprobe', self.semantic_cache_nprobe)
+                
+                if 'cascade' in config_data:
+                    cascade_config = config_data['cascade']
+                    self.cascade_enabled = cascade_config.get('enabled', self.cascade_enabled)
+                    self.cascade_model = cascade_config.get('model', self.cascade_model)
+                    self.cascade_threshold = cascade_config.get('threshold', self.cascade_threshold)
+                
+                if 'pricing' in config_data:
+                    self.model_prices.update(config_data['pricing'] or {})
+                
+                if 'hedging' in config_data:
+                    hedge_config = config_data['hedging']
+                    self.hedge_requests = hedge_config.get('enabled', self.hedge_requests)
+                    self.hedge_percentile = hedge_config.get('percentile', self.hedge_percentile)
+                    self.hedge_budget = hedge_config.get('budget', self.hedge_budget)
+                    self.hedge_min_samples = hedge_config.get('min_samples', self.hedge_min_samples)
+                
+                if 'batch_api' in config_data:
+                    batch_api_config = config_data['batch_api']
+                    self.batch_api_max_requests = batch_api_config.get('max_requests_per_job', self.batch_api_max_requests)
+                    self.batch_api_poll_interval = batch_api_config.get('poll_interval', self.batch_api_poll_interval)
+                
+                if 'output' in config_data:
+                    output_config = config_data['output']
+                    self.checkpoint_fsync_every = output_config.get('fsync_every', self.checkpoint_fsync_every)
+                    self.checkpoint_fsync_interval = output_config.get('fsync_interval', self.checkpoint_fsync_interval)
+                    self.compact_output = output_config.get('compact', self.compact_output)
+                
+                if 'cache' in config_data:
+                    cache_config = config_data['cache']
+                    self.cache_enabled = cache_config.get('enabled', self.cache_enabled)
+                    self.cache_max_entries = cache_config.get('max_entries', self.cache_max_entries)
+                    self.cache_max_age_days = cache_config.get('max_age_days', self.cache_max_age_days)
                 
             except Exception as e:
                 print(f"Warning: Could not load config file: {e}")
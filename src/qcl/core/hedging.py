@@ -0,0 +1,133 @@
+"""Hedged requests: race a duplicate against slow calls to cut tail latency"""
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(math.ceil(fraction * len(ordered))) - 1))]
+
+
+@dataclass
+class HedgeStats:
+    """Hedging counters plus latencies with and without the hedge"""
+    requests: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    primary_latencies: List[float] = field(default_factory=list)
+    effective_latencies: List[float] = field(default_factory=list)
+
+    def latency_percentiles(self, hedged: bool = True) -> Tuple[float, float, float]:
+        """p50/p95/p99 of what callers saw (hedged) or of the first request alone"""
+        values = self.effective_latencies if hedged else self.primary_latencies
+        return percentile(values, 0.50), percentile(values, 0.95), percentile(values, 0.99)
+
+
+class RequestHedger:
+    """Sends a duplicate when a call outlives a percentile of recent latencies
+
+    The first successful response wins. Synchronous HTTP calls cannot be
+    interrupted, so a loser that is already running is abandoned: its
+    result is dropped but its tokens are still spent, which is what
+    `budget` (the share of requests that may be hedged) bounds.
+    """
+
+    def __init__(self, percentile: float = 0.95, budget: float = 0.05, min_samples: int = 20,
+                 max_workers: int = 32, window: int = 500):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.stats = HedgeStats()
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qcl-hedge")
+
+    @classmethod
+    def from_config(cls, config) -> "RequestHedger":
+        return cls(
+            percentile=config.hedge_percentile,
+            budget=config.hedge_budget,
+            min_samples=config.hedge_min_samples,
+            # Primary and hedge of every in-flight call
+            max_workers=2 * max(config.concurrent_requests, config.max_concurrent_requests)
+        )
+
+    def threshold(self) -> Optional[float]:
+        """Seconds after which a call gets hedged (None while warming up)"""
+        with self._lock:
+            if len(self._recent) < self.min_samples:
+                return None
+            return percentile(list(self._recent), self.percentile)
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self.stats.hedges + 1 > self.budget * self.stats.requests:
+                return False
+            self.stats.hedges += 1
+            return True
+
+    def _record_primary(self, latency: float):
+        with self._lock:
+            self._recent.append(latency)
+            self.stats.primary_latencies.append(latency)
+
+    @staticmethod
+    def _timed(send: Callable[[bool], T], is_hedge: bool) -> Tuple[T, float]:
+        start = time.monotonic()
+        return send(is_hedge), time.monotonic() - start
+
+    def call(self, send: Callable[[bool], T]) -> T:
+        """Run `send(is_hedge)`, hedging it if it is slow; errors propagate when both attempts fail"""
+        with self._lock:
+            self.stats.requests += 1
+        start = time.monotonic()
+
+        primary = self._pool.submit(self._timed, send, False)
+        primary.add_done_callback(
+            lambda future: None if future.cancelled() or future.exception() else self._record_primary(future.result()[1])
+        )
+
+        threshold = self.threshold()
+        done, _ = wait([primary], timeout=threshold)
+        if done or not self._take_budget():
+            result = primary.result()[0]
+        else:
+            hedge = self._pool.submit(self._timed, send, True)
+            running = [primary, hedge]
+            winner = None
+            while running and winner is None:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running.remove(future)
+                    if future.exception() is None and winner is None:
+                        winner = future
+            for loser in running:
+                loser.cancel()
+            if winner is None:
+                # Both failed; surface the primary's error
+                raise primary.exception()
+            if winner is hedge:
+                with self._lock:
+                    self.stats.hedge_wins += 1
+            result = winner.result()[0]
+
+        with self._lock:
+            self.stats.effective_latencies.append(time.monotonic() - start)
+        return result
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,86 @@
+"""Shared, pooled HTTP client for OpenAI API calls"""
+
+import importlib.util
+import logging
+import threading
+from dataclasses import dataclass
+
+import httpx
+from openai import DefaultHttpxClient
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PoolStats:
+    """Connection usage seen through httpcore trace events"""
+    requests: int = 0
+    connections_opened: int = 0
+    tls_handshakes: int = 0
+    http2_requests: int = 0
+
+    @property
+    def reuse_rate(self) -> float:
+        """Share of requests sent over an already open connection"""
+        if not self.requests:
+            return 0.0
+        return max(0.0, 1 - self.connections_opened / self.requests)
+
+
+class HttpClientPool:
+    """One keep-alive connection pool shared by every worker thread
+
+    httpx.Client is thread-safe, so a single instance serves all
+    concurrent calls. HTTP/2 multiplexes requests over few connections
+    when the optional `h2` package is installed.
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 50,
+                 keepalive_expiry: float = 30.0, connect_timeout: float = 5.0,
+                 read_timeout: float = 120.0, http2: bool = True):
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.stats = PoolStats()
+        self._lock = threading.Lock()
+        self.client = DefaultHttpxClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=self.timeout,
+            http2=http2,
+            event_hooks={"request": [self._attach_trace]}
+        )
+
+    @classmethod
+    def from_config(cls, config) -> "HttpClientPool":
+        return cls(
+            max_connections=config.http_max_connections,
+            max_keepalive_connections=config.http_max_keepalive_connections,
+            keepalive_expiry=config.http_keepalive_expiry,
+            connect_timeout=config.http_connect_timeout,
+            read_timeout=config.http_read_timeout,
+            http2=config.http2
+        )
+
+    def _attach_trace(self, request: httpx.Request):
+        request.extensions["trace"] = self._trace
+
+    def _trace(self, event_name: str, info):
+        with self._lock:
+            if event_name == "connection.connect_tcp.complete":
+                self.stats.connections_opened += 1
+            elif event_name == "connection.start_tls.complete":
+                self.stats.tls_handshakes += 1
+            elif event_name == "http11.send_request_headers.started":
+                self.stats.requests += 1
+            elif event_name == "http2.send_request_headers.started":
+                self.stats.requests += 1
+                self.stats.http2_requests += 1
+
+    def close(self):
+        self.client.close()
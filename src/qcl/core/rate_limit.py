@@ -0,0 +1,223 @@
+"""Shared request and token rate limiting for OpenAI calls"""
+
+import logging
+import math
+import re
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# Per-message and reply-priming overhead used by the chat format
+_TOKENS_PER_MESSAGE = 3
+_TOKENS_PER_REPLY = 3
+
+# Completion reservations: observed tokens per query with headroom, smoothed over recent calls
+_COMPLETION_HEADROOM = 1.5
+_COMPLETION_SMOOTHING = 0.2
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset_duration(value: str) -> Optional[float]:
+    """Parse an x-ratelimit-reset-* value such as '1s', '6m0s' or '20ms' into seconds"""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value.strip())
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to `capacity` units per minute"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self._updated = time.monotonic()
+
+    @property
+    def refill_rate(self) -> float:
+        """Units regained per second"""
+        return self.capacity / 60.0
+
+    def refill(self, now: float):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self.available = min(self.capacity, self.available + elapsed * self.refill_rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)"""
+        # Never wait for more than a full bucket, otherwise huge requests would block forever
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.refill_rate
+
+    def consume(self, amount: float):
+        self.available -= amount
+
+    def sync(self, limit: Optional[float], remaining: Optional[float], reset_seconds: Optional[float]):
+        """Align the bucket with limits reported by the API"""
+        if limit and limit > 0:
+            self.capacity = float(limit)
+        if remaining is not None:
+            # The server only ever knows less than we do about in-flight work
+            self.available = min(self.available, float(remaining))
+            if reset_seconds and remaining <= 0:
+                self.available = -reset_seconds * self.refill_rate
+
+
+class RateLimiter:
+    """Budgets requests/min and estimated tokens/min across all worker threads"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: Optional[int] = None,
+                 model: str = "gpt-4.1", expected_completion_tokens: int = 400):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.model = model
+        self.completion_tokens_per_query = float(expected_completion_tokens)
+        self._encoding = None
+        self._encoding_loaded = False
+        self._lock = threading.Lock()
+
+        # Running totals for the run summary
+        self.total_wait = 0.0
+        self.estimated_tokens = 0
+        self.actual_tokens = 0
+
+    @classmethod
+    def from_config(cls, config) -> "RateLimiter":
+        """Create a limiter from the rate_limit settings"""
+        return cls(
+            requests_per_minute=config.requests_per_minute,
+            tokens_per_minute=config.tokens_per_minute,
+            model=config.openai_model,
+            expected_completion_tokens=config.expected_completion_tokens
+        )
+
+    def _get_encoding(self):
+        """Load the tiktoken encoding for the model (None if unavailable)"""
+        if not self._encoding_loaded:
+            self._encoding_loaded = True
+            try:
+                import tiktoken
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.model)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                logger.warning(f"tiktoken unavailable, estimating tokens from character count: {e}")
+        return self._encoding
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens in a piece of text"""
+        encoding = self._get_encoding()
+        if encoding is None:
+            return len(text) // 4 + 1
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def estimate_tokens(self, messages: List[Dict[str, Any]], completion_tokens: int = 0) -> int:
+        """Estimate the tokens a chat request counts against the limit
+
+        Prompt tokens plus the completion tokens reserved for the reply
+        (see expected_completion).
+        """
+        prompt_tokens = _TOKENS_PER_REPLY
+        for message in messages:
+            prompt_tokens += _TOKENS_PER_MESSAGE + self.count_tokens(str(message.get("content", "")))
+        return prompt_tokens + (completion_tokens or 0)
+
+    def expected_completion(self, max_tokens: int, queries: int = 1) -> int:
+        """Completion tokens to reserve for a call classifying `queries` queries
+
+        Reserving the full max_tokens would hold back about ten times what
+        a reply uses, so this is the recent average per query with headroom,
+        capped at max_tokens. Replies longer than that are charged once
+        record_usage sees the real count.
+        """
+        with self._lock:
+            per_query = self.completion_tokens_per_query
+        return min(max_tokens, math.ceil(per_query * _COMPLETION_HEADROOM * max(queries, 1)))
+
+    def acquire(self, estimated_tokens: int = 0) -> float:
+        """Block until one request and `estimated_tokens` tokens fit the budget
+
+        Returns the number of seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.requests.refill(now)
+                delay = self.requests.wait_time(1)
+                if self.tokens is not None:
+                    self.tokens.refill(now)
+                    delay = max(delay, self.tokens.wait_time(estimated_tokens))
+
+                if delay <= 0:
+                    self.requests.consume(1)
+                    if self.tokens is not None:
+                        self.tokens.consume(estimated_tokens)
+                    self.estimated_tokens += estimated_tokens
+                    self.total_wait += waited
+                    return waited
+
+            time.sleep(delay)
+            waited += delay
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int],
+                     completion_tokens: Optional[int] = None, queries: int = 1):
+        """Return over-reserved tokens (or charge the shortfall) once the real usage is known
+
+        `completion_tokens` over `queries` queries updates the per-query
+        completion size that expected_completion reserves.
+        """
+        if actual_tokens is None:
+            return
+        with self._lock:
+            if completion_tokens is not None and queries > 0:
+                self.completion_tokens_per_query += _COMPLETION_SMOOTHING * (
+                    completion_tokens / queries - self.completion_tokens_per_query)
+            self.actual_tokens += actual_tokens
+            if self.tokens is not None:
+                self.tokens.available = min(self.tokens.capacity,
+                                            self.tokens.available + estimated_tokens - actual_tokens)
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """Adapt to x-ratelimit-* response headers"""
+        if not headers:
+            return
+
+        def _number(name):
+            value = headers.get(name)
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.requests.sync(
+                _number("x-ratelimit-limit-requests"),
+                _number("x-ratelimit-remaining-requests"),
+                parse_reset_duration(headers.get("x-ratelimit-reset-requests", ""))
+            )
+            token_limit = _number("x-ratelimit-limit-tokens")
+            if self.tokens is None and token_limit:
+                self.tokens = TokenBucket(token_limit)
+            if self.tokens is not None:
+                self.tokens.refill(now)
+                self.tokens.sync(
+                    token_limit,
+                    _number("x-ratelimit-remaining-tokens"),
+                    parse_reset_duration(headers.get("x-ratelimit-reset-tokens", ""))
+                )
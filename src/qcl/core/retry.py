@@ -0,0 +1,161 @@
+"""Retries with exponential backoff for transient API errors"""
+
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional, TypeVar
+
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Status codes worth retrying besides 5xx
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class ResponseParseError(Exception):
+    """The API answered but the response could not be parsed"""
+
+
+class RetryError(Exception):
+    """A call failed permanently or ran out of attempts"""
+
+    def __init__(self, last_error: Exception, attempts: int, retryable: bool):
+        super().__init__(f"{type(last_error).__name__} after {attempts} attempt(s): {last_error}")
+        self.last_error = last_error
+        self.attempts = attempts
+        self.retryable = retryable
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an error is transient (throttling, timeouts, 5xx, unparseable output)"""
+    if isinstance(error, (ResponseParseError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        # An exhausted quota is also a 429, but waiting will not fix it
+        if getattr(error, "code", None) == "insufficient_quota":
+            return False
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def was_rejected(error: Exception) -> bool:
+    """Whether a request certainly never ran, so it cannot have been billed
+
+    True for 4xx refusals (except 408) and for connections that were never
+    established. A timeout or 5xx may still have been processed.
+    """
+    if isinstance(error, openai.APIStatusError):
+        return 400 <= error.status_code < 500 and error.status_code != 408
+    if isinstance(error, openai.APIConnectionError):
+        return isinstance(error.__cause__, (httpx.ConnectError, httpx.ConnectTimeout))
+    return False
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Server-requested delay from retry-after-ms / retry-after headers, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RetryStats:
+    """Retry counters for a run"""
+    retries: int = 0
+    recovered: int = 0
+    exhausted: int = 0
+    permanent: int = 0
+    throttled: int = 0
+    backoff_seconds: float = 0.0
+
+
+class RetryPolicy:
+    """Retries transient failures with full-jitter exponential backoff
+
+    The delay before retry n is uniform in [0, min(max_delay, base_delay * 2**n)],
+    unless the server sent Retry-After, which is honoured (plus a little jitter
+    so throttled workers do not all return at once).
+    """
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = RetryStats()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> "RetryPolicy":
+        return cls(
+            max_retries=config.retry_attempts,
+            base_delay=config.retry_base_delay,
+            max_delay=config.retry_max_delay
+        )
+
+    def delay_for(self, retry_number: int, error: Exception) -> float:
+        """Seconds to wait before the given retry (0-based)"""
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, min(1.0, retry_after * 0.1) + 0.05)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry_number)))
+
+    def call(self, fn: Callable[[], T], description: str = "API call") -> T:
+        """Run `fn`, retrying transient errors; raises RetryError when it gives up"""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = fn()
+            except Exception as e:
+                if isinstance(e, openai.RateLimitError):
+                    with self._lock:
+                        self.stats.throttled += 1
+                retryable = is_retryable(e)
+                if not retryable or attempt > self.max_retries:
+                    with self._lock:
+                        if retryable:
+                            self.stats.exhausted += 1
+                        else:
+                            self.stats.permanent += 1
+                    raise RetryError(e, attempt, retryable) from e
+
+                delay = self.delay_for(attempt - 1, e)
+                with self._lock:
+                    self.stats.retries += 1
+                    self.stats.backoff_seconds += delay
+                logger.warning(f"{description} failed ({type(e).__name__}: {e}); "
+                               f"retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            if attempt > 1:
+                with self._lock:
+                    self.stats.recovered += 1
+            return result
@@ -0,0 +1,170 @@
+"""Persistent on-disk cache of classification responses"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# How many writes between eviction passes
+_EVICT_EVERY = 500
+
+
+def normalize_for_cache(text: str) -> str:
+    """Normalize query text so trivial variations share a cache entry"""
+    return " ".join(text.lower().split())
+
+
+def cache_key(query_text: str, prompt_template: str, guidelines_context: str,
+              model: str, temperature: float) -> str:
+    """Content hash of everything that determines a classification"""
+    digest = hashlib.sha256()
+    for part in (normalize_for_cache(query_text), prompt_template, guidelines_context, model, repr(float(temperature))):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+@dataclass
+class CacheStats:
+    """Hit/miss counters for a cache session"""
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ClassificationCache:
+    """SQLite-backed cache of parsed classification data
+
+    Entries are evicted when they are older than `max_age_days` or, once
+    the cache holds more than `max_entries`, least recently used first.
+    """
+
+    def __init__(self, cache_file: Path, max_entries: Optional[int] = 100000,
+                 max_age_days: Optional[float] = 30):
+        self.cache_file = Path(cache_file)
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.cache_file), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS classifications ("
+            " key TEXT PRIMARY KEY,"
+            " query_text TEXT,"
+            " data TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON classifications(accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    @classmethod
+    def from_config(cls, config) -> "ClassificationCache":
+        """Open the cache file under the processed data directory"""
+        return cls(
+            config.processed_dir / "classification_cache.sqlite",
+            max_entries=config.cache_max_entries,
+            max_age_days=config.cache_max_age_days
+        )
+
+    def get(self, key: str, record_stats: bool = True) -> Optional[Dict[str, Any]]:
+        """Return cached classification data, or None on a miss
+
+        Lookups made on behalf of another layer (the semantic cache) pass
+        record_stats=False so they do not count as exact hits or misses.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, created_at FROM classifications WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is not None and self.max_age_days is not None:
+                if time.time() - row[1] > self.max_age_days * 86400:
+                    self._conn.execute("DELETE FROM classifications WHERE key = ?", (key,))
+                    self._conn.commit()
+                    self.stats.evictions += 1
+                    row = None
+
+            if row is None:
+                if record_stats:
+                    self.stats.misses += 1
+                return None
+
+            self._conn.execute("UPDATE classifications SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            if record_stats:
+                self.stats.hits += 1
+
+        return json.loads(row[0])
+
+    def put(self, key: str, data: Dict[str, Any], query_text: str = ""):
+        """Store classification data under a key"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO classifications (key, query_text, data, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, query_text, json.dumps(data, default=str), now, now)
+            )
+            self._conn.commit()
+            self.stats.stores += 1
+            self._writes_since_evict += 1
+            evict_due = self._writes_since_evict >= _EVICT_EVERY
+
+        if evict_due:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries and trim to max_entries; returns rows removed"""
+        removed = 0
+        with self._lock:
+            if self.max_age_days is not None:
+                cutoff = time.time() - self.max_age_days * 86400
+                removed += self._conn.execute(
+                    "DELETE FROM classifications WHERE created_at < ?", (cutoff,)
+                ).rowcount
+
+            if self.max_entries is not None:
+                count = self._conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+                excess = count - self.max_entries
+                if excess > 0:
+                    removed += self._conn.execute(
+                        "DELETE FROM classifications WHERE key IN ("
+                        " SELECT key FROM classifications ORDER BY accessed_at ASC LIMIT ?)",
+                        (excess,)
+                    ).rowcount
+
+            self._conn.commit()
+            self._writes_since_evict = 0
+            self.stats.evictions += removed
+
+        if removed:
+            logger.info(f"Evicted {removed} entries from classification cache")
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,127 @@
+"""Token-budgeted chunking of guideline text"""
+
+import logging
+import re
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Heading boundaries: a run of two or more all-caps words ("ENTITY SCHEMA")
+# or a numbered heading line ("2.1 Entity Schema"). pypdf often puts every
+# word on its own line, so the run may span line breaks.
+HEADING_PATTERN = re.compile(
+    r"\b[A-Z]{3,}(?:\s+[A-Z]{3,})+\b"
+    r"|^\d+(?:\.\d+)*\.?\s+[A-Z][^\n]{0,60}$",
+    re.MULTILINE
+)
+
+
+class _WordPieceEncoding:
+    """Stand-in for a tiktoken encoding when tiktoken cannot be loaded
+
+    Treats each whitespace-delimited word as one token, which undercounts
+    real tokens by roughly a quarter.
+    """
+    name = "words"
+    _PIECE = re.compile(r"\S+\s*")
+
+    def encode(self, text: str, **kwargs) -> List[str]:
+        return self._PIECE.findall(text)
+
+    def decode(self, pieces: List[str]) -> str:
+        return "".join(pieces)
+
+
+def split_sections(text: str) -> List[str]:
+    """Split text before each heading so every section starts with its heading"""
+    starts = sorted({0} | {match.start() for match in HEADING_PATTERN.finditer(text)})
+    bounds = starts + [len(text)]
+    sections = [text[start:end] for start, end in zip(bounds, bounds[1:])]
+    return [section for section in sections if section.strip()]
+
+
+class TokenChunker:
+    """Packs text into chunks of at most `max_tokens` tokens
+
+    Long stretches are split with a sliding window that repeats
+    `overlap_tokens` tokens between neighbours. With `respect_headings`,
+    chunks only break at headings: whole consecutive sections are packed
+    together while they fit, and a section longer than the budget is
+    windowed on its own, so no chunk ends partway through a short section.
+    """
+
+    def __init__(self, max_tokens: int = 512, overlap_tokens: int = 64, respect_headings: bool = True,
+                 model: str = "gpt-4.1"):
+        if overlap_tokens >= max_tokens:
+            raise ValueError(f"chunk overlap ({overlap_tokens}) must be smaller than the budget ({max_tokens})")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = max(0, overlap_tokens)
+        self.respect_headings = respect_headings
+        self.model = model
+        self._encoding = None
+
+    @classmethod
+    def from_config(cls, config) -> "TokenChunker":
+        return cls(
+            max_tokens=config.chunk_tokens,
+            overlap_tokens=config.chunk_token_overlap,
+            respect_headings=config.chunk_respect_headings,
+            model=config.openai_model
+        )
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            try:
+                import tiktoken
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.model)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                logger.warning(f"tiktoken unavailable, chunking by words instead of tokens: {e}")
+                self._encoding = _WordPieceEncoding()
+        return self._encoding
+
+    @property
+    def cache_token(self) -> str:
+        """Identifies the chunking settings in parsed-guideline cache keys"""
+        return f"tokens:{self.encoding.name}:{self.max_tokens}:{self.overlap_tokens}:{self.respect_headings}"
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def _window(self, tokens: list) -> List[list]:
+        """Split a token list into overlapping windows of at most max_tokens"""
+        step = self.max_tokens - self.overlap_tokens
+        windows = []
+        for start in range(0, len(tokens), step):
+            windows.append(tokens[start:start + self.max_tokens])
+            if start + self.max_tokens >= len(tokens):
+                break
+        return windows
+
+    def chunk(self, text: str) -> List[str]:
+        """Chunk text to the token budget"""
+        sections = split_sections(text) if self.respect_headings else [text]
+        encoding = self.encoding
+        chunks: List[str] = []
+        current: Optional[list] = None
+
+        for section in sections:
+            # pypdf output is full of stray line breaks; they only waste tokens
+            tokens = encoding.encode(" ".join(section.split()) + " ", disallowed_special=())
+            if current is not None and len(current) + len(tokens) <= self.max_tokens:
+                current = current + tokens
+                continue
+            if current is not None:
+                chunks.append(encoding.decode(current))
+                current = None
+            if len(tokens) <= self.max_tokens:
+                current = tokens
+            else:
+                chunks.extend(encoding.decode(window) for window in self._window(tokens))
+
+        if current is not None:
+            chunks.append(encoding.decode(current))
+        return [chunk.strip() for chunk in chunks if chunk.strip()]
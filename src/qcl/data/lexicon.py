@@ -0,0 +1,198 @@
+# Built-in lexicon for the rules pre-classifier
+# Names are lowercase; extend or override them with a lexicon file (rules.lexicon_file)
+
+# Navigational sites: name -> (domain, organization, topics)
+SITES = {
+    "google": ("google.com", "Google", []),
+    "gmail": ("gmail.com", "Google", []),
+    "google maps": ("maps.google.com", "Google", []),
+    "youtube": ("youtube.com", "YouTube", []),
+    "facebook": ("facebook.com", "Facebook", ["social_networking"]),
+    "facebook marketplace": ("facebook.com/marketplace", "Facebook", ["social_networking"]),
+    "instagram": ("instagram.com", "Instagram", ["social_networking"]),
+    "twitter": ("twitter.com", "Twitter", ["social_networking"]),
+    "reddit": ("reddit.com", "Reddit", ["social_networking"]),
+    "tumblr": ("tumblr.com", "Tumblr", ["social_networking"]),
+    "pinterest": ("pinterest.com", "Pinterest", ["social_networking"]),
+    "linkedin": ("linkedin.com", "LinkedIn", ["social_networking", "jobs"]),
+    "tiktok": ("tiktok.com", "TikTok", ["social_networking"]),
+    "whatsapp": ("whatsapp.com", "WhatsApp", ["social_networking"]),
+    "yahoo": ("yahoo.com", "Yahoo", []),
+    "yahoo mail": ("mail.yahoo.com", "Yahoo", []),
+    "yahoo finance": ("finance.yahoo.com", "Yahoo", ["finance"]),
+    "aol mail": ("mail.aol.com", "AOL", []),
+    "hotmail": ("outlook.com", "Microsoft", []),
+    "bing": ("bing.com", "Microsoft", []),
+    "duckduckgo": ("duckduckgo.com", "DuckDuckGo", []),
+    "yandex": ("yandex.com", "Yandex", []),
+    "wikipedia": ("wikipedia.org", "Wikipedia", []),
+    "amazon": ("amazon.com", "Amazon", ["retailers"]),
+    "ebay": ("ebay.com", "eBay", ["retailers"]),
+    "etsy": ("etsy.com", "Etsy", ["retailers"]),
+    "temu": ("temu.com", "Temu", ["retailers"]),
+    "craigslist": ("craigslist.org", "Craigslist", ["retailers"]),
+    "netflix": ("netflix.com", "Netflix", ["entertainment_tv"]),
+    "hulu": ("hulu.com", "Hulu", ["entertainment_tv"]),
+    "spotify": ("spotify.com", "Spotify", ["entertainment_music"]),
+    "espn": ("espn.com", "ESPN", ["sports_outdoors"]),
+    "zillow": ("zillow.com", "Zillow", ["real_estate"]),
+    "paypal": ("paypal.com", "PayPal", ["finance"]),
+    "usps tracking": ("usps.com", "USPS", ["government_politics"]),
+    "poki": ("poki.com", "Poki", ["entertainment_games"]),
+    "bet365": ("bet365.com", "bet365", ["entertainment_games", "sports_outdoors"]),
+    "onlyfans": ("onlyfans.com", "OnlyFans", ["social_networking"]),
+}
+
+# Chains with local stores: navigational on their own, Local_Chain with a local modifier
+CHAINS = {
+    "walmart": ("walmart.com", "Walmart", ["retailers"]),
+    "costco": ("costco.com", "Costco", ["retailers"]),
+    "home depot": ("homedepot.com", "Home Depot", ["home_garden", "retailers"]),
+    "lowes": ("lowes.com", "Lowe's", ["home_garden", "retailers"]),
+    "menards": ("menards.com", "Menards", ["home_garden", "retailers"]),
+    "best buy": ("bestbuy.com", "Best Buy", ["tech_electronics", "retailers"]),
+    "kohls": ("kohls.com", "Kohl's", ["personal_goods", "retailers"]),
+    "macys": ("macys.com", "Macy's", ["personal_goods", "retailers"]),
+    "walgreens": ("walgreens.com", "Walgreens", ["health_medical", "retailers"]),
+    "cvs": ("cvs.com", "CVS", ["health_medical", "retailers"]),
+    "kroger": ("kroger.com", "Kroger", ["food_dining", "retailers"]),
+    "aldi": ("aldi.us", "Aldi", ["food_dining", "retailers"]),
+    "publix": ("publix.com", "Publix", ["food_dining", "retailers"]),
+    "starbucks": ("starbucks.com", "Starbucks", ["food_dining"]),
+    "mcdonalds": ("mcdonalds.com", "McDonald's", ["food_dining"]),
+    "chick fil a": ("chick-fil-a.com", "Chick-fil-A", ["food_dining"]),
+    "taco bell": ("tacobell.com", "Taco Bell", ["food_dining"]),
+    "dominos": ("dominos.com", "Domino's", ["food_dining"]),
+    "argos": ("argos.co.uk", "Argos", ["retailers"]),
+}
+
+# Adult sites: OTHER_Adult rather than Navigational
+ADULT_SITES = {
+    "pornhub": "pornhub.com",
+    "xvideos": "xvideos.com",
+    "xnxx": "xnxx.com",
+    "xhamster": "xhamster.com",
+    "redtube": "redtube.com",
+    "youporn": "youporn.com",
+    "youjizz": "youjizz.com",
+    "tube8": "tube8.com",
+    "eporner": "eporner.com",
+    "stripchat": "stripchat.com",
+    "chaturbate": "chaturbate.com",
+}
+
+# Spelling variants: alias -> lexicon name
+ALIASES = {
+    "you tube": "youtube",
+    "yahoomail": "yahoo mail",
+    "mail yahoo": "yahoo mail",
+    "fb": "facebook",
+    "lowe's": "lowes",
+    "kohl's": "kohls",
+    "macy's": "macys",
+    "mcdonald's": "mcdonalds",
+    "chick-fil-a": "chick fil a",
+    "domino's": "dominos",
+    "porn hub": "pornhub",
+    "x videos": "xvideos",
+    "x hamster": "xhamster",
+    "red tube": "redtube",
+    "you porn": "youporn",
+}
+
+# Words that may follow a site name without changing the intent
+SITE_MODIFIERS = [
+    "login", "log in", "sign in", "signin", "account", "my account",
+    "app", "website", "official site", "home page", "homepage",
+]
+
+# Words that turn a chain query into a local store lookup
+LOCAL_MODIFIERS = [
+    "near me", "nearby", "near", "hours", "store hours", "hours today", "open now",
+    "locations", "location", "store", "stores", "store locator",
+]
+
+# Place gazetteer for the weather/time/zip code patterns: only these count as places,
+# so "zip lining" or "time in a bottle" go to the LLM. Extend with rules.lexicon_file (places).
+CITIES = [
+    # United States
+    "new york", "new york city", "nyc", "los angeles", "chicago", "houston", "phoenix", "philadelphia",
+    "san antonio", "san diego", "dallas", "san jose", "austin", "jacksonville", "fort worth", "columbus",
+    "charlotte", "san francisco", "indianapolis", "seattle", "denver", "washington dc", "boston",
+    "el paso", "nashville", "detroit", "oklahoma city", "portland", "las vegas", "memphis", "louisville",
+    "baltimore", "milwaukee", "albuquerque", "tucson", "fresno", "sacramento", "kansas city", "mesa",
+    "atlanta", "omaha", "colorado springs", "raleigh", "miami", "long beach", "virginia beach",
+    "oakland", "minneapolis", "tulsa", "tampa", "arlington", "new orleans", "wichita", "cleveland",
+    "bakersfield", "aurora", "anaheim", "honolulu", "santa ana", "riverside", "corpus christi",
+    "lexington", "pittsburgh", "anchorage", "stockton", "cincinnati", "st louis", "saint louis",
+    "st paul", "toledo", "greensboro", "newark", "plano", "henderson", "lincoln", "buffalo",
+    "fort wayne", "jersey city", "chula vista", "orlando", "st petersburg", "norfolk", "chandler",
+    "laredo", "madison", "durham", "lubbock", "winston salem", "garland", "glendale", "hialeah",
+    "reno", "baton rouge", "irvine", "chesapeake", "scottsdale", "fremont", "gilbert",
+    "san bernardino", "boise", "birmingham", "rochester", "richmond", "spokane", "des moines",
+    "montgomery", "modesto", "fayetteville", "tacoma", "fontana", "salt lake city", "knoxville",
+    "little rock", "providence", "charleston", "savannah", "syracuse", "hartford", "albany",
+    "burlington", "manchester", "ann arbor", "grand rapids", "dayton", "akron", "el cajon",
+    "palm springs", "santa barbara", "santa monica", "pasadena", "berkeley", "key west",
+    "myrtle beach", "fort lauderdale", "west palm beach", "naples", "sarasota", "tallahassee",
+    "gainesville", "pensacola", "destin", "asheville", "chattanooga", "huntsville", "jackson",
+    "shreveport", "sioux falls", "fargo", "billings", "cheyenne", "juneau", "bozeman", "missoula",
+    # Rest of the world
+    "london", "paris", "berlin", "madrid", "barcelona", "rome", "milan", "venice", "florence",
+    "amsterdam", "brussels", "vienna", "prague", "budapest", "warsaw", "krakow", "lisbon", "porto",
+    "dublin", "edinburgh", "glasgow", "liverpool", "leeds", "bristol", "cardiff", "belfast",
+    "zurich", "geneva", "munich", "frankfurt", "hamburg", "cologne", "copenhagen", "stockholm",
+    "oslo", "helsinki", "reykjavik", "athens", "istanbul", "moscow", "st petersburg", "kyiv",
+    "dubai", "abu dhabi", "doha", "riyadh", "tel aviv", "jerusalem", "cairo", "marrakech",
+    "casablanca", "lagos", "nairobi", "johannesburg", "cape town", "mumbai", "delhi", "new delhi",
+    "bangalore", "bengaluru", "chennai", "kolkata", "hyderabad", "karachi", "lahore", "dhaka",
+    "bangkok", "phuket", "singapore", "kuala lumpur", "jakarta", "bali", "manila", "hanoi",
+    "ho chi minh city", "hong kong", "beijing", "shanghai", "shenzhen", "taipei", "seoul", "tokyo",
+    "osaka", "kyoto", "sydney", "melbourne", "brisbane", "perth", "adelaide", "auckland",
+    "wellington", "toronto", "montreal", "vancouver", "calgary", "ottawa", "edmonton", "winnipeg",
+    "quebec city", "mexico city", "cancun", "guadalajara", "monterrey", "havana", "san juan",
+    "bogota", "medellin", "lima", "santiago", "buenos aires", "sao paulo", "rio de janeiro",
+]
+
+# States, provinces and countries: places on their own and as a qualifier after a city
+REGIONS = [
+    "alabama", "alaska", "arizona", "arkansas", "california", "colorado", "connecticut", "delaware",
+    "florida", "georgia", "hawaii", "idaho", "illinois", "indiana", "iowa", "kansas", "kentucky",
+    "louisiana", "maine", "maryland", "massachusetts", "michigan", "minnesota", "mississippi",
+    "missouri", "montana", "nebraska", "nevada", "new hampshire", "new jersey", "new mexico",
+    "north carolina", "north dakota", "ohio", "oklahoma", "oregon", "pennsylvania", "rhode island",
+    "south carolina", "south dakota", "tennessee", "texas", "utah", "vermont", "virginia",
+    "washington", "west virginia", "wisconsin", "wyoming",
+    "ontario", "quebec", "british columbia", "alberta", "nova scotia",
+    "england", "scotland", "wales", "northern ireland",
+    "usa", "united states", "uk", "united kingdom", "canada", "mexico", "brazil", "argentina",
+    "colombia", "peru", "chile", "ireland", "france", "germany", "spain", "portugal", "italy",
+    "netherlands", "belgium", "switzerland", "austria", "poland", "czech republic", "hungary",
+    "greece", "turkey", "russia", "ukraine", "sweden", "norway", "denmark", "finland", "iceland",
+    "egypt", "morocco", "nigeria", "kenya", "south africa", "israel", "saudi arabia", "uae",
+    "qatar", "india", "pakistan", "bangladesh", "china", "japan", "south korea", "korea", "taiwan",
+    "thailand", "vietnam", "philippines", "indonesia", "malaysia", "australia", "new zealand",
+]
+
+# State abbreviations, accepted only after a city ("austin tx") since many are also words
+STATE_ABBREVIATIONS = [
+    "al", "ak", "az", "ar", "ca", "co", "ct", "de", "fl", "ga", "hi", "id", "il", "in", "ia", "ks",
+    "ky", "la", "me", "md", "ma", "mi", "mn", "ms", "mo", "mt", "ne", "nv", "nh", "nj", "nm", "ny",
+    "nc", "nd", "oh", "ok", "or", "pa", "ri", "sc", "sd", "tn", "tx", "ut", "vt", "va", "wa", "wv",
+    "wi", "wy", "dc",
+]
+
+# Units accepted by the conversion pattern
+UNITS = [
+    "mm", "cm", "m", "km", "in", "inch", "inches", "ft", "foot", "feet", "yd", "yard", "yards",
+    "mile", "miles", "meter", "meters", "metre", "metres", "kilometer", "kilometers",
+    "centimeter", "centimeters", "millimeter", "millimeters",
+    "mg", "g", "gram", "grams", "kg", "kilogram", "kilograms", "lb", "lbs", "pound", "pounds",
+    "oz", "ounce", "ounces", "ton", "tons", "stone",
+    "ml", "l", "liter", "liters", "litre", "litres", "gallon", "gallons", "quart", "quarts",
+    "pint", "pints", "cup", "cups", "tbsp", "tablespoon", "tablespoons", "tsp", "teaspoon", "teaspoons",
+    "c", "f", "celsius", "fahrenheit", "kelvin",
+    "mph", "kph", "km/h", "knots",
+    "acre", "acres", "hectare", "hectares",
+    "usd", "eur", "gbp", "inr", "cad", "aud", "jpy", "dollars", "euros", "pounds sterling", "rupees",
+]
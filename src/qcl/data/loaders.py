@@ -2,9 +2,10 @@
 
 import pandas as pd
 from pypdf import PdfReader
+import os
 import pickle
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Set
 import logging
 import time
 import datetime
@@ -12,8 +13,14 @@ from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-def load_queries_from_csv(file_path: Path) -> List['Query']:
-    """Load queries from CSV file"""
+def iter_queries_from_csv(file_path: Path, chunksize: int = 10000) -> Iterator['Query']:
+    """Stream queries from a CSV file in chunks
+    
+    Only `chunksize` rows are held in memory at a time, so classification
+    can start before a large file has been fully read. Query indices are
+    row numbers, or the values of an `index` column when the file has one
+    (e.g. the `.llm_queries.csv` left by classify-local).
+    """
     from .models import Query
     
     if not file_path.exists():
@@ -21,71 +28,170 @@ def load_queries_from_csv(file_path: Path) -> List['Query']:
     
     logger.info(f"Loading queries from {file_path}")
     
-    # Read CSV
-    df = pd.read_csv(file_path)
-    
     # Validate
-    if 'query' not in df.columns:
+    header = pd.read_csv(file_path, nrows=0)
+    if 'query' not in header.columns:
         raise ValueError("CSV must contain a 'query' column")
     
-    # Clean data
-    df = df.dropna(subset=['query'])
-    df['query'] = df['query'].str.strip()
-    df = df[df['query'].str.len() > 0]
+    columns = ['query', 'index'] if 'index' in header.columns else ['query']
     
-    # Create Query objects
-    queries = []
-    for idx, row in df.iterrows():
-        query = Query(text=row['query'], index=idx)
-        queries.append(query)
+    count = 0
+    for chunk in pd.read_csv(file_path, usecols=columns, dtype={'query': str}, chunksize=chunksize):
+        if 'index' in chunk.columns:
+            chunk = chunk.set_index('index')
+        
+        # Clean data
+        texts = chunk['query'].dropna().str.strip()
+        texts = texts[texts.str.len() > 0]
+        
+        # Create Query objects
+        for idx, text in zip(texts.index, texts.values):
+            yield Query(text=text, index=int(idx))
+        count += len(texts)
     
-    logger.info(f"Loaded {len(queries)} queries")
-    return queries
+    logger.info(f"Loaded {count} queries")
 
-def load_guidelines_from_pdf(file_path: Path, chunk_size: int = 800, chunk_overlap: int = 400) -> Dict[str, Any]:
-    """Load and chunk guidelines from PDF"""
-    if not file_path.exists():
-        raise FileNotFoundError(f"Guidelines file not found: {file_path}")
+def load_queries_from_csv(file_path: Path, chunksize: int = 10000) -> List['Query']:
+    """Load queries from CSV file"""
+    return list(iter_queries_from_csv(file_path, chunksize))
+
+def _file_sha256(file_path: Path) -> str:
+    """Content hash of a file, read in 1 MB blocks"""
+    import hashlib
     
-    logger.info(f"Loading guidelines from {file_path}")
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _guidelines_cache_file(file_path: Path, cache_dir: Path, *settings: Any) -> Path:
+    """Cache location for a PDF's parsed guidelines under the given chunk settings"""
+    import hashlib
+    
+    key = hashlib.sha256(
+        "\x00".join([_file_sha256(file_path)] + [repr(setting) for setting in settings]).encode('utf-8')
+    ).hexdigest()
+    return Path(cache_dir) / f"guidelines_{key[:16]}.pkl"
+
+# Below this many pages a process pool costs more than it saves
+_PARALLEL_MIN_PAGES = 16
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[tuple]:
+    """Extract pages [start, end) in a worker; returns (page_num, text, error) tuples"""
+    reader = PdfReader(file_path)
+    pages = []
+    for page_num in range(start, end):
+        try:
+            pages.append((page_num, reader.pages[page_num].extract_text(), None))
+        except Exception as e:
+            pages.append((page_num, None, str(e)))
+    return pages
+
+def _extract_pdf_text(file_path: Path, workers: int = 0) -> str:
+    """Extract the text of every readable page, skipping pages that fail
+    
+    Large documents are split into page ranges extracted on a process
+    pool (`workers` = 0 uses every core); pages are merged back in order.
+    """
+    from concurrent.futures import ProcessPoolExecutor
     
-    # Extract text from PDF using pypdf
-    text_parts = []
     try:
-        reader = PdfReader(file_path)
-        for page_num, page in enumerate(reader.pages):
-            try:
-                page_text = page.extract_text()
-                if page_text and page_text.strip():
-                    text_parts.append(page_text)
-            except Exception as e:
-                logger.warning(f"Could not extract text from page {page_num}: {e}")
+        page_count = len(PdfReader(file_path).pages)
     except Exception as e:
         logger.error(f"Error reading PDF file '{file_path}': {e}")
         raise e
     
-    full_text = "\n\n".join(text_parts)
+    workers = min(workers or os.cpu_count() or 1, page_count)
+    if workers <= 1 or page_count < _PARALLEL_MIN_PAGES:
+        pages = _extract_page_range(str(file_path), 0, page_count)
+    else:
+        # A few ranges per worker keeps the pool busy when pages vary in cost
+        step = max(1, -(-page_count // (workers * 4)))
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        logger.info(f"Extracting {page_count} pages with {workers} processes")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_extract_page_range, str(file_path), start, end) for start, end in ranges]
+            pages = [page for future in futures for page in future.result()]
+    
+    text_parts = []
+    for page_num, page_text, error in pages:
+        if error is not None:
+            logger.warning(f"Could not extract text from page {page_num}: {error}")
+        elif page_text and page_text.strip():
+            text_parts.append(page_text)
     
-    # Simple text chunking
+    return "\n\n".join(text_parts)
+
+def _chunk_words(full_text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """Simple text chunking by whitespace-separated words"""
     chunks = []
     words = full_text.split()
     for i in range(0, len(words), chunk_size - chunk_overlap):
         chunk_words = words[i:i + chunk_size]
         chunk_text = " ".join(chunk_words)
         chunks.append(chunk_text)
+    return chunks
+
+def load_guidelines_from_pdf(file_path: Path, chunk_size: int = 800, chunk_overlap: int = 400,
+                             cache_dir: Path = None, workers: int = 0, chunker=None) -> Dict[str, Any]:
+    """Load and chunk guidelines from PDF
+    
+    With `cache_dir` set, the parsed text and chunks are pickled there,
+    keyed by the PDF's content hash and the chunk settings, and later
+    runs on the same file skip PDF extraction entirely. `workers` sets
+    the extraction process count (0 = all cores, 1 = sequential). A
+    `chunker` (see chunking.TokenChunker) replaces the word chunker.
+    """
+    if not file_path.exists():
+        raise FileNotFoundError(f"Guidelines file not found: {file_path}")
+    
+    settings = (chunker.cache_token,) if chunker is not None else (chunk_size, chunk_overlap)
+    cache_file = _guidelines_cache_file(file_path, cache_dir, *settings) if cache_dir else None
+    if cache_file is not None and cache_file.exists():
+        try:
+            with open(cache_file, 'rb') as f:
+                guidelines = pickle.load(f)
+            guidelines["source_file"] = str(file_path)
+            logger.info(f"Loaded {guidelines['chunk_count']} guideline chunks from cache {cache_file}")
+            return guidelines
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable guidelines cache {cache_file}: {e}")
+    
+    logger.info(f"Loading guidelines from {file_path}")
+    
+    full_text = _extract_pdf_text(file_path, workers)
+    if chunker is not None:
+        chunks = chunker.chunk(full_text)
+    else:
+        chunks = _chunk_words(full_text, chunk_size, chunk_overlap)
     
     logger.info(f"Created {len(chunks)} text chunks")
     
-    return {
+    guidelines = {
         "source_file": str(file_path),
         "total_text_length": len(full_text),
         "chunk_count": len(chunks),
         "chunks": chunks,
         "full_text": full_text
     }
+    
+    if cache_file is not None:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix('.tmp')
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(guidelines, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_file.replace(cache_file)
+        logger.info(f"Cached parsed guidelines to {cache_file}")
+    
+    return guidelines
 
 def save_results(results: List['ClassificationResult'], output_file: Path):
     """Save classification results to JSON file"""
+    _write_results_json([result.to_dict() for result in results], output_file)
+
+def _write_results_json(result_dicts: List[Dict[str, Any]], output_file: Path):
+    """Write serialized results in the {"metadata", "results"} layout"""
     import json
     
     output_file.parent.mkdir(parents=True, exist_ok=True)
@@ -93,10 +199,10 @@ def save_results(results: List['ClassificationResult'], output_file: Path):
     # Convert to serializable format
     results_data = {
         "metadata": {
-            "total_results": len(results),
+            "total_results": len(result_dicts),
             "created_at": datetime.now().isoformat(),
         },
-        "results": [result.to_dict() for result in results]
+        "results": result_dicts
     }
     
     with open(output_file, 'w', encoding='utf-8') as f:
@@ -104,6 +210,207 @@ def save_results(results: List['ClassificationResult'], output_file: Path):
     
     logger.info(f"Results saved to {output_file}")
 
+class JsonlResultWriter:
+    """Append-only JSONL sink that checkpoints each result as it completes
+    
+    Lines are flushed on every write and fsynced every `fsync_every`
+    results or `fsync_interval` seconds, whichever comes first, so a crash
+    loses at most the results since the last sync. When reopening an
+    existing checkpoint, a torn final line left by a crash is cut off
+    first so the next result starts on a line of its own.
+    
+    `write()` returns the byte offset of the line, which `read()` takes
+    to load that result back.
+    """
+    
+    def __init__(self, output_file: Path, fsync_every: int = 50, fsync_interval: float = 5.0):
+        self.output_file = Path(output_file)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.written = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        
+        self.output_file.parent.mkdir(parents=True, exist_ok=True)
+        if self.output_file.exists():
+            self._truncate_partial_line()
+        self._file = open(self.output_file, 'ab')
+        self._offset = self._file.seek(0, os.SEEK_END)
+        self._reader = None
+    
+    def _truncate_partial_line(self, chunk_size: int = 65536):
+        """Drop anything after the last newline (an unfinished write)"""
+        with open(self.output_file, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                start = max(0, end - chunk_size)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b"\n")
+                if newline != -1:
+                    keep = start + newline + 1
+                    break
+                end = start
+            else:
+                keep = 0
+            
+            if keep < size:
+                logger.warning(f"Discarding {size - keep} bytes of a partial line at the end of {self.output_file}")
+                f.truncate(keep)
+    
+    def write(self, result: 'ClassificationResult') -> int:
+        """Append one result and sync to disk when due; returns the line's offset"""
+        import json
+        
+        line = (json.dumps(result.to_dict(), default=str, ensure_ascii=False) + "\n").encode('utf-8')
+        offset = self._offset
+        self._file.write(line)
+        self._file.flush()
+        self._offset += len(line)
+        self.written += 1
+        self._unsynced += 1
+        
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+        return offset
+    
+    def read(self, offset: int) -> 'ClassificationResult':
+        """Load the result written at `offset` back from the file"""
+        import json
+        from .models import ClassificationResult
+        
+        if self._reader is None:
+            self._reader = open(self.output_file, 'rb')
+        self._reader.seek(offset)
+        return ClassificationResult.from_dict(json.loads(self._reader.readline()))
+    
+    def sync(self):
+        """Force buffered results onto disk"""
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+    
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class DeadLetterWriter:
+    """Thread-safe JSONL record of queries that could not be classified
+    
+    Failed queries are left out of the results checkpoint, so a later
+    `--resume` run picks them up again; this file says why they failed.
+    The file is only created once something fails.
+    """
+    
+    def __init__(self, output_file: Path):
+        import threading
+        
+        self.output_file = Path(output_file)
+        self.written = 0
+        self._lock = threading.Lock()
+        self._file = None
+    
+    def write(self, query: 'Query', error: Exception, attempts: int = 1, retryable: bool = False):
+        import json
+        
+        record = {
+            "query": {"text": query.text, "index": query.index},
+            "error_type": type(error).__name__,
+            "error": str(error),
+            "attempts": attempts,
+            "retryable": retryable,
+            "timestamp": datetime.now().isoformat()
+        }
+        with self._lock:
+            if self._file is None:
+                self.output_file.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.output_file, 'a', encoding='utf-8')
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self.written += 1
+    
+    def close(self):
+        with self._lock:
+            if self._file is not None and not self._file.closed:
+                self._file.close()
+
+def iter_jsonl_results(jsonl_file: Path) -> Iterator[Dict[str, Any]]:
+    """Yield result dicts from a JSONL checkpoint, skipping a torn final line"""
+    import json
+    
+    if not jsonl_file.exists():
+        return
+    with open(jsonl_file, 'r', encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable line {line_num} in {jsonl_file}")
+
+def load_completed_indices(jsonl_file: Path) -> Set[int]:
+    """Query indices already present in a JSONL checkpoint"""
+    return {record["query"]["index"] for record in iter_jsonl_results(jsonl_file)}
+
+def compact_jsonl_results(jsonl_file: Path, output_file: Path) -> int:
+    """Rewrite a JSONL checkpoint as the legacy JSON results file
+    
+    Results are ordered by query index; if an index appears more than
+    once the latest line wins. Returns the number of results written.
+    """
+    by_index = {}
+    for record in iter_jsonl_results(jsonl_file):
+        by_index[record["query"]["index"]] = record
+    
+    _write_results_json([by_index[index] for index in sorted(by_index)], output_file)
+    return len(by_index)
+
+def iter_labelled_rows(file_path: Path) -> Iterator[Dict[str, Any]]:
+    """Yield {"query", "prime_category", "intents", "topics"} from an exported classification CSV
+    
+    Reads both the flat export (detailed_classifications.csv) and the
+    spreadsheet layout with a group header row above the column names.
+    Rows whose PRIME category is unknown (e.g. shifted by a stray comma)
+    are skipped.
+    """
+    import csv
+    from .prime_categories_mapping import PRIME_CATEGORIES, INTENT_SCHEMA, TOPIC_SCHEMA
+    
+    truthy = {"true", "x", "1", "yes", "y"}
+    with open(file_path, 'r', newline='', encoding='utf-8-sig') as f:
+        header = None
+        for row in csv.reader(f):
+            if header is None:
+                if "prime_category" in row:
+                    # The spreadsheet layout names the query column only in the row above
+                    header = row if row[0] == "query_text" else ["query_text"] + row
+                continue
+            
+            record = dict(zip(header, row))
+            query_text = (record.get("query_text") or "").strip()
+            prime_category = (record.get("prime_category") or "").strip()
+            if not query_text or prime_category not in PRIME_CATEGORIES:
+                continue
+            yield {
+                "query": query_text,
+                "prime_category": prime_category,
+                "intents": [name for name in INTENT_SCHEMA
+                            if (record.get(f"intent_{name}") or "").strip().lower() in truthy],
+                "topics": [name for name in TOPIC_SCHEMA
+                           if (record.get(f"topic_{name}") or "").strip().lower() in truthy]
+            }
+
 def load_cached_embeddings(cache_file: Path) -> Dict[str, Any]:
     """Load cached embeddings if they exist"""
     if cache_file.exists():
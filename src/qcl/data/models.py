@@ -58,4 +58,21 @@ class ClassificationResult:
             "confidence_score": self.confidence_score,
             "processing_time": self.processing_time,
             "timestamp": self.timestamp.isoformat()
-        }
\ No newline at end of file
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ClassificationResult":
+        """Rebuild a result from its to_dict() form"""
+        timestamp = data.get("timestamp")
+        return cls(
+            query=Query(text=data["query"]["text"], index=data["query"]["index"]),
+            annotation_schema=data["annotation_schema"],
+            entity_schema=data["entity_schema"],
+            intent_schema=data["intent_schema"],
+            topic_schema=data["topic_schema"],
+            prime_category=data["prime_category"],
+            research_notes=data.get("research_notes", ""),
+            confidence_score=data.get("confidence_score", 1.0),
+            processing_time=data.get("processing_time", 0.0),
+            timestamp=datetime.fromisoformat(timestamp) if timestamp else None
+        )
@@ -0,0 +1,239 @@
+"""Offline classification through the OpenAI Batch API"""
+
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ..core.retry import RETRYABLE_STATUS_CODES
+from ..data.models import Query, ClassificationResult
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+STATE_FILE = "batch_state.json"
+# Queries whose request bodies are built together (guideline retrieval is batched over them)
+PREPARE_BLOCK = 1000
+
+
+class BatchRequestError(Exception):
+    """A Batch API request failed, or its batch ended without answering it"""
+
+
+class BatchJobRunner:
+    """Writes, submits, polls and collects Batch API jobs for a set of queries
+
+    Progress is recorded in a state file inside `work_dir` after every
+    step, so running again with the same work directory resumes where a
+    previous process stopped instead of resubmitting. The state carries a
+    fingerprint of the queries and request settings; a state for other
+    inputs, or one whose results were already collected, is not resumed.
+    Requests that fail or go unanswered are written to `dead_letter`.
+    """
+
+    def __init__(self, classifier, work_dir: Path, max_requests_per_job: int = 50000,
+                 poll_interval: float = 60.0, dead_letter=None):
+        self.classifier = classifier
+        self.dead_letter = dead_letter
+        self.client = classifier.client
+        self.work_dir = Path(work_dir)
+        self.max_requests_per_job = max(1, max_requests_per_job)
+        self.poll_interval = poll_interval
+        self.state_file = self.work_dir / STATE_FILE
+        self.state: Dict[str, Any] = {}
+
+    def _save_state(self):
+        tmp_file = self.state_file.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        tmp_file.replace(self.state_file)
+
+    def fingerprint(self, queries: List[Query], guidelines: Dict[str, Any]) -> str:
+        """Hash of the query index -> text map and the request settings (model, prompt, response format)"""
+        digest = hashlib.sha256()
+        digest.update(self.classifier.request_fingerprint(guidelines).encode("utf-8"))
+        for query in queries:
+            digest.update(f"\x00{query.index}\x00{query.text}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def load_state(self, fingerprint: Optional[str] = None) -> bool:
+        """Load a previous run's state; returns True when resuming
+
+        A state written for a different fingerprint, or one already
+        collected, is left alone and a fresh run is started instead.
+        """
+        if not self.state_file.exists():
+            return False
+        with open(self.state_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("completed"):
+            logger.info(f"Previous batch run in {self.work_dir} was already collected; starting a new one")
+            return False
+        if fingerprint is not None and state.get("fingerprint") != fingerprint:
+            batch_ids = [job["batch_id"] for job in state.get("jobs", []) if "batch_id" in job]
+            logger.warning(f"{self.state_file} belongs to different queries or settings; starting a new run"
+                           + (f" (not resuming batches {', '.join(batch_ids)})" if batch_ids else ""))
+            return False
+        self.state = state
+        logger.info(f"Resuming batch run from {self.state_file} ({len(self.state.get('jobs', []))} jobs)")
+        return True
+
+    def prepare(self, queries: List[Query], guidelines: Dict[str, Any], fingerprint: Optional[str] = None):
+        """Write the request JSONL files, one per job"""
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.state = {
+            "fingerprint": fingerprint,
+            "queries": {str(query.index): query.text for query in queries},
+            # Queries whose requests use the leading chunks because guideline retrieval failed
+            "fallback_context": [],
+            "jobs": []
+        }
+
+        for job_num, start in enumerate(range(0, len(queries), self.max_requests_per_job)):
+            chunk = queries[start:start + self.max_requests_per_job]
+            input_path = self.work_dir / f"requests_{job_num:04d}.jsonl"
+            with open(input_path, "w", encoding="utf-8") as f:
+                for block_start in range(0, len(chunk), PREPARE_BLOCK):
+                    block = chunk[block_start:block_start + PREPARE_BLOCK]
+                    bodies, fallback = self.classifier.build_request_bodies(block, guidelines)
+                    if fallback:
+                        self.state["fallback_context"].extend(query.index for query in block)
+                    for query, body in zip(block, bodies):
+                        request = {
+                            "custom_id": f"query-{query.index}",
+                            "method": "POST",
+                            "url": BATCH_ENDPOINT,
+                            "body": body
+                        }
+                        f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            self.state["jobs"].append({"input_path": str(input_path), "request_count": len(chunk), "status": "prepared"})
+
+        self._save_state()
+        logger.info(f"Wrote {len(queries)} requests into {len(self.state['jobs'])} batch input files")
+
+    def submit(self):
+        """Upload input files and create batches for jobs not yet submitted"""
+        for job in self.state["jobs"]:
+            if "file_id" not in job:
+                with open(job["input_path"], "rb") as f:
+                    job["file_id"] = self.client.files.create(file=f, purpose="batch").id
+                self._save_state()
+                logger.info(f"Uploaded {job['input_path']} as {job['file_id']}")
+
+            if "batch_id" not in job:
+                batch = self.client.batches.create(
+                    input_file_id=job["file_id"],
+                    endpoint=BATCH_ENDPOINT,
+                    completion_window="24h"
+                )
+                job["batch_id"] = batch.id
+                job["status"] = batch.status
+                self._save_state()
+                logger.info(f"Submitted batch {batch.id} ({job['request_count']} requests)")
+
+    def poll(self, timeout: Optional[float] = None):
+        """Wait until every batch reaches a terminal status"""
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            open_jobs = [job for job in self.state["jobs"] if job["status"] not in TERMINAL_STATUSES]
+            for job in open_jobs:
+                batch = self.client.batches.retrieve(job["batch_id"])
+                if batch.status != job["status"]:
+                    counts = getattr(batch, "request_counts", None)
+                    progress = f" ({counts.completed}/{counts.total} done)" if counts else ""
+                    logger.info(f"Batch {job['batch_id']}: {job['status']} -> {batch.status}{progress}")
+                job["status"] = batch.status
+                job["output_file_id"] = batch.output_file_id
+                job["error_file_id"] = batch.error_file_id
+            self._save_state()
+
+            if all(job["status"] in TERMINAL_STATUSES for job in self.state["jobs"]):
+                return
+            if deadline and time.time() >= deadline:
+                raise TimeoutError(f"Batch jobs still running after {timeout:.0f}s; run again to resume")
+            time.sleep(self.poll_interval)
+
+    def _read_file(self, file_id: str) -> List[Dict[str, Any]]:
+        content = self.client.files.content(file_id)
+        return [json.loads(line) for line in content.text.splitlines() if line.strip()]
+
+    def _fail(self, query: Query, error: BatchRequestError, retryable: bool):
+        logger.error(f"✗ Batch request failed for query '{query.text}': {error}")
+        if self.dead_letter is not None:
+            self.dead_letter.write(query, error, attempts=1, retryable=retryable)
+
+    def collect(self, guidelines: Optional[Dict[str, Any]] = None) -> List[ClassificationResult]:
+        """Map batch outputs back into results, in query index order
+
+        Failed requests, unparseable responses and queries a failed or
+        expired batch never answered are dead-lettered and left out.
+        """
+        queries = {int(index): Query(text=text, index=int(index)) for index, text in self.state["queries"].items()}
+        fallback_context = set(self.state.get("fallback_context", []))
+        results: Dict[int, ClassificationResult] = {}
+        answered = set()
+        failed = 0
+
+        # Jobs hold consecutive runs of the query map, in order
+        ordered = list(queries.values())
+        start = 0
+        for job in self.state["jobs"]:
+            job_queries = ordered[start:start + job["request_count"]]
+            start += job["request_count"]
+            if job["status"] != "completed":
+                logger.error(f"Batch {job.get('batch_id')} ended as {job['status']}")
+            for file_id in (job.get("output_file_id"), job.get("error_file_id")):
+                if not file_id:
+                    continue
+                for line in self._read_file(file_id):
+                    index = int(line["custom_id"].split("-", 1)[1])
+                    query = queries.get(index)
+                    if query is None:
+                        continue
+                    answered.add(index)
+                    response = line.get("response") or {}
+                    status_code = response.get("status_code")
+                    if line.get("error") or status_code != 200:
+                        error = line.get("error") or (response.get("body") or {}).get("error")
+                        retryable = status_code in RETRYABLE_STATUS_CODES or (status_code or 0) >= 500
+                        self._fail(query, BatchRequestError(f"HTTP {status_code}: {error}"), retryable)
+                        failed += 1
+                        continue
+                    body = response["body"]
+                    result = self.classifier.result_from_response(
+                        query, body["choices"][0]["message"]["content"], guidelines,
+                        fallback=index in fallback_context
+                    )
+                    if result is None:
+                        failed += 1
+                        continue
+                    results[index] = result
+
+            for query in job_queries:
+                if query.index not in answered:
+                    error = BatchRequestError(f"Batch {job.get('batch_id')} ended as {job['status']} "
+                                              f"without answering this request")
+                    self._fail(query, error, retryable=job["status"] in ("expired", "cancelled"))
+                    answered.add(query.index)
+                    failed += 1
+
+        if failed:
+            logger.warning(f"{failed} queries have no batch result")
+        return [results[index] for index in sorted(results)]
+
+    def run(self, queries: List[Query], guidelines: Dict[str, Any],
+            timeout: Optional[float] = None) -> List[ClassificationResult]:
+        """Prepare (unless resuming), submit, poll and collect"""
+        fingerprint = self.fingerprint(queries, guidelines)
+        if not self.load_state(fingerprint):
+            self.prepare(queries, guidelines, fingerprint)
+        self.submit()
+        self.poll(timeout=timeout)
+        results = self.collect(guidelines)
+        # A later run with the same work directory must not return these results again
+        self.state["completed"] = True
+        self._save_state()
+        return results
@@ -0,0 +1,202 @@
+"""In-run query deduplication and result fan-out"""
+
+import dataclasses
+import hashlib
+import logging
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..data.models import Query, ClassificationResult
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueryNormalizer:
+    """Decides which query texts count as the same query"""
+    lowercase: bool = True
+    collapse_whitespace: bool = True
+    unicode_nfkc: bool = True
+
+    @classmethod
+    def from_config(cls, config) -> "QueryNormalizer":
+        return cls(
+            lowercase=config.dedupe_lowercase,
+            collapse_whitespace=config.dedupe_collapse_whitespace,
+            unicode_nfkc=config.dedupe_unicode_nfkc
+        )
+
+    def normalize(self, text: str) -> str:
+        if self.unicode_nfkc:
+            text = unicodedata.normalize("NFKC", text)
+        if self.lowercase:
+            text = text.casefold()
+        if self.collapse_whitespace:
+            text = " ".join(text.split())
+        return text
+
+
+@dataclass
+class DedupResult:
+    """Unique queries to classify plus the originals each one stands for"""
+    unique_queries: List[Query]
+    groups: Dict[int, List[Query]]
+    total_queries: int
+
+    @property
+    def duplicates(self) -> int:
+        """Number of API calls saved by classifying each group once"""
+        return self.total_queries - len(self.unique_queries)
+
+
+def deduplicate_queries(queries: List[Query], normalizer: QueryNormalizer = None) -> DedupResult:
+    """Collapse queries that normalize to the same text
+
+    The first occurrence of each normalized text is kept as the
+    representative; `groups` maps its index to every original query.
+    """
+    normalizer = normalizer or QueryNormalizer()
+    representatives: Dict[str, Query] = {}
+    groups: Dict[int, List[Query]] = {}
+
+    for query in queries:
+        key = normalizer.normalize(query.text)
+        representative = representatives.get(key)
+        if representative is None:
+            representatives[key] = query
+            groups[query.index] = [query]
+        else:
+            groups[representative.index].append(query)
+
+    result = DedupResult(list(representatives.values()), groups, len(queries))
+    if result.duplicates:
+        logger.info(f"Collapsed {result.total_queries} queries into {len(result.unique_queries)} unique queries")
+    return result
+
+
+def fan_out_result(result: ClassificationResult, dedup: DedupResult) -> List[ClassificationResult]:
+    """Copies of one unique query's result for every original query it stands for"""
+    fanned = []
+    for original in dedup.groups.get(result.query.index, [result.query]):
+        if original is result.query:
+            fanned.append(result)
+        else:
+            fanned.append(dataclasses.replace(result, query=original))
+    return fanned
+
+
+def fan_out_results(results: List[ClassificationResult], dedup: DedupResult) -> List[ClassificationResult]:
+    """Copy each unique query's result to every original query, in original order"""
+    fanned = []
+    for result in results:
+        fanned.extend(fan_out_result(result, dedup))
+
+    fanned.sort(key=lambda r: r.query.index)
+    return fanned
+
+
+class DuplicateOfFailedQuery(Exception):
+    """A duplicate left unclassified because its representative failed"""
+
+
+def dead_letter_failed_duplicates(results: List[ClassificationResult], dedup: DedupResult, dead_letter) -> int:
+    """Dead-letter the duplicates of representatives that have no result; returns how many"""
+    classified = {result.query.index for result in results}
+    count = 0
+    for index, group in dedup.groups.items():
+        if index in classified:
+            continue
+        for duplicate in group[1:]:
+            dead_letter.write(duplicate, DuplicateOfFailedQuery(f"duplicate of failed query {index} '{group[0].text}'"),
+                              attempts=0, retryable=True)
+            count += 1
+    return count
+
+
+class StreamingDeduplicator:
+    """Online deduplication for query streams that are never fully in memory
+
+    `unique()` passes through the first occurrence of each normalized
+    text. `complete()` fans a finished result out to the duplicates seen
+    so far; duplicates that turn up after their representative finished
+    are queued and returned by `drain_late()`, which loads the
+    representative's result back through the caller's `load` function.
+
+    Only a reference to each stored result is kept (e.g. its offset in
+    the JSONL checkpoint), not the result itself. Memory still grows with
+    the number of unique queries: a 16-byte digest of the normalized
+    text, the representative's index and its reference, roughly 200
+    bytes per unique query. Duplicates of a representative that failed
+    are written to `dead_letter` (if given) instead of being dropped.
+    """
+
+    def __init__(self, normalizer: QueryNormalizer = None, dead_letter=None):
+        self.normalizer = normalizer or QueryNormalizer()
+        self.dead_letter = dead_letter
+        self.total_queries = 0
+        self.unique_count = 0
+        self._representatives: Dict[bytes, int] = {}
+        self._groups: Dict[int, List[Query]] = {}
+        self._references: Dict[int, Any] = {}
+        self._failed: Dict[int, str] = {}
+        self._late: List[Tuple[Any, Query]] = []
+
+    @property
+    def duplicates(self) -> int:
+        """Number of API calls saved so far"""
+        return self.total_queries - self.unique_count
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.blake2b(self.normalizer.normalize(text).encode("utf-8"), digest_size=16).digest()
+
+    def _dead_letter_duplicate(self, duplicate: Query, representative: int, text: str):
+        if self.dead_letter is not None:
+            error = DuplicateOfFailedQuery(f"duplicate of failed query {representative} '{text}'")
+            self.dead_letter.write(duplicate, error, attempts=0, retryable=True)
+
+    def unique(self, queries: Iterable[Query]) -> Iterator[Query]:
+        """Yield only the first query for each normalized text"""
+        for query in queries:
+            self.total_queries += 1
+            key = self._key(query.text)
+            representative = self._representatives.get(key)
+
+            if representative is None:
+                self._representatives[key] = query.index
+                self._groups[query.index] = []
+                self.unique_count += 1
+                yield query
+            elif representative in self._references:
+                self._late.append((self._references[representative], query))
+            elif representative in self._failed:
+                self._dead_letter_duplicate(query, representative, self._failed[representative])
+            else:
+                self._groups[representative].append(query)
+
+    def complete(self, result: Optional[ClassificationResult], query: Query,
+                 reference: Any = None) -> List[ClassificationResult]:
+        """Record a representative's outcome and return copies of its result for the duplicates seen so far
+
+        `reference` locates the stored result for `drain_late()`; pass
+        None (with a None result) when the representative failed.
+        """
+        duplicates = self._groups.pop(query.index, [])
+        if result is None:
+            self._failed[query.index] = query.text
+            for duplicate in duplicates:
+                self._dead_letter_duplicate(duplicate, query.index, query.text)
+            return []
+        self._references[query.index] = reference
+        return [dataclasses.replace(result, query=duplicate) for duplicate in duplicates]
+
+    def drain_late(self, load: Callable[[Any], ClassificationResult]) -> List[ClassificationResult]:
+        """Results for duplicates that arrived after their representative finished"""
+        late, self._late = self._late, []
+        loaded = {}
+        fanned = []
+        for reference, query in late:
+            if reference not in loaded:
+                loaded[reference] = load(reference)
+            fanned.append(dataclasses.replace(loaded[reference], query=query))
+        return fanned
@@ -0,0 +1,241 @@
+"""Concurrent execution of query classification"""
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..data.models import Query, ClassificationResult
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ThroughputStats:
+    """Throughput figures for a classification run"""
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def queries_per_second(self) -> float:
+        return self.completed / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def queries_per_minute(self) -> float:
+        return self.queries_per_second * 60
+
+
+class AdaptiveConcurrency:
+    """AIMD controller for the number of classification calls in flight
+
+    Every round (as many completions as the current limit) the limit goes
+    up by one if p95 latency and the error rate look healthy, and is cut
+    by `decrease_factor` otherwise. Throttling (429s) cuts it at once, at
+    most once per round. Without a fixed `latency_target`, p95 counts as
+    healthy while it stays within `latency_tolerance` times the best p50
+    seen so far.
+    """
+
+    def __init__(self, initial: int = 5, min_limit: int = 1, max_limit: int = 50,
+                 latency_target: Optional[float] = None, latency_tolerance: float = 2.0,
+                 max_error_rate: float = 0.05, decrease_factor: float = 0.5, window: int = 100):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(max(initial, self.min_limit), self.max_limit)
+        self.latency_target = latency_target
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+        self.decrease_factor = decrease_factor
+        self.peak = self.limit
+        self.increases = 0
+        self.decreases = 0
+        self._latencies = deque(maxlen=window)
+        self._errors = deque(maxlen=window)
+        self._best_p50: Optional[float] = None
+        self._since_adjust = 0
+        self._since_cut = self.max_limit
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> "AdaptiveConcurrency":
+        return cls(
+            initial=config.concurrent_requests,
+            min_limit=config.min_concurrent_requests,
+            max_limit=config.max_concurrent_requests,
+            latency_target=config.latency_p95_target,
+            max_error_rate=config.max_error_rate
+        )
+
+    @staticmethod
+    def _percentile(values: List[float], fraction: float) -> float:
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(math.ceil(fraction * len(ordered))) - 1)]
+
+    def _set_limit(self, limit: int, reason: str):
+        limit = min(max(limit, self.min_limit), self.max_limit)
+        if limit == self.limit:
+            return
+        if limit > self.limit:
+            self.increases += 1
+            logger.debug(f"Concurrency {self.limit} -> {limit} ({reason})")
+        else:
+            self.decreases += 1
+            logger.info(f"Concurrency {self.limit} -> {limit} ({reason})")
+        self.limit = limit
+        self.peak = max(self.peak, limit)
+        self._since_adjust = 0
+
+    def _decrease(self, reason: str):
+        self._set_limit(int(self.limit * self.decrease_factor), reason)
+        self._since_cut = 0
+
+    def on_throttle(self, count: int = 1):
+        """React to rate-limit responses seen since the last call"""
+        with self._lock:
+            # Only one cut per round; the 429s of one burst belong together
+            if self._since_cut >= self.limit:
+                self._decrease(f"{count} throttled request(s)")
+
+    def record(self, latency: float, success: bool):
+        """Record one finished unit and adjust the limit at the end of a round"""
+        with self._lock:
+            self._latencies.append(latency)
+            self._errors.append(0 if success else 1)
+            self._since_adjust += 1
+            self._since_cut += 1
+            if self._since_adjust < self.limit:
+                return
+
+            recent = list(self._latencies)[-self.limit:]
+            p50 = self._percentile(recent, 0.50)
+            p95 = self._percentile(recent, 0.95)
+            self._best_p50 = p50 if self._best_p50 is None else min(self._best_p50, p50)
+            target = self.latency_target or self._best_p50 * self.latency_tolerance
+            error_rate = sum(self._errors) / len(self._errors)
+
+            if error_rate > self.max_error_rate:
+                self._decrease(f"error rate {error_rate:.0%}")
+            elif p95 > target:
+                self._decrease(f"p95 latency {p95:.2f}s over {target:.2f}s")
+            else:
+                self._set_limit(self.limit + 1, f"p95 latency {p95:.2f}s")
+            self._since_adjust = 0
+
+
+class ConcurrentClassifier:
+    """Keeps up to `max_workers` classification calls in flight on a thread pool
+
+    With `batch_size` above 1 each call classifies a batch of queries in
+    one prompt through QueryClassifier.classify_batch. With a `controller`
+    the in-flight limit follows AdaptiveConcurrency instead of staying
+    at `max_workers`.
+    """
+
+    def __init__(self, classifier, max_workers: int = 5, batch_size: int = 1,
+                 controller: Optional[AdaptiveConcurrency] = None):
+        self.classifier = classifier
+        self.controller = controller
+        self.max_workers = controller.max_limit if controller else max(1, max_workers)
+        self.batch_size = max(1, batch_size)
+        self.stats = ThroughputStats()
+        self._throttled_seen = 0
+
+    @property
+    def concurrency(self) -> int:
+        """Current in-flight limit"""
+        return self.controller.limit if self.controller else self.max_workers
+
+    def _observe(self, latency: float, success: bool):
+        """Feed a finished unit and any new throttling into the controller"""
+        if self.controller is None:
+            return
+        retry_policy = getattr(self.classifier, "retry_policy", None)
+        if retry_policy is not None:
+            throttled = retry_policy.stats.throttled
+            if throttled > self._throttled_seen:
+                self.controller.on_throttle(throttled - self._throttled_seen)
+                self._throttled_seen = throttled
+        self.controller.record(latency, success)
+
+    def _classify_unit(self, queries: List[Query], guidelines: Dict[str, Any]) -> List[ClassificationResult]:
+        """Classify one unit of work (a query or a batch) on a worker thread"""
+        unit_start = time.time()
+        if len(queries) == 1:
+            results = [self.classifier.classify_query(queries[0], guidelines)]
+        else:
+            results = self.classifier.classify_batch(queries, guidelines)
+        elapsed = time.time() - unit_start
+        for result in results:
+            if result is not None:
+                result.processing_time = elapsed
+        return results
+
+    def _iter_units(self, queries: Iterable[Query]) -> Iterator[List[Tuple[int, Query]]]:
+        """Group queries into units of up to batch_size"""
+        unit = []
+        for position, query in enumerate(queries):
+            unit.append((position, query))
+            if len(unit) >= self.batch_size:
+                yield unit
+                unit = []
+        if unit:
+            yield unit
+
+    def iter_completed(self, queries: Iterable[Query],
+                       guidelines: Dict[str, Any]) -> Iterator[Tuple[int, Query, Optional[ClassificationResult]]]:
+        """Yield (position, query, result) as classifications finish.
+
+        Queries are pulled from the iterable lazily so no more than
+        `max_workers` calls are ever pending. A failed query (an exception,
+        or None from the classifier) yields a result of None.
+        """
+        self.stats = ThroughputStats()
+        start_time = time.time()
+        pending = {}
+        submitted_at = {}
+        unit_iter = self._iter_units(queries)
+        exhausted = False
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="qcl-worker") as pool:
+            while True:
+                while not exhausted and len(pending) < self.concurrency:
+                    try:
+                        unit = next(unit_iter)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    future = pool.submit(self._classify_unit, [query for _, query in unit], guidelines)
+                    pending[future] = unit
+                    submitted_at[future] = time.time()
+                    self.stats.submitted += len(unit)
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    unit = pending.pop(future)
+                    latency = time.time() - submitted_at.pop(future)
+                    try:
+                        results = future.result()
+                        failed = sum(1 for result in results if result is None)
+                        self.stats.completed += len(unit) - failed
+                        self.stats.failed += failed
+                    except Exception as e:
+                        texts = ", ".join(f"'{query.text}'" for _, query in unit)
+                        logger.error(f"✗ Failed to classify {texts}: {e}")
+                        results = [None] * len(unit)
+                        failed = len(unit)
+                        self.stats.failed += len(unit)
+                    self._observe(latency, failed == 0)
+                    self.stats.elapsed = time.time() - start_time
+                    for (position, query), result in zip(unit, results):
+                        yield position, query, result
+
+        self.stats.elapsed = time.time() - start_time
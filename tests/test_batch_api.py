@@ -0,0 +1,165 @@
+"""BatchJobRunner resume behaviour against a fake Batch API client"""
+
+import json
+from types import SimpleNamespace
+
+from qcl.data.loaders import DeadLetterWriter
+from qcl.data.models import Query
+from qcl.pipeline.batch_api import BatchJobRunner
+
+
+class FakeBatchClient:
+    """Completes every batch immediately, answering each request with its query text
+
+    Queries in `rejected` get an HTTP 429 line; with `status="expired"` the
+    batch ends after answering only the first request.
+    """
+
+    def __init__(self, rejected=(), status="completed"):
+        self.rejected = set(rejected)
+        self.status = status
+        self.uploads = {}
+        self.outputs = {}
+        self.batches_created = 0
+        self.files = SimpleNamespace(create=self._create_file, content=self._content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    def _create_file(self, file, purpose):
+        file_id = f"file-{len(self.uploads)}"
+        self.uploads[file_id] = file.read().decode("utf-8")
+        return SimpleNamespace(id=file_id)
+
+    def _create_batch(self, input_file_id, endpoint, completion_window):
+        self.batches_created += 1
+        batch_id = f"batch-{self.batches_created}"
+        lines = []
+        for line in self.uploads[input_file_id].splitlines():
+            request = json.loads(line)
+            text = request["body"]["query"]
+            if text in self.rejected:
+                response = {"status_code": 429, "body": {"error": {"message": "Rate limit reached"}}}
+            else:
+                response = {"status_code": 200, "body": {"choices": [{"message": {"content": text}}]}}
+            lines.append(json.dumps({"custom_id": request["custom_id"], "response": response}))
+        if self.status != "completed":
+            lines = lines[:1]
+        self.outputs[batch_id] = "\n".join(lines)
+        return SimpleNamespace(id=batch_id, status="validating")
+
+    def _retrieve_batch(self, batch_id):
+        return SimpleNamespace(status=self.status, output_file_id=f"out-{batch_id}", error_file_id=None,
+                               request_counts=None)
+
+    def _content(self, file_id):
+        return SimpleNamespace(text=self.outputs[file_id[len("out-"):]])
+
+
+class FakeClassifier:
+    def __init__(self, client, settings="v1", fallback=False):
+        self.client = client
+        self.settings = settings
+        self.fallback = fallback
+        self.fallback_results = []
+
+    def request_fingerprint(self, guidelines):
+        return self.settings
+
+    def build_request_bodies(self, queries, guidelines):
+        return [{"query": query.text} for query in queries], self.fallback
+
+    def result_from_response(self, query, response_text, guidelines=None, fallback=False):
+        if fallback:
+            self.fallback_results.append(query.index)
+        # Stands in for an unparseable response, which the real classifier dead-letters
+        if response_text == "garbage":
+            return None
+        return (query.index, response_text)
+
+
+def make_queries(*texts):
+    return [Query(text=text, index=index) for index, text in enumerate(texts)]
+
+
+def run(work_dir, queries, client, settings="v1"):
+    runner = BatchJobRunner(FakeClassifier(client, settings), work_dir, poll_interval=0)
+    return runner.run(queries, {})
+
+
+def test_second_run_with_different_queries_is_not_served_old_results(tmp_path):
+    client = FakeBatchClient()
+    assert run(tmp_path, make_queries("gmail", "ebay"), client) == [(0, "gmail"), (1, "ebay")]
+    assert run(tmp_path, make_queries("walmart", "espn", "bbc"), client) == [(0, "walmart"), (1, "espn"), (2, "bbc")]
+    assert client.batches_created == 2
+
+
+def test_completed_run_is_not_resumed_for_the_same_queries(tmp_path):
+    client = FakeBatchClient()
+    run(tmp_path, make_queries("gmail"), client)
+    assert json.loads((tmp_path / "batch_state.json").read_text())["completed"] is True
+    assert run(tmp_path, make_queries("gmail"), client) == [(0, "gmail")]
+    assert client.batches_created == 2
+
+
+def test_interrupted_run_resumes_submitted_batches(tmp_path):
+    client = FakeBatchClient()
+    queries = make_queries("gmail", "ebay")
+    runner = BatchJobRunner(FakeClassifier(client), tmp_path, poll_interval=0)
+    runner.prepare(queries, {}, runner.fingerprint(queries, {}))
+    runner.submit()  # process stops here
+
+    assert run(tmp_path, queries, client) == [(0, "gmail"), (1, "ebay")]
+    assert client.batches_created == 1
+
+
+def test_changed_request_settings_start_a_new_run(tmp_path):
+    client = FakeBatchClient()
+    queries = make_queries("gmail")
+    runner = BatchJobRunner(FakeClassifier(client, "v1"), tmp_path, poll_interval=0)
+    runner.prepare(queries, {}, runner.fingerprint(queries, {}))
+    runner.submit()
+
+    run(tmp_path, queries, client, settings="v2")
+    assert client.batches_created == 2
+
+
+def dead_letters(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_failed_requests_are_dead_lettered_not_defaulted(tmp_path):
+    client = FakeBatchClient(rejected={"ebay"})
+    dead_letter = DeadLetterWriter(tmp_path / "dead_letter.jsonl")
+    runner = BatchJobRunner(FakeClassifier(client), tmp_path, poll_interval=0, dead_letter=dead_letter)
+
+    assert runner.run(make_queries("gmail", "ebay", "garbage"), {}) == [(0, "gmail")]
+    dead_letter.close()
+
+    records = dead_letters(tmp_path / "dead_letter.jsonl")
+    assert [record["query"]["index"] for record in records] == [1]
+    assert records[0]["error_type"] == "BatchRequestError"
+    assert records[0]["retryable"] is True
+
+
+def test_unanswered_requests_of_an_expired_batch_are_dead_lettered(tmp_path):
+    client = FakeBatchClient(status="expired")
+    dead_letter = DeadLetterWriter(tmp_path / "dead_letter.jsonl")
+    runner = BatchJobRunner(FakeClassifier(client), tmp_path, poll_interval=0, dead_letter=dead_letter)
+
+    assert runner.run(make_queries("gmail", "ebay", "bbc"), {}) == [(0, "gmail")]
+    dead_letter.close()
+
+    records = dead_letters(tmp_path / "dead_letter.jsonl")
+    assert [record["query"]["index"] for record in records] == [1, 2]
+    assert all("expired" in record["error"] for record in records)
+
+
+def test_fallback_context_is_remembered_until_collection(tmp_path):
+    client = FakeBatchClient()
+    queries = make_queries("gmail", "ebay")
+    preparer = BatchJobRunner(FakeClassifier(client, fallback=True), tmp_path, poll_interval=0)
+    preparer.prepare(queries, {}, preparer.fingerprint(queries, {}))
+    preparer.submit()  # process stops here
+
+    classifier = FakeClassifier(client)
+    assert BatchJobRunner(classifier, tmp_path, poll_interval=0).run(queries, {}) == [(0, "gmail"), (1, "ebay")]
+    assert classifier.fallback_results == [0, 1]
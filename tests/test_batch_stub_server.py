@@ -0,0 +1,140 @@
+"""classify-batch end to end against a local stub OpenAI server (openai_base_url)"""
+
+import email.parser
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from qcl.classification.classifier import QueryClassifier
+from qcl.classification.retrieval import create_retriever
+from qcl.core.config import Config
+from qcl.data.models import Query
+from qcl.pipeline.batch_api import BatchJobRunner
+
+GUIDELINES = {"chunks": [
+    "Navigational queries name a site to visit, such as a login page.",
+    "Weather queries ask for a forecast or current conditions.",
+    "Shopping queries compare products and prices.",
+]}
+
+
+def embed(text):
+    """Three-dimensional stand-in embedding: weather, navigation, anything else"""
+    text = text.lower()
+    return [float("weather" in text or "forecast" in text), float("login" in text or "site" in text), 0.1]
+
+
+class StubOpenAI(BaseHTTPRequestHandler):
+    """Just enough of /v1/embeddings, /v1/files and /v1/batches for a batch run"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, payload, content_type="application/json"):
+        body = payload.encode("utf-8") if isinstance(payload, str) else json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        state = self.server.state
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path == "/v1/embeddings":
+            texts = json.loads(body)["input"]
+            state["embedding_requests"].append(texts)
+            self._reply({"object": "list", "model": "stub",
+                         "data": [{"object": "embedding", "index": i, "embedding": embed(text)}
+                                  for i, text in enumerate(texts)],
+                         "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)}})
+        elif self.path == "/v1/files":
+            message = email.parser.BytesParser().parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body)
+            content = next(part.get_payload(decode=True) for part in message.walk() if part.get_filename())
+            file_id = f"file-{len(state['files'])}"
+            state["files"][file_id] = content.decode("utf-8")
+            self._reply({"id": file_id, "object": "file", "bytes": len(content), "created_at": 0,
+                         "filename": "requests.jsonl", "purpose": "batch", "status": "processed"})
+        elif self.path == "/v1/batches":
+            request = json.loads(body)
+            batch_id = f"batch-{len(state['batches'])}"
+            lines = []
+            for line in state["files"][request["input_file_id"]].splitlines():
+                line = json.loads(line)
+                prompt = line["body"]["messages"][-1]["content"]
+                state["prompts"][line["custom_id"]] = prompt
+                category = "Weather" if "Weather queries" in prompt else "Navigational"
+                content = json.dumps({"prime_category": category, "confidence_score": 0.9})
+                lines.append(json.dumps({"custom_id": line["custom_id"], "response": {"status_code": 200, "body": {
+                    "object": "chat.completion",
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                 "finish_reason": "stop"}],
+                }}}))
+            state["files"][f"out-{batch_id}"] = "\n".join(lines)
+            state["batches"][batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": request["endpoint"], "created_at": 0,
+                "input_file_id": request["input_file_id"], "completion_window": "24h", "status": "validating",
+                "output_file_id": None, "error_file_id": None,
+            }
+            self._reply(state["batches"][batch_id])
+        else:
+            self.send_error(404)
+
+    def do_GET(self):
+        state = self.server.state
+        parts = self.path.strip("/").split("/")
+        if parts[:2] == ["v1", "batches"]:
+            batch = dict(state["batches"][parts[2]], status="completed", output_file_id=f"out-{parts[2]}")
+            self._reply(batch)
+        elif parts[:2] == ["v1", "files"] and parts[-1] == "content":
+            self._reply(state["files"][parts[2]], "application/jsonl")
+        else:
+            self.send_error(404)
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAI)
+    server.state = {"embedding_requests": [], "files": {}, "batches": {}, "prompts": {}}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def classifier(stub_server, tmp_path):
+    config = Config()
+    config.openai_api_key = "test"
+    config.openai_base_url = f"http://127.0.0.1:{stub_server.server_port}/v1"
+    config.cache_enabled = False
+    config.guideline_retrieval = "embedding"
+    config.retrieval_top_k = 1
+    config.processed_dir = tmp_path
+    classifier = QueryClassifier(config)
+    classifier.retriever = create_retriever(config, classifier.client, GUIDELINES,
+                                            classifier.rate_limiter, classifier.retry_policy)
+    yield classifier
+    classifier.close()
+
+
+def test_batch_run_through_the_stub_server(stub_server, classifier, tmp_path):
+    queries = [Query(text=text, index=index)
+               for index, text in enumerate(["gmail login", "boston weather", "weather forecast", "ebay site"])]
+    runner = BatchJobRunner(classifier, tmp_path / "batch", poll_interval=0)
+
+    results = runner.run(queries, GUIDELINES)
+
+    assert [(result.query.index, result.prime_category) for result in results] == [
+        (0, "Navigational"), (1, "Weather"), (2, "Weather"), (3, "Navigational"),
+    ]
+    # One request indexes the chunks, one more embeds every query; not one per query
+    assert stub_server.state["embedding_requests"] == [GUIDELINES["chunks"], [query.text for query in queries]]
+    prompts = stub_server.state["prompts"]
+    assert GUIDELINES["chunks"][0] in prompts["query-0"]
+    assert GUIDELINES["chunks"][1] not in prompts["query-0"]
+    assert GUIDELINES["chunks"][1] in prompts["query-1"]
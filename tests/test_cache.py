@@ -0,0 +1,90 @@
+"""Classification cache keys, hits and eviction"""
+
+import pytest
+
+from qcl.data import cache as cache_module
+from qcl.data.cache import ClassificationCache, cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def open_cache(tmp_path, clock):
+    caches = []
+
+    def open_cache(**kwargs):
+        cache = ClassificationCache(tmp_path / "cache.sqlite", **kwargs)
+        caches.append(cache)
+        return cache
+
+    yield open_cache
+    for cache in caches:
+        cache.close()
+
+
+KEY_ARGS = ("Gmail Login", "prompt", "context", "gpt-4.1", 0.1)
+
+
+def test_key_ignores_case_and_whitespace_in_the_query():
+    assert cache_key(*KEY_ARGS) == cache_key("  gmail   LOGIN ", *KEY_ARGS[1:])
+
+
+@pytest.mark.parametrize("position, value", [
+    (0, "gmail logout"), (1, "prompt v2"), (2, "other context"), (3, "gpt-4.1-mini"), (4, 0.2),
+])
+def test_key_changes_with_every_input(position, value):
+    changed = list(KEY_ARGS)
+    changed[position] = value
+    assert cache_key(*changed) != cache_key(*KEY_ARGS)
+
+
+def test_key_parts_cannot_run_together():
+    assert cache_key("ab", "c", "", "m", 0) != cache_key("a", "bc", "", "m", 0)
+
+
+def test_round_trip_and_stats(open_cache):
+    cache = open_cache()
+    assert cache.get("k") is None
+    cache.put("k", {"prime_category": "Navigational"}, "gmail")
+    assert cache.get("k") == {"prime_category": "Navigational"}
+    assert cache.get("k", record_stats=False) is not None
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.stores) == (1, 1, 1)
+
+
+def test_entries_survive_reopening(open_cache):
+    open_cache().put("k", {"a": 1})
+    assert open_cache().get("k") == {"a": 1}
+
+
+def test_expired_entries_are_misses(open_cache, clock):
+    cache = open_cache(max_age_days=1)
+    cache.put("k", {"a": 1})
+    clock.now += 2 * 86400
+    assert cache.get("k") is None
+    assert len(cache) == 0
+    assert cache.stats.evictions == 1
+
+
+def test_least_recently_used_entries_are_evicted_first(open_cache, clock):
+    cache = open_cache(max_entries=2, max_age_days=None)
+    for key in ("a", "b", "c"):
+        cache.put(key, {"key": key})
+        clock.now += 1
+    cache.get("a")
+
+    assert cache.evict() == 1
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
@@ -0,0 +1,63 @@
+"""Token chunker: heading splits, section packing and windowing"""
+
+import pytest
+
+from qcl.data.chunking import TokenChunker, _WordPieceEncoding, split_sections
+
+
+def word_chunker(max_tokens, overlap_tokens=0, respect_headings=True):
+    # One token per word keeps the budgets readable whether or not tiktoken is installed
+    chunker = TokenChunker(max_tokens, overlap_tokens, respect_headings)
+    chunker._encoding = _WordPieceEncoding()
+    return chunker
+
+
+def section(heading, words):
+    return f"{heading}\n" + " ".join(f"w{i}" for i in range(words)) + "\n"
+
+
+def test_sections_start_at_headings():
+    text = "intro text\nENTITY SCHEMA\nentities here\n2.1 Intent Schema\nintents here\n"
+    assert split_sections(text) == ["intro text\n", "ENTITY SCHEMA\nentities here\n",
+                                    "2.1 Intent Schema\nintents here\n"]
+    # Single capitalised words and short acronyms are not headings
+    assert split_sections("Use the API for NASA data") == ["Use the API for NASA data"]
+
+
+def test_small_sections_are_packed_whole():
+    text = section("FIRST PART", 3) + section("SECOND PART", 3) + section("THIRD PART", 3)
+    # 5 words per section: two fit in a 12-token budget, the third starts a new chunk
+    assert word_chunker(12).chunk(text) == [
+        "FIRST PART w0 w1 w2 SECOND PART w0 w1 w2",
+        "THIRD PART w0 w1 w2",
+    ]
+
+
+def test_chunks_break_only_at_headings():
+    text = section("FIRST PART", 6) + section("SECOND PART", 6)
+    chunks = word_chunker(10).chunk(text)
+    assert chunks == ["FIRST PART w0 w1 w2 w3 w4 w5", "SECOND PART w0 w1 w2 w3 w4 w5"]
+
+    # Without headings the budget alone decides where chunks end
+    assert word_chunker(10, respect_headings=False).chunk(text) == [
+        "FIRST PART w0 w1 w2 w3 w4 w5 SECOND PART",
+        "w0 w1 w2 w3 w4 w5",
+    ]
+
+
+def test_long_sections_are_windowed_on_their_own():
+    text = section("SHORT PART", 2) + section("LONG PART", 12) + section("LAST PART", 1)
+    # Windows of 6 tokens stepping by 4 repeat two tokens between neighbours,
+    # and neither neighbouring section is packed into them
+    assert word_chunker(6, overlap_tokens=2).chunk(text) == [
+        "SHORT PART w0 w1",
+        "LONG PART w0 w1 w2 w3",
+        "w2 w3 w4 w5 w6 w7",
+        "w6 w7 w8 w9 w10 w11",
+        "LAST PART w0",
+    ]
+
+
+def test_overlap_must_fit_the_budget():
+    with pytest.raises(ValueError):
+        TokenChunker(max_tokens=64, overlap_tokens=64)
@@ -0,0 +1,255 @@
+"""QueryClassifier response handling that needs no API calls"""
+
+import json
+import re
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from qcl.classification.classifier import QueryClassifier
+from qcl.core.config import Config
+from qcl.core.rate_limit import RateLimiter
+from qcl.data.cache import ClassificationCache
+from qcl.data.loaders import DeadLetterWriter
+from qcl.data.models import Query
+from qcl.data.prime_categories_mapping import ENTITY_SCHEMA, INTENT_SCHEMA
+
+
+@pytest.fixture
+def classifier(tmp_path):
+    config = Config()
+    config.openai_api_key = "test"
+    config.cache_enabled = False
+    classifier = QueryClassifier(config, dead_letter=DeadLetterWriter(tmp_path / "dead_letter.jsonl"))
+    yield classifier
+    classifier.dead_letter.close()
+    classifier.close()
+
+
+def test_unparseable_batch_response_is_dead_lettered(classifier, tmp_path):
+    assert classifier.result_from_response(Query(text="gmail", index=7), "Sorry, I can't help") is None
+    classifier.dead_letter.close()
+
+    record = json.loads((tmp_path / "dead_letter.jsonl").read_text())
+    assert record["query"] == {"text": "gmail", "index": 7}
+    assert record["error_type"] == "ResponseParseError"
+    assert record["retryable"] is True
+
+
+def test_compact_reply_without_intents_is_expanded(classifier):
+    classifier.config.compact_responses = True
+    data = classifier._parse_response(json.dumps({"prime_category": "OTHER_None_of_These", "confidence_score": 0.6}))
+    assert set(data["intent_schema"]) == set(INTENT_SCHEMA)
+    assert set(data["entity_schema"]) == set(ENTITY_SCHEMA)
+    assert classifier.usage.compact_queries == 1
+
+
+def test_full_replies_are_not_expanded_without_compact_responses(classifier):
+    data = classifier._parse_response(json.dumps({"prime_category": "OTHER_None_of_These", "confidence_score": 0.6}))
+    assert "intent_schema" not in data
+    assert classifier.usage.compact_queries == 0
+
+
+def test_parseable_batch_response_becomes_a_result(classifier):
+    response = json.dumps({"prime_category": "Navigational", "confidence_score": 0.9})
+    result = classifier.result_from_response(Query(text="gmail", index=7), response)
+    assert result.query.index == 7
+    assert classifier.dead_letter.written == 0
+
+
+class FailingCompletions:
+    """chat.completions.with_raw_response stand-in whose every call raises `error`"""
+
+    def __init__(self, error):
+        self.error = error
+
+    def create(self, **request):
+        raise self.error
+
+
+def chat_request():
+    return {"model": "gpt-4.1", "messages": [{"role": "user", "content": "gmail"}], "max_tokens": 4000}
+
+
+@pytest.mark.parametrize("error, refunded", [
+    (openai.RateLimitError("slow down", response=httpx.Response(
+        429, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions")), body=None), True),
+    (openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions")), False),
+])
+def test_failed_call_refunds_tokens_only_when_rejected(classifier, error, refunded):
+    classifier.rate_limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=10000)
+    classifier.chat_client = SimpleNamespace(chat=SimpleNamespace(
+        completions=SimpleNamespace(with_raw_response=FailingCompletions(error))))
+    classifier.rate_limiter.acquire(1000)
+
+    with pytest.raises(type(error)):
+        classifier._send_chat(chat_request(), 1000, 1)
+    assert classifier.rate_limiter.tokens.available == pytest.approx(10000 if refunded else 9000, abs=1)
+
+
+class AnsweringCompletions:
+    """chat.completions.with_raw_response stand-in answering with `content`, or `content(model, prompt)`"""
+
+    def __init__(self, content):
+        self.content = content
+        self.prompts = []
+        self.models = []
+
+    def create(self, **request):
+        prompt = request["messages"][-1]["content"]
+        self.prompts.append(prompt)
+        self.models.append(request["model"])
+        content = self.content(request["model"], prompt) if callable(self.content) else self.content
+        message = SimpleNamespace(content=content, refusal=None)
+        usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20, total_tokens=120, prompt_tokens_details=None)
+        response = SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+        return SimpleNamespace(headers={}, parse=lambda: response)
+
+
+def answer_with(classifier, content):
+    """Route the classifier's chat calls to an AnsweringCompletions"""
+    completions = AnsweringCompletions(content)
+    classifier.chat_client = SimpleNamespace(chat=SimpleNamespace(
+        completions=SimpleNamespace(with_raw_response=completions)))
+    return completions
+
+
+class BrokenRetriever:
+    cache_token = "embedding:test"
+
+    def context_for(self, query_texts):
+        raise RuntimeError("embeddings endpoint down")
+
+
+def test_answer_from_fallback_context_is_not_cached_under_the_retriever_key(classifier, tmp_path):
+    classifier.cache = ClassificationCache(tmp_path / "cache.sqlite")
+    classifier.retriever = BrokenRetriever()
+    completions = answer_with(classifier, json.dumps({"prime_category": "Navigational", "confidence_score": 0.9}))
+    guidelines = {"chunks": ["first chunk", "second chunk", "third chunk", "fourth chunk"]}
+    query = Query(text="gmail", index=0)
+
+    assert classifier.classify_query(query, guidelines).prime_category == "Navigational"
+    assert "first chunk" in completions.prompts[0]
+    assert classifier.cache.get(classifier._get_cache_key(query, guidelines)) is None
+    assert classifier.cache.get(classifier._get_cache_key(query, guidelines, fallback=True)) is not None
+
+    # Without a working retriever the next run asks again instead of reusing the fallback answer
+    classifier.classify_query(query, guidelines)
+    assert len(completions.prompts) == 2
+    classifier.cache.close()
+
+
+@pytest.fixture
+def cascade(tmp_path):
+    config = Config()
+    config.openai_api_key = "test"
+    config.cache_enabled = False
+    config.cascade_enabled = True
+    config.cascade_model = "cheap-model"
+    config.cascade_threshold = 0.85
+    classifier = QueryClassifier(config)
+    yield classifier
+    classifier.close()
+
+
+GUIDELINES = {"chunks": ["Navigational queries name a site.", "Shopping queries look for products."]}
+
+
+def reply(prime_category, confidence):
+    return json.dumps({"prime_category": prime_category, "confidence_score": confidence})
+
+
+@pytest.mark.parametrize("confidence, escalated", [(0.84, True), (0.85, False)])
+def test_cheap_answer_below_the_threshold_escalates(cascade, confidence, escalated):
+    completions = answer_with(cascade, lambda model, prompt: (
+        reply("Navigational", confidence) if model == "cheap-model" else reply("Shopping", 0.95)))
+
+    result = cascade.classify_query(Query(text="amazon", index=0), GUIDELINES)
+
+    cheap, full = cascade.tiers
+    assert result.prime_category == ("Shopping" if escalated else "Navigational")
+    assert completions.models == (["cheap-model", "gpt-4.1"] if escalated else ["cheap-model"])
+    assert (cheap.queries, cheap.calls, cheap.accepted, cheap.escalated_low_confidence) == (
+        1, 1, 0 if escalated else 1, 1 if escalated else 0)
+    assert (full.queries, full.calls, full.accepted) == ((1, 1, 1) if escalated else (0, 0, 0))
+    assert cheap.prompt_tokens == 100
+    assert full.prompt_tokens == (100 if escalated else 0)
+
+
+def test_invalid_cheap_answer_escalates(cascade):
+    answer_with(cascade, lambda model, prompt: (
+        reply("Not_A_Category", 0.99) if model == "cheap-model" else reply("Shopping", 0.95)))
+
+    assert cascade.classify_query(Query(text="amazon", index=0), GUIDELINES).prime_category == "Shopping"
+    assert cascade.tiers[0].escalated_invalid == 1
+    assert cascade.tiers[0].escalated_low_confidence == 0
+    assert cascade.tiers[1].accepted == 1
+
+
+def test_batch_cascade_escalates_only_the_unsure_queries(cascade):
+    confidence = {"gmail": 0.95, "jaguar": 0.5, "apple": 0.4}
+
+    def answer(model, prompt):
+        listed = re.findall(r'^(\d+): "(.*)"$', prompt, re.MULTILINE)
+        if model == "cheap-model":
+            return json.dumps([dict(json.loads(reply("Navigational", confidence[text])), index=int(index))
+                               for index, text in listed])
+        return json.dumps([dict(json.loads(reply("Shopping", 0.9)), index=int(index)) for index, _ in listed])
+
+    completions = answer_with(cascade, answer)
+    queries = [Query(text=text, index=index) for index, text in enumerate(confidence)]
+    results = cascade.classify_batch(queries, GUIDELINES)
+
+    assert [result.prime_category for result in results] == ["Navigational", "Shopping", "Shopping"]
+    # The escalated pair goes to the full model as one smaller batch
+    assert completions.models == ["cheap-model", "gpt-4.1"]
+    assert '0: "gmail"' not in completions.prompts[1]
+    cheap, full = cascade.tiers
+    assert (cheap.queries, cheap.calls, cheap.accepted, cheap.escalated_low_confidence) == (3, 1, 1, 2)
+    assert (full.queries, full.calls, full.accepted) == (2, 1, 2)
+    assert cheap.hit_rate == pytest.approx(1 / 3)
+
+
+def batch_reply(*elements):
+    return json.dumps([dict(json.loads(reply(category, 0.9)), index=index) for index, category in elements])
+
+
+@pytest.mark.parametrize("response", [
+    batch_reply((3, "Navigational"), (5, "Shopping")),
+    json.dumps({"results": json.loads(batch_reply((3, "Navigational"), (5, "Shopping")))}),
+    "Here you go:\n" + batch_reply((3, "Navigational"), (5, "Shopping")) + "\nDone.",
+])
+def test_batched_response_is_split_by_index(classifier, response):
+    elements = classifier._parse_batch_response(response)
+    assert {index: data["prime_category"] for index, data in elements.items()} == {3: "Navigational", 5: "Shopping"}
+    assert "index" not in elements[3]
+
+
+def test_malformed_batch_elements_are_skipped(classifier):
+    response = json.dumps([{"prime_category": "Weather"}, "Shopping", {"index": "x"},
+                           {"index": "4", "prime_category": "Weather"}])
+    assert list(classifier._parse_batch_response(response)) == [4]
+    assert classifier._parse_batch_response("Sorry, I can't help") == {}
+
+
+def test_queries_missing_from_a_partial_batch_reply_are_requeued(classifier):
+    def answer(model, prompt):
+        if "BATCH MODE" in prompt:
+            # The reply drops query 1 and garbles query 2
+            return json.dumps(json.loads(batch_reply((0, "Navigational"))) + [{"index": 2, "prime_category": 7}])
+        return reply("Shopping", 0.9)
+
+    completions = answer_with(classifier, answer)
+    queries = [Query(text=text, index=index) for index, text in enumerate(["gmail", "shoes", "tv deals"])]
+    results = classifier.classify_batch(queries, GUIDELINES)
+
+    assert [(result.query.index, result.prime_category) for result in results] == [
+        (0, "Navigational"), (1, "Shopping"), (2, "Shopping")]
+    # One batched call, then one single call per re-queued query
+    assert len(completions.prompts) == 3
+    assert "shoes" in completions.prompts[1] and "tv deals" in completions.prompts[2]
+    assert "BATCH MODE" not in completions.prompts[1] + completions.prompts[2]
+    assert classifier.usage.requeued == 2
+    assert classifier.usage.batched_queries == 3
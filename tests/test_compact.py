@@ -0,0 +1,72 @@
+"""Expansion of the compact response contract into the full schemas"""
+
+from qcl.classification.compact import expand_compact_classification, is_compact
+from qcl.data.prime_categories_mapping import ANNOTATION_SCHEMA, ENTITY_SCHEMA, INTENT_SCHEMA, TOPIC_SCHEMA
+
+
+COMPACT = {
+    "annotations": ["misspelled_malformed"],
+    "entities": [{"type": "website", "name": "gmail"}, {"type": "website", "name": "google"}],
+    "intents": ["website"],
+    "topics": ["tech_electronics"],
+    "prime_category": "Navigational",
+    "research_notes": "login page",
+    "confidence_score": 0.95,
+}
+
+
+def test_detects_compact_data():
+    assert is_compact(COMPACT)
+    assert not is_compact(expand_compact_classification(COMPACT))
+    assert not is_compact({"intent_schema": {}, "prime_category": "Weather"})
+    assert not is_compact(["intents"])
+
+
+def test_reply_without_intents_is_compact():
+    reply = {"prime_category": "OTHER_None_of_These", "confidence_score": 0.6}
+    assert is_compact(reply)
+    expanded = expand_compact_classification(reply)
+    assert set(expanded["intent_schema"]) == set(INTENT_SCHEMA)
+    assert not any(expanded["intent_schema"].values())
+
+
+def test_expands_to_every_schema_field():
+    expanded = expand_compact_classification(COMPACT)
+
+    assert set(expanded["annotation_schema"]) == set(ANNOTATION_SCHEMA)
+    assert set(expanded["entity_schema"]) == set(ENTITY_SCHEMA)
+    assert set(expanded["intent_schema"]) == set(INTENT_SCHEMA)
+    assert set(expanded["topic_schema"]) == set(TOPIC_SCHEMA)
+    assert [name for name, flag in expanded["annotation_schema"].items() if flag] == ["misspelled_malformed"]
+    assert [name for name, flag in expanded["intent_schema"].items() if flag] == ["website"]
+    assert [name for name, flag in expanded["topic_schema"].items() if flag] == ["tech_electronics"]
+    assert expanded["entity_schema"]["website"] == ["gmail", "google"]
+    assert expanded["prime_category"] == "Navigational"
+    assert expanded["research_notes"] == "login page"
+    assert expanded["confidence_score"] == 0.95
+
+
+def test_entities_may_be_a_dict_of_lists():
+    expanded = expand_compact_classification({"intents": [], "entities": {"website": ["gmail"], "media_title": None}})
+    assert expanded["entity_schema"]["website"] == ["gmail"]
+    assert expanded["entity_schema"]["media_title"] == []
+
+
+def test_unknown_names_and_malformed_entities_are_dropped():
+    expanded = expand_compact_classification({
+        "intents": ["website", "made_up"],
+        "topics": ["not_a_topic"],
+        "entities": [{"type": "not_a_type", "name": "x"}, {"type": "website"}, "gmail"],
+    })
+    assert [name for name, flag in expanded["intent_schema"].items() if flag] == ["website"]
+    assert not any(expanded["topic_schema"].values())
+    assert not any(expanded["entity_schema"].values())
+    assert "made_up" not in expanded["intent_schema"]
+
+
+def test_missing_fields_get_defaults_and_index_is_kept():
+    expanded = expand_compact_classification({"intents": None, "index": 3})
+    assert not any(expanded["intent_schema"].values())
+    assert expanded["prime_category"] is None
+    assert expanded["confidence_score"] == 0.5
+    assert expanded["index"] == 3
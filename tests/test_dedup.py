@@ -0,0 +1,118 @@
+"""Query deduplication and fan-out, batch and streaming"""
+
+import json
+
+from qcl.data.loaders import DeadLetterWriter, JsonlResultWriter, iter_jsonl_results
+from qcl.data.models import ClassificationResult, Query
+from qcl.pipeline.dedup import (
+    QueryNormalizer, StreamingDeduplicator, deduplicate_queries, fan_out_results, dead_letter_failed_duplicates
+)
+
+
+def make_queries(*texts):
+    return [Query(text=text, index=index) for index, text in enumerate(texts)]
+
+
+def make_result(query, category="Navigational"):
+    return ClassificationResult(query=query, annotation_schema={}, entity_schema={}, intent_schema={},
+                                topic_schema={}, prime_category=category)
+
+
+def dead_letters(path):
+    return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+
+
+def test_normalizer():
+    normalizer = QueryNormalizer()
+    assert normalizer.normalize("  Gmail\tLOGIN ") == "gmail login"
+    assert normalizer.normalize("ｇｍａｉｌ") == "gmail"
+    assert QueryNormalizer(lowercase=False).normalize("Gmail") == "Gmail"
+
+
+def test_batch_fan_out_restores_every_original_query():
+    queries = make_queries("gmail", "ebay", "GMAIL", " gmail ", "ebay")
+    dedup = deduplicate_queries(queries)
+    assert [query.index for query in dedup.unique_queries] == [0, 1]
+    assert dedup.duplicates == 3
+
+    results = [make_result(query, query.text) for query in dedup.unique_queries]
+    fanned = fan_out_results(results, dedup)
+
+    assert [(result.query.index, result.query.text, result.prime_category) for result in fanned] == [
+        (0, "gmail", "gmail"), (1, "ebay", "ebay"), (2, "GMAIL", "gmail"), (3, " gmail ", "gmail"), (4, "ebay", "ebay")
+    ]
+
+
+def test_batch_duplicates_of_failed_queries_are_dead_lettered(tmp_path):
+    dedup = deduplicate_queries(make_queries("gmail", "ebay", "GMAIL", "ebay"))
+    dead_letter = DeadLetterWriter(tmp_path / "dead_letter.jsonl")
+
+    assert dead_letter_failed_duplicates([make_result(Query("ebay", 1))], dedup, dead_letter) == 1
+    dead_letter.close()
+
+    records = dead_letters(tmp_path / "dead_letter.jsonl")
+    assert [record["query"]["index"] for record in records] == [2]
+    assert records[0]["error_type"] == "DuplicateOfFailedQuery"
+
+
+def stream(dedup, queries, outcomes, writer):
+    """Drive the deduplicator the way the classify command does, completing each query as soon as it is yielded"""
+    for query in dedup.unique(queries):
+        result = None if outcomes.get(query.text) == "fail" else make_result(query, query.text)
+        offset = writer.write(result) if result is not None else None
+        for fanned in dedup.complete(result, query, offset) + dedup.drain_late(writer.read):
+            writer.write(fanned)
+    for fanned in dedup.drain_late(writer.read):
+        writer.write(fanned)
+
+
+def test_streaming_fans_out_late_duplicates_from_the_checkpoint(tmp_path):
+    dedup = StreamingDeduplicator()
+    with JsonlResultWriter(tmp_path / "results.jsonl") as writer:
+        stream(dedup, make_queries("gmail", "ebay", "Gmail", "EBAY", "gmail"), {}, writer)
+
+    records = sorted(iter_jsonl_results(tmp_path / "results.jsonl"), key=lambda record: record["query"]["index"])
+    assert [(record["query"]["index"], record["query"]["text"], record["prime_category"]) for record in records] == [
+        (0, "gmail", "gmail"), (1, "ebay", "ebay"), (2, "Gmail", "gmail"), (3, "EBAY", "ebay"), (4, "gmail", "gmail")
+    ]
+    assert dedup.total_queries == 5 and dedup.unique_count == 2 and dedup.duplicates == 3
+
+
+def test_streaming_fans_out_to_duplicates_seen_while_in_flight(tmp_path):
+    dedup = StreamingDeduplicator()
+    queries = make_queries("gmail", "GMAIL", "gmail ")
+    unique = dedup.unique(queries)
+    representative = next(unique)
+    assert list(unique) == []
+
+    fanned = dedup.complete(make_result(representative), representative, reference=0)
+
+    assert [result.query.index for result in fanned] == [1, 2]
+    assert dedup.drain_late(lambda reference: None) == []
+
+
+def test_streaming_keeps_references_not_results(tmp_path):
+    dedup = StreamingDeduplicator()
+    with JsonlResultWriter(tmp_path / "results.jsonl") as writer:
+        stream(dedup, make_queries("gmail", "ebay"), {}, writer)
+
+    assert all(isinstance(reference, int) for reference in dedup._references.values())
+    assert all(isinstance(key, bytes) for key in dedup._representatives)
+
+
+def test_streaming_duplicates_of_a_failed_query_are_dead_lettered(tmp_path):
+    dead_letter = DeadLetterWriter(tmp_path / "dead_letter.jsonl")
+    dedup = StreamingDeduplicator(dead_letter=dead_letter)
+    queries = make_queries("gmail", "GMAIL", "ebay", "gmail")
+
+    unique = dedup.unique(queries)
+    representative = next(unique)
+    assert next(unique).text == "ebay"  # "GMAIL" is queued behind the in-flight "gmail"
+    assert dedup.complete(None, representative) == []
+    assert list(unique) == []  # the late "gmail" is dead-lettered straight away
+    dead_letter.close()
+
+    records = dead_letters(tmp_path / "dead_letter.jsonl")
+    assert [record["query"]["index"] for record in records] == [1, 3]
+    assert all("duplicate of failed query 0" in record["error"] for record in records)
+    assert all(record["retryable"] for record in records)
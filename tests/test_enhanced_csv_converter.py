@@ -0,0 +1,43 @@
+"""CSV converter golden output: files written by the original per-row converter for tests/data/converter/results.json"""
+
+import importlib.util
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+SCRIPT = Path(__file__).parents[1] / "scripts" / "scripts" / "enhanced_csv_converter.py"
+GOLDEN = Path(__file__).parent / "data" / "converter"
+OUTPUTS = ["detailed_classifications.csv", "prime_category_report.csv", "meta_aggregation_report.csv"]
+
+
+@pytest.fixture(scope="module")
+def converter():
+    spec = importlib.util.spec_from_file_location("enhanced_csv_converter", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def converted(converter, tmp_path, monkeypatch, capsys):
+    # The input covers null flags, scalar and unknown entities, unknown intent/topic keys,
+    # dict-shaped, missing and empty PRIME categories, a result without schemas and explicit null fields
+    (tmp_path / "data" / "output").mkdir(parents=True)
+    shutil.copy(GOLDEN / "results.json", tmp_path / "results.json")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "argv", ["enhanced_csv_converter.py", "results.json"])
+    assert converter.main()
+    return tmp_path / "data" / "output", capsys.readouterr().out
+
+
+@pytest.mark.parametrize("name", OUTPUTS)
+def test_csv_matches_the_original_converter(converted, name):
+    output_dir, _ = converted
+    assert (output_dir / name).read_text(encoding="utf-8") == (GOLDEN / name).read_text(encoding="utf-8")
+
+
+def test_summary_matches_the_original_converter(converted):
+    _, stdout = converted
+    assert stdout == (GOLDEN / "summary.txt").read_text(encoding="utf-8")
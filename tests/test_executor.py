@@ -0,0 +1,201 @@
+"""ConcurrentClassifier ordering, laziness and error handling"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+from qcl.data.models import Query
+from qcl.pipeline.executor import AdaptiveConcurrency, ConcurrentClassifier
+
+
+class FakeClassifier:
+    """Echoes the query back; 'boom' raises, 'fail' gives None, 'slow' takes longer"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def _answer(self, query):
+        if query.text == "boom":
+            raise RuntimeError("unexpected")
+        if query.text == "fail":
+            return None
+        return SimpleNamespace(text=query.text.upper())
+
+    def classify_query(self, query, guidelines):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        time.sleep(0.05 if query.text == "slow" else 0.005)
+        with self._lock:
+            self.in_flight -= 1
+        return self._answer(query)
+
+    def classify_batch(self, queries, guidelines):
+        self.batches.append([query.text for query in queries])
+        return [self._answer(query) for query in queries]
+
+
+def make_queries(*texts):
+    return [Query(text=text, index=index) for index, text in enumerate(texts)]
+
+
+def test_positions_map_results_back_to_input_order():
+    runner = ConcurrentClassifier(FakeClassifier(), max_workers=4)
+    queries = make_queries("slow", "a", "b", "c", "d")
+
+    completed = list(runner.iter_completed(queries, {}))
+
+    # The slow first query finishes last, but its position still identifies it
+    assert completed[-1][0] == 0
+    by_position = {position: result.text for position, _, result in completed}
+    assert by_position == {0: "SLOW", 1: "A", 2: "B", 3: "C", 4: "D"}
+    assert runner.stats.submitted == 5 and runner.stats.completed == 5
+
+
+def test_failures_yield_none_and_are_counted():
+    runner = ConcurrentClassifier(FakeClassifier(), max_workers=3)
+    queries = make_queries("a", "boom", "fail", "b")
+
+    results = {position: result for position, _, result in runner.iter_completed(queries, {})}
+
+    assert results[1] is None and results[2] is None
+    assert results[0].text == "A" and results[3].text == "B"
+    assert runner.stats.completed == 2
+    assert runner.stats.failed == 2
+
+
+def test_in_flight_calls_never_exceed_max_workers():
+    classifier = FakeClassifier()
+    runner = ConcurrentClassifier(classifier, max_workers=3)
+
+    list(runner.iter_completed(make_queries(*["q"] * 30), {}))
+
+    assert 1 < classifier.peak_in_flight <= 3
+
+
+def test_queries_are_pulled_lazily():
+    pulled = []
+
+    def queries():
+        for index in range(100):
+            pulled.append(index)
+            yield Query(text="q", index=index)
+
+    runner = ConcurrentClassifier(FakeClassifier(), max_workers=2)
+    stream = runner.iter_completed(queries(), {})
+    next(stream)
+
+    assert len(pulled) <= 4
+    stream.close()
+
+
+def test_batches_keep_positions_and_a_failed_batch_fails_all_its_queries():
+    classifier = FakeClassifier()
+    runner = ConcurrentClassifier(classifier, max_workers=2, batch_size=2)
+    queries = make_queries("a", "b", "c", "boom", "e")
+
+    results = {position: result for position, _, result in runner.iter_completed(queries, {})}
+
+    assert sorted(classifier.batches) == [["a", "b"], ["c", "boom"]]
+    assert results[0].text == "A" and results[1].text == "B" and results[4].text == "E"
+    assert results[2] is None and results[3] is None
+    assert runner.stats.failed == 2
+
+
+def run_round(controller, latency=1.0, failures=0):
+    """Record one round (as many completions as the current limit)"""
+    for i in range(controller.limit):
+        controller.record(latency, success=i >= failures)
+
+
+def test_healthy_rounds_add_one_at_a_time():
+    controller = AdaptiveConcurrency(initial=4, max_limit=10)
+    for _ in range(3):
+        controller.record(1.0, True)
+    assert controller.limit == 4
+
+    controller.record(1.0, True)
+    assert controller.limit == 5
+    run_round(controller)
+    assert controller.limit == 6
+    assert (controller.increases, controller.decreases, controller.peak) == (2, 0, 6)
+
+
+def test_latency_over_the_best_p50_halves_the_limit():
+    controller = AdaptiveConcurrency(initial=8, latency_tolerance=2.0)
+    run_round(controller, latency=1.0)
+    run_round(controller, latency=1.9)
+    assert controller.limit == 10
+
+    # 3s is more than twice the best p50 of 1s
+    run_round(controller, latency=3.0)
+    assert controller.limit == 5
+    assert controller.decreases == 1
+    assert controller.peak == 10
+
+
+def test_fixed_latency_target():
+    controller = AdaptiveConcurrency(initial=4, latency_target=0.5)
+    run_round(controller, latency=0.6)
+    assert controller.limit == 2
+
+
+def test_error_rate_over_the_limit_cuts():
+    controller = AdaptiveConcurrency(initial=8, max_error_rate=0.1)
+    run_round(controller, failures=1)
+    assert controller.limit == 4
+
+    # The error rate is measured over the recent window: 1 error in 12 is healthy again
+    run_round(controller)
+    assert controller.limit == 5
+
+
+def test_throttling_cuts_at_once_but_once_per_round():
+    controller = AdaptiveConcurrency(initial=10)
+    controller.on_throttle(3)
+    assert controller.limit == 5
+    controller.on_throttle()
+    assert controller.limit == 5
+
+    # The next round's healthy completions raise it again; a new burst then cuts
+    run_round(controller)
+    assert controller.limit == 6
+    controller.on_throttle()
+    assert controller.limit == 6
+    controller.record(1.0, True)
+    controller.on_throttle()
+    assert controller.limit == 3
+    assert controller.decreases == 2
+
+
+def test_limit_stays_within_bounds():
+    controller = AdaptiveConcurrency(initial=2, min_limit=2, max_limit=3)
+    for _ in range(3):
+        run_round(controller)
+    assert controller.limit == 3
+    assert controller.increases == 1
+
+    controller.on_throttle()
+    controller.on_throttle()
+    for _ in range(3):
+        run_round(controller, failures=1)
+    assert controller.limit == 2
+    assert controller.decreases == 1
+
+
+def test_executor_feeds_new_throttles_to_the_controller():
+    classifier = FakeClassifier()
+    classifier.retry_policy = SimpleNamespace(stats=SimpleNamespace(throttled=0))
+    runner = ConcurrentClassifier(classifier, controller=AdaptiveConcurrency(initial=8))
+
+    runner._observe(1.0, True)
+    assert runner.concurrency == 8
+    classifier.retry_policy.stats.throttled = 2
+    runner._observe(1.0, True)
+    assert runner.concurrency == 4
+    # Already-seen throttles are not counted again
+    runner._observe(1.0, True)
+    assert runner.controller.decreases == 1
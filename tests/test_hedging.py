@@ -0,0 +1,178 @@
+"""Request hedging on a fake clock: when a hedge fires, which attempt wins, how the loser is counted"""
+
+import threading
+from concurrent.futures import wait as real_wait
+
+import pytest
+
+from qcl.core import hedging
+from qcl.core.hedging import RequestHedger, percentile
+
+
+class FakeClock:
+    """Stands in for the time module; only attempts and the hedge timeout move it"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class Attempt:
+    """One scripted send: takes `latency` fake seconds, optionally held until `gate` opens"""
+
+    def __init__(self, clock, latency, result=None, error=None, gated=False, on_start=None):
+        self.clock = clock
+        self.latency = latency
+        self.result = result
+        self.error = error
+        self.gated = gated
+        self.on_start = on_start
+        self.gate = threading.Event()
+        self.started = threading.Event()
+
+    def __call__(self):
+        self.started.set()
+        if self.on_start is not None:
+            self.on_start()
+        if self.gated:
+            assert self.gate.wait(5)
+        self.clock.now += self.latency
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(hedging, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def script(monkeypatch, clock):
+    """Attempts the hedger runs next; the hedge timeout elapses on the fake clock, not in real time"""
+    attempts = {}
+
+    def fake_wait(futures, timeout=None, return_when="ALL_COMPLETED"):
+        primary = attempts["primary"]
+        if timeout is None or not primary.gated:
+            return real_wait(futures, return_when=return_when)
+        # A held primary is still running when the timeout expires
+        assert primary.started.wait(5)
+        clock.now += timeout
+        return real_wait(futures, timeout=0, return_when=return_when)
+
+    monkeypatch.setattr(hedging, "wait", fake_wait)
+    return attempts
+
+
+def send_from(script):
+    def send(is_hedge):
+        return script["hedge" if is_hedge else "primary"]()
+    return send
+
+
+@pytest.fixture
+def hedger(clock, script):
+    hedger = RequestHedger(percentile=0.95, budget=1.0, min_samples=3)
+    # Warm up with primaries taking 1, 2 and 3 seconds
+    for latency in (1.0, 2.0, 3.0):
+        script["primary"] = Attempt(clock, latency, result="warm-up")
+        assert hedger.call(send_from(script)) == "warm-up"
+    yield hedger
+    hedger.close()
+
+
+def finish(hedger):
+    """Let abandoned attempts run to completion (and their callbacks fire)"""
+    hedger._pool.shutdown(wait=True)
+
+
+def test_nearest_rank_percentile():
+    assert percentile([], 0.95) == 0.0
+    assert percentile([3.0, 1.0, 2.0], 0.5) == 2.0
+    assert percentile([float(n) for n in range(1, 101)], 0.95) == 95.0
+
+
+def test_no_hedge_while_warming_up(clock, script):
+    hedger = RequestHedger(min_samples=3, budget=1.0)
+    for latency in (1.0, 2.0):
+        script["primary"] = Attempt(clock, latency, result="ok")
+        hedger.call(send_from(script))
+        assert hedger.threshold() is None
+    script["primary"] = Attempt(clock, 30.0, result="ok")
+    hedger.call(send_from(script))
+
+    assert hedger.threshold() == 30.0
+    assert hedger.stats.hedges == 0
+    assert hedger.stats.primary_latencies == hedger.stats.effective_latencies == [1.0, 2.0, 30.0]
+    hedger.close()
+
+
+def test_hedge_fires_after_the_threshold_and_wins(clock, script, hedger):
+    assert hedger.threshold() == 3.0
+    script["primary"] = primary = Attempt(clock, 10.0, result="primary", gated=True)
+    script["hedge"] = Attempt(clock, 0.5, result="hedge")
+
+    assert hedger.call(send_from(script)) == "hedge"
+    assert hedger.stats.hedges == 1
+    assert hedger.stats.hedge_wins == 1
+    # The caller waited out the 3s threshold plus the hedge's 0.5s
+    assert hedger.stats.effective_latencies[-1] == 3.5
+
+    # The abandoned primary keeps running; once it returns its full latency
+    # still counts towards the threshold, while the hedge's latency never does
+    primary.gate.set()
+    finish(hedger)
+    assert hedger.stats.primary_latencies[-1] == 13.5
+    assert list(hedger._recent) == [1.0, 2.0, 3.0, 13.5]
+
+
+def test_primary_finishing_first_beats_the_hedge(clock, script, hedger):
+    script["primary"] = primary = Attempt(clock, 4.0, result="primary", gated=True)
+    # The primary returns as soon as the hedge has been sent; the hedge is still running
+    script["hedge"] = hedge = Attempt(clock, 1.0, result="hedge", gated=True, on_start=primary.gate.set)
+
+    assert hedger.call(send_from(script)) == "primary"
+    assert hedger.stats.hedges == 1
+    assert hedger.stats.hedge_wins == 0
+    assert hedger.stats.effective_latencies[-1] == 7.0
+
+    hedge.gate.set()
+    finish(hedger)
+    assert hedger.stats.primary_latencies[-1] == 7.0
+    assert len(hedger._recent) == 4
+
+
+def test_failed_primary_loses_to_a_successful_hedge(clock, script, hedger):
+    script["primary"] = primary = Attempt(clock, 1.0, error=TimeoutError("primary"), gated=True)
+    script["hedge"] = Attempt(clock, 1.0, result="hedge", on_start=primary.gate.set)
+
+    assert hedger.call(send_from(script)) == "hedge"
+    finish(hedger)
+    # Failed attempts are not latency samples
+    assert len(hedger._recent) == 3
+
+
+def test_both_attempts_failing_raises_the_primary_error(clock, script, hedger):
+    script["primary"] = primary = Attempt(clock, 1.0, error=TimeoutError("primary"), gated=True)
+    script["hedge"] = Attempt(clock, 1.0, error=ConnectionError("hedge"), on_start=primary.gate.set)
+
+    with pytest.raises(TimeoutError, match="primary"):
+        hedger.call(send_from(script))
+    assert hedger.stats.hedges == 1
+    assert hedger.stats.hedge_wins == 0
+
+
+def test_budget_caps_the_share_of_hedged_requests():
+    hedger = RequestHedger(budget=0.05)
+    hedger.stats.requests = 19
+    assert not hedger._take_budget()
+    hedger.stats.requests = 20
+    assert hedger._take_budget()
+    assert not hedger._take_budget()
+    assert hedger.stats.hedges == 1
+    hedger.close()
@@ -0,0 +1,75 @@
+"""JSONL checkpoint writing, resuming and compaction"""
+
+import json
+
+from qcl.data.loaders import JsonlResultWriter, compact_jsonl_results, load_completed_indices
+from qcl.data.models import ClassificationResult, Query
+
+
+def make_result(index):
+    return ClassificationResult(
+        query=Query(text=f"query {index}", index=index),
+        annotation_schema={}, entity_schema={}, intent_schema={}, topic_schema={},
+        prime_category={"prime_category": "Other"},
+    )
+
+
+def test_resume_after_torn_line_keeps_every_result(tmp_path):
+    checkpoint = tmp_path / "results.jsonl"
+    with JsonlResultWriter(checkpoint) as writer:
+        for index in range(2):
+            writer.write(make_result(index))
+    # Simulate a crash in the middle of writing result 2
+    with open(checkpoint, "a", encoding="utf-8") as f:
+        f.write(json.dumps(make_result(2).to_dict(), default=str)[:40])
+
+    assert load_completed_indices(checkpoint) == {0, 1}
+
+    with JsonlResultWriter(checkpoint) as writer:
+        for index in (2, 3):
+            writer.write(make_result(index))
+
+    assert load_completed_indices(checkpoint) == {0, 1, 2, 3}
+    output = tmp_path / "results.json"
+    assert compact_jsonl_results(checkpoint, output) == 4
+    with open(output, encoding="utf-8") as f:
+        data = json.load(f)
+    assert [entry["query"]["index"] for entry in data["results"]] == [0, 1, 2, 3]
+
+
+def test_reopening_clean_checkpoint_leaves_it_untouched(tmp_path):
+    checkpoint = tmp_path / "results.jsonl"
+    with JsonlResultWriter(checkpoint) as writer:
+        writer.write(make_result(0))
+    before = checkpoint.read_bytes()
+
+    JsonlResultWriter(checkpoint).close()
+
+    assert checkpoint.read_bytes() == before
+
+
+def test_torn_only_line_is_dropped(tmp_path):
+    checkpoint = tmp_path / "results.jsonl"
+    checkpoint.write_text('{"query": {"ind', encoding="utf-8")
+
+    with JsonlResultWriter(checkpoint) as writer:
+        writer.write(make_result(5))
+
+    assert load_completed_indices(checkpoint) == {5}
+
+
+def test_results_can_be_read_back_by_offset(tmp_path):
+    results = [make_result(index) for index in range(3)]
+    with JsonlResultWriter(tmp_path / "results.jsonl") as writer:
+        offsets = [writer.write(result) for result in results]
+        assert writer.read(offsets[1]).to_dict() == results[1].to_dict()
+
+
+def test_offsets_continue_after_reopening(tmp_path):
+    checkpoint = tmp_path / "results.jsonl"
+    with JsonlResultWriter(checkpoint) as writer:
+        writer.write(make_result(0))
+    with JsonlResultWriter(checkpoint) as writer:
+        offset = writer.write(make_result(1))
+        assert offset == len(checkpoint.read_bytes().splitlines(keepends=True)[0])
+        assert writer.read(offset).query.index == 1
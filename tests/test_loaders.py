@@ -0,0 +1,30 @@
+"""Streaming query CSV loader"""
+
+import pytest
+
+from qcl.data.loaders import iter_queries_from_csv
+
+
+def test_indices_are_row_numbers_across_chunks(tmp_path):
+    csv_file = tmp_path / "queries.csv"
+    csv_file.write_text("query,volume\ngmail,10\n  ,3\nebay,5\n walmart ,1\n", encoding="utf-8")
+
+    queries = list(iter_queries_from_csv(csv_file, chunksize=2))
+
+    assert [(query.index, query.text) for query in queries] == [(0, "gmail"), (2, "ebay"), (3, "walmart")]
+
+
+def test_an_index_column_is_kept(tmp_path):
+    csv_file = tmp_path / "results.llm_queries.csv"
+    csv_file.write_text("index,query\n17,gmail\n4,\n902,\"ebay, motors\"\n", encoding="utf-8")
+
+    queries = list(iter_queries_from_csv(csv_file, chunksize=2))
+
+    assert [(query.index, query.text) for query in queries] == [(17, "gmail"), (902, "ebay, motors")]
+
+
+def test_query_column_is_required(tmp_path):
+    csv_file = tmp_path / "queries.csv"
+    csv_file.write_text("text\ngmail\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="query"):
+        list(iter_queries_from_csv(csv_file))
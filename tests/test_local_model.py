@@ -0,0 +1,99 @@
+"""Local n-gram model: features, calibration, training and persistence"""
+
+import zlib
+
+import numpy as np
+import pytest
+
+from qcl.classification.local_model import HashedNgramVectorizer, LocalModel, calibrate_threshold
+
+
+def labelled(texts, prime_category, intents, topics):
+    return [{"query": text, "prime_category": prime_category, "intents": intents, "topics": topics}
+            for text in texts]
+
+
+BRANDS = ["amazon", "ebay", "walmart", "target", "bestbuy", "etsy", "costco", "kohls", "macys", "wayfair"]
+RECORDS = (
+    labelled([f"{brand} {word}" for brand in BRANDS for word in ("login", "sign in", "account", "website")],
+             "Navigational", ["website"], [])
+    + labelled([f"best {thing} {year}" for thing in ("laptop", "phone", "tv", "camera", "headphones",
+                                                      "tablet", "monitor", "router", "printer", "watch")
+                for year in (2021, 2022, 2023, 2024)],
+               "Research_Product", ["shopping", "research"], ["tech_electronics"])
+)
+
+
+@pytest.fixture(scope="module")
+def model():
+    return LocalModel.train(RECORDS, HashedNgramVectorizer(n_features=4096), epochs=20, precision=0.9)
+
+
+def test_features_are_stable_and_never_empty():
+    vectorizer = HashedNgramVectorizer(n_features=1024)
+    assert np.array_equal(vectorizer.features("Gmail Login"), vectorizer.features("gmail   login"))
+    assert len(vectorizer.features("")) == 1
+    indices, indptr, scale = vectorizer.transform(["gmail", "", "best laptop"])
+    assert indptr[0] == 0 and indptr[-1] == len(indices)
+    assert np.all(indices < 1024)
+    assert np.allclose(scale, 1 / np.sqrt(np.diff(indptr)))
+
+
+def test_calibrated_threshold_reaches_the_target_precision():
+    confidence = np.array([0.99, 0.95, 0.9, 0.8, 0.7, 0.6])
+    correct = np.array([True, True, True, False, True, False])
+    assert calibrate_threshold(confidence, correct, 1.0) == 0.9
+    assert calibrate_threshold(confidence, correct, 0.8) == 0.7
+    assert calibrate_threshold(np.array([0.9]), np.array([False]), 0.5) == 1.0
+
+
+def test_learns_separable_categories(model):
+    predictions = model.predict(["newegg login", "best speakers 2024"])
+    assert [p.prime_category for p in predictions] == ["Navigational", "Research_Product"]
+    assert predictions[0].intents == ["website"]
+    assert set(predictions[1].intents) == {"shopping", "research"}
+    assert predictions[1].topics == ["tech_electronics"]
+    assert model.metrics["holdout_rows"] > 0
+
+
+def test_saved_threshold_matches_the_returned_model(model):
+    # The held-out metrics must describe the model that is returned, not a refit
+    held_out = [record for record in RECORDS if zlib.crc32(record["query"].encode("utf-8")) % 1000 < 200]
+    predictions = model.predict([record["query"] for record in held_out])
+    accepted = [p.prime_category == record["prime_category"]
+                for p, record in zip(predictions, held_out) if p.confidence >= model.threshold]
+    assert len(held_out) == model.metrics["holdout_rows"]
+    assert len(accepted) / len(held_out) == pytest.approx(model.metrics["holdout_coverage"])
+    assert sum(accepted) / len(accepted) == pytest.approx(model.metrics["holdout_precision"])
+    assert model.metrics["holdout_precision"] >= 0.9
+
+
+def test_answers_carry_no_entities_or_annotations(model):
+    data = model.classification_data(model.predict(["amazon login"])[0])
+    assert all(names == [] for names in data["entity_schema"].values())
+    assert not any(data["annotation_schema"].values())
+
+
+def test_only_confident_predictions_are_answered(model):
+    model.threshold = 1.01
+    assert model.classify("amazon login") is None
+    model.threshold = 0.0
+    data = model.classify("amazon login")
+    assert data["prime_category"] == "Navigational"
+    assert data["intent_schema"]["website"] is True
+    assert model.stats.checked == 2 and model.stats.confident == 1
+
+
+def test_save_and_load_round_trip(model, tmp_path):
+    model.save(tmp_path / "model.npz")
+    loaded = LocalModel.load(tmp_path / "model.npz")
+
+    texts = ["ebay account", "best tv 2022", "something else"]
+    assert loaded.predict(texts) == model.predict(texts)
+    assert loaded.threshold == model.threshold
+    assert loaded.metrics == model.metrics
+
+
+def test_missing_model_file_is_reported(tmp_path):
+    with pytest.raises(FileNotFoundError, match="train-local"):
+        LocalModel.load(tmp_path / "missing.npz")
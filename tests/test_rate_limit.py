@@ -0,0 +1,133 @@
+"""RateLimiter budgeting, refunds and header sync on a fake clock"""
+
+import pytest
+
+from qcl.core import rate_limit
+from qcl.core.rate_limit import RateLimiter, TokenBucket, parse_reset_duration
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1s", 1.0), ("20ms", 0.02), ("6m0s", 360.0), ("1h2m", 3720.0), ("2.5", 2.5), ("", None), ("soon", None),
+])
+def test_parse_reset_duration(value, seconds):
+    assert parse_reset_duration(value) == seconds
+
+
+def test_requests_wait_for_refill(clock):
+    limiter = RateLimiter(requests_per_minute=60)
+    limiter.requests.available = 1
+
+    assert limiter.acquire() == 0.0
+    assert limiter.acquire() == pytest.approx(1.0)
+    assert limiter.total_wait == pytest.approx(1.0)
+
+
+def test_tokens_are_budgeted_per_minute(clock):
+    limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=600)
+
+    assert limiter.acquire(500) == 0.0
+    # 400 more tokens need 300 to refill at 10 tokens/s
+    assert limiter.acquire(400) == pytest.approx(30.0)
+
+
+def test_oversized_request_waits_for_a_full_bucket_only(clock):
+    bucket = TokenBucket(600)
+    bucket.consume(600)
+    assert bucket.wait_time(10_000) == pytest.approx(60.0)
+
+
+def test_unused_reservation_is_refunded(clock):
+    limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=1000)
+    limiter.acquire(800)
+    limiter.record_usage(800, 300)
+
+    assert limiter.tokens.available == pytest.approx(700)
+    assert limiter.actual_tokens == 300
+
+
+def test_refund_never_overfills_and_overuse_is_charged(clock):
+    limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=1000)
+    limiter.acquire(100)
+    limiter.record_usage(100, 0)
+    assert limiter.tokens.available == 1000
+
+    limiter.acquire(100)
+    limiter.record_usage(100, 400)
+    assert limiter.tokens.available == pytest.approx(600)
+
+
+def test_missing_usage_keeps_the_reservation(clock):
+    limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=1000)
+    limiter.acquire(100)
+    limiter.record_usage(100, None)
+    assert limiter.tokens.available == pytest.approx(900)
+
+
+def test_completion_reservation_tracks_observed_replies(clock):
+    limiter = RateLimiter(requests_per_minute=1000, expected_completion_tokens=100)
+    assert limiter.expected_completion(4000) == 150
+    assert limiter.expected_completion(4000, queries=4) == 600
+    assert limiter.expected_completion(120) == 120
+
+    for _ in range(30):
+        limiter.record_usage(1000, 1000, completion_tokens=400, queries=4)
+    assert limiter.completion_tokens_per_query == pytest.approx(100, abs=1)
+
+    for _ in range(30):
+        limiter.record_usage(1000, 1000, completion_tokens=300)
+    assert limiter.expected_completion(4000) == pytest.approx(450, abs=2)
+
+
+def test_completion_reservation_ignores_calls_without_usage(clock):
+    limiter = RateLimiter(requests_per_minute=1000, expected_completion_tokens=100)
+    limiter.record_usage(1000, None, completion_tokens=4000)
+    limiter.record_usage(1000, 1000, completion_tokens=4000, queries=0)
+    assert limiter.completion_tokens_per_query == 100
+
+
+def test_headers_lower_the_budget_but_never_raise_it(clock):
+    limiter = RateLimiter(requests_per_minute=500)
+    limiter.update_from_headers({"x-ratelimit-limit-requests": "60", "x-ratelimit-remaining-requests": "5"})
+    assert limiter.requests.capacity == 60
+    assert limiter.requests.available == 5
+
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "50"})
+    assert limiter.requests.available == 5
+
+
+def test_exhausted_headers_block_until_reset(clock):
+    limiter = RateLimiter(requests_per_minute=60)
+    limiter.update_from_headers({
+        "x-ratelimit-limit-requests": "60",
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "2s",
+    })
+    # Back at zero after 2s, then one more second for a whole request
+    assert limiter.acquire() == pytest.approx(3.0)
+
+
+def test_token_bucket_is_created_from_headers(clock):
+    limiter = RateLimiter(requests_per_minute=60)
+    assert limiter.tokens is None
+
+    limiter.update_from_headers({"x-ratelimit-limit-tokens": "30000", "x-ratelimit-remaining-tokens": "1000"})
+    assert limiter.tokens.capacity == 30000
+    assert limiter.tokens.available == 1000
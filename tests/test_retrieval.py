@@ -0,0 +1,92 @@
+"""Embedding retrieval under the shared rate limiter and retry policy"""
+
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from qcl.classification.retrieval import EmbeddingRetriever, embed_texts
+from qcl.core import retry
+from qcl.core.rate_limit import RateLimiter
+from qcl.core.retry import RetryError, RetryPolicy
+
+TOPICS = ["weather", "shopping", "sports"]
+
+
+def rate_limit_error():
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    response = httpx.Response(429, headers={"retry-after-ms": "10"}, request=request)
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+class FakeEmbeddingsClient:
+    """One-hot embeddings by topic word; the first `failures` requests are throttled"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.requests = 0
+        self.max_retries = None
+        self.embeddings = SimpleNamespace(create=self._create)
+
+    def with_options(self, max_retries):
+        self.max_retries = max_retries
+        return self
+
+    def _create(self, model, input):
+        self.requests += 1
+        if self.failures:
+            self.failures -= 1
+            raise rate_limit_error()
+        data = [SimpleNamespace(index=i, embedding=[float(topic in text) for topic in TOPICS] + [0.1])
+                for i, text in enumerate(input)]
+        return SimpleNamespace(data=list(reversed(data)), usage=SimpleNamespace(total_tokens=len(input)))
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(retry.time, "sleep", lambda seconds: None)
+
+
+def make_retriever(client, retry_policy, rate_limiter=None):
+    retriever = EmbeddingRetriever(client, top_k=1, rate_limiter=rate_limiter, retry_policy=retry_policy)
+    retriever.index({"chunks": [f"guidelines about {topic}" for topic in TOPICS]})
+    return retriever
+
+
+def test_rows_are_unit_length_and_in_input_order():
+    matrix = embed_texts(FakeEmbeddingsClient(), "model", ["sports news", "weather today"])
+    assert matrix.shape == (2, 4)
+    assert matrix[0].argmax() == 2 and matrix[1].argmax() == 0
+    assert (abs((matrix ** 2).sum(axis=1) - 1) < 1e-6).all()
+
+
+def test_throttled_query_embedding_is_retried_not_replaced_by_leading_chunks():
+    client = FakeEmbeddingsClient()
+    policy = RetryPolicy(max_retries=3)
+    retriever = make_retriever(client, policy)
+    assert client.max_retries == 0
+
+    client.failures = 1
+    assert retriever.retrieve("sports scores") == [2]
+    assert policy.stats.throttled == 1 and policy.stats.recovered == 1
+
+
+def test_embedding_requests_take_rate_limit_slots():
+    limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=100000)
+    retriever = make_retriever(FakeEmbeddingsClient(), RetryPolicy(), limiter)
+    available = limiter.requests.available
+
+    retriever.retrieve_shared(["sports", "shopping"], k=2)
+
+    assert limiter.requests.available == pytest.approx(available - 1, abs=0.1)
+    assert limiter.actual_tokens == 3 + 2
+
+
+def test_gives_up_after_the_retry_budget():
+    client = FakeEmbeddingsClient()
+    retriever = make_retriever(client, RetryPolicy(max_retries=1))
+    client.failures = 5
+    with pytest.raises(RetryError):
+        retriever.retrieve("sports")
+    assert client.requests == 1 + 2
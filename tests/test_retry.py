@@ -0,0 +1,128 @@
+"""RetryPolicy error classification, Retry-After handling and bookkeeping"""
+
+import httpx
+import openai
+import pytest
+
+from qcl.core import retry
+from qcl.core.retry import RetryError, RetryPolicy, ResponseParseError, is_retryable, retry_after_seconds, was_rejected
+
+
+def status_error(status_code, headers=None, code=None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    body = {"code": code} if code else None
+    error_class = openai.RateLimitError if status_code == 429 else openai.APIStatusError
+    return error_class(f"HTTP {status_code}", response=response, body=body)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    slept = []
+    monkeypatch.setattr(retry.time, "sleep", slept.append)
+    return slept
+
+
+@pytest.mark.parametrize("status_code", [408, 409, 429, 500, 503])
+def test_transient_status_codes_are_retryable(status_code):
+    assert is_retryable(status_error(status_code))
+
+
+@pytest.mark.parametrize("status_code", [400, 401, 404, 422])
+def test_client_errors_are_permanent(status_code):
+    assert not is_retryable(status_error(status_code))
+
+
+def test_exhausted_quota_is_permanent_despite_429():
+    assert not is_retryable(status_error(429, code="insufficient_quota"))
+
+
+def connection_error(cause):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    error_class = openai.APITimeoutError if isinstance(cause, httpx.TimeoutException) else openai.APIConnectionError
+    error = error_class(request=request)
+    error.__cause__ = cause
+    return error
+
+
+@pytest.mark.parametrize("error, rejected", [
+    (status_error(429), True),
+    (status_error(400), True),
+    (status_error(408), False),
+    (status_error(500), False),
+    (connection_error(httpx.ConnectError("refused")), True),
+    (connection_error(httpx.ConnectTimeout("connect")), True),
+    (connection_error(httpx.ReadTimeout("read")), False),
+    (connection_error(httpx.RemoteProtocolError("closed")), False),
+    (ValueError("no content"), False),
+])
+def test_only_requests_that_never_ran_count_as_rejected(error, rejected):
+    assert was_rejected(error) is rejected
+
+
+def test_parse_and_connection_errors_are_retryable():
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    assert is_retryable(ResponseParseError("not JSON"))
+    assert is_retryable(openai.APIConnectionError(request=request))
+    assert not is_retryable(ValueError("bug"))
+
+
+def test_retry_after_headers():
+    assert retry_after_seconds(status_error(429, {"retry-after-ms": "1500"})) == 1.5
+    assert retry_after_seconds(status_error(429, {"retry-after": "7"})) == 7.0
+    assert retry_after_seconds(status_error(429)) is None
+    assert retry_after_seconds(ValueError("no response")) is None
+
+
+def test_retry_after_is_honoured_over_backoff():
+    policy = RetryPolicy(base_delay=0.01, max_delay=0.02)
+    delay = policy.delay_for(5, status_error(429, {"retry-after": "10"}))
+    assert 10.0 <= delay <= 11.05
+
+
+def test_backoff_is_capped():
+    policy = RetryPolicy(base_delay=1.0, max_delay=4.0)
+    assert all(0 <= policy.delay_for(10, ValueError()) <= 4.0 for _ in range(100))
+
+
+def test_transient_failure_recovers(no_sleep):
+    outcomes = [status_error(503), status_error(429, {"retry-after": "2"}), "ok"]
+
+    def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    policy = RetryPolicy(max_retries=3)
+    assert policy.call(call) == "ok"
+    assert policy.stats.retries == 2
+    assert policy.stats.recovered == 1
+    assert policy.stats.throttled == 1
+    assert len(no_sleep) == 2 and no_sleep[1] >= 2.0
+
+
+def test_permanent_error_is_not_retried(no_sleep):
+    def call():
+        raise status_error(400)
+
+    policy = RetryPolicy(max_retries=3)
+    with pytest.raises(RetryError) as raised:
+        policy.call(call)
+    assert raised.value.attempts == 1
+    assert raised.value.retryable is False
+    assert policy.stats.permanent == 1
+    assert no_sleep == []
+
+
+def test_gives_up_after_max_retries(no_sleep):
+    def call():
+        raise status_error(500)
+
+    policy = RetryPolicy(max_retries=2)
+    with pytest.raises(RetryError) as raised:
+        policy.call(call)
+    assert raised.value.attempts == 3
+    assert raised.value.retryable is True
+    assert policy.stats.exhausted == 1
+    assert len(no_sleep) == 2
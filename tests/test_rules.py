@@ -0,0 +1,134 @@
+"""Rules fast path: phrase trie, lexicon matches and QUICKFACT patterns"""
+
+import pytest
+
+from qcl.classification.rules import LexiconEntry, PhraseTrie, RulesClassifier, normalize
+
+
+@pytest.fixture
+def rules():
+    entries = [
+        LexiconEntry("gmail", "mail.google.com", "Google", ["tech_electronics"]),
+        LexiconEntry("bank of america", "bankofamerica.com", "Bank of America", ["finance"]),
+        LexiconEntry("bank", "bank.example", ""),
+        LexiconEntry("walmart", "walmart.com", "Walmart", ["retailers"], kind="chain"),
+        LexiconEntry("xvideos", "xvideos.com", kind="adult"),
+    ]
+    return RulesClassifier(entries, aliases={"boa": "bank of america"})
+
+
+def flags(schema):
+    return sorted(name for name, flag in schema.items() if flag)
+
+
+def test_trie_prefers_the_longest_phrase():
+    trie = PhraseTrie()
+    trie.add("bank", "short")
+    trie.add("bank of america", "long")
+    trie.add("bank", "replaced")
+
+    assert trie.size == 2
+    assert trie.longest("bank of america login".split()) == (3, "long")
+    assert trie.longest("bank of".split()) == (1, "replaced")
+    assert trie.longest("citibank".split()) is None
+    assert trie.covers("bank of america bank".split()) == ["long", "replaced"]
+    assert trie.covers("bank robbery".split()) is None
+
+
+def test_normalize():
+    assert normalize("  WWW.Gmail.com ") == "gmail.com"
+    assert normalize("Ｇｍａｉｌ   Login") == "gmail login"
+
+
+@pytest.mark.parametrize("query", ["gmail", "Gmail Login", "mail.google.com", "boa sign in", "Bank of America"])
+def test_navigational_queries(rules, query):
+    data = rules.classify(query)
+    assert data["prime_category"] == "Navigational"
+    assert flags(data["intent_schema"]) == ["website"]
+
+
+def test_entities_and_topics_come_from_the_lexicon(rules):
+    data = rules.classify("bank of america login")
+    assert data["entity_schema"]["website"] == ["bankofamerica.com"]
+    assert data["entity_schema"]["specific_organization"] == ["Bank of America"]
+    assert flags(data["topic_schema"]) == ["finance"]
+    assert data["research_notes"].startswith("Rules fast path:")
+
+
+def test_chain_with_local_modifier_is_a_store_lookup(rules):
+    assert rules.classify("walmart near me")["prime_category"] == "Local_Chain"
+    assert rules.classify("walmart")["prime_category"] == "Navigational"
+
+
+def test_adult_sites(rules):
+    assert rules.classify("xvideos")["prime_category"] == "OTHER_Adult"
+
+
+@pytest.mark.parametrize("query", [
+    "gmail not working",   # trailing words that are not modifiers
+    "how to use gmail",    # site not at the start
+    "gmail near me",       # local modifier on a non-chain site
+    "banking jobs",
+    "best laptops 2024",
+])
+def test_anything_else_goes_to_the_llm(rules, query):
+    assert rules.classify(query) is None
+
+
+@pytest.mark.parametrize("query, category", [
+    ("weather in boston", "Weather"),
+    ("boston weather", "Weather"),
+    ("weather new york ny", "Weather"),
+    ("90210", "QUICKFACT_Zip_Code"),
+    ("zip code for austin", "QUICKFACT_Zip_Code"),
+    ("austin, tx zip code", "QUICKFACT_Zip_Code"),
+    ("what time is it in tokyo", "QUICKFACT_Time"),
+    ("time in france", "QUICKFACT_Time"),
+    ("5 km to miles", "QUICKFACT_Conversion"),
+    ("how many ounces in a pound", "QUICKFACT_Conversion"),
+])
+def test_quickfact_patterns(rules, query, category):
+    assert rules.classify(query)["prime_category"] == category
+
+
+def test_patterns_reject_sites_and_same_unit_conversions(rules):
+    assert rules.classify("walmart weather") is None
+    assert rules.classify("km to km") is None
+
+
+@pytest.mark.parametrize("query", [
+    "zip lining",
+    "zip code",
+    "time in a bottle",
+    "time in spanish",
+    "weather apps for iphone",
+    "weather underground",
+    "forecast for bitcoin",
+    "minecraft weather",
+    "weather tx",          # a state abbreviation alone is not a place
+    "weather boston tokyo",
+])
+def test_patterns_only_accept_gazetteer_places(rules, query):
+    assert rules.classify(query) is None
+
+
+def test_place_entities(rules):
+    city = rules.classify("weather in austin tx")["entity_schema"]
+    assert city["specific_place_city"] == ["austin tx"]
+    country = rules.classify("time in japan")["entity_schema"]
+    assert country["specific_place_other"] == ["japan"]
+    assert country["specific_place_city"] == []
+
+
+def test_extra_places_extend_the_gazetteer():
+    rules = RulesClassifier([], places=["Springfield"])
+    assert rules.classify("springfield weather")["entity_schema"]["specific_place_city"] == ["springfield"]
+
+
+def test_stats(rules):
+    rules.classify("gmail")
+    rules.classify("weather in boston")
+    rules.classify("unknown query")
+    assert rules.stats.checked == 3
+    assert rules.stats.matched == 2
+    assert rules.stats.by_rule == {"site": 1, "weather": 1}
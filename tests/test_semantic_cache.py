@@ -0,0 +1,155 @@
+"""Semantic cache: vector index search, thresholds, reuse and audit sampling"""
+
+import numpy as np
+import pytest
+
+from qcl.classification.semantic_cache import NgramEmbedder, SemanticCache, SemanticHit, VectorIndex
+from qcl.data.cache import ClassificationCache
+
+AMAZON = {
+    "annotation_schema": {"misspelled_malformed": False},
+    "entity_schema": {"website": ["amazon.com"], "specific_organization": ["Amazon"]},
+    "intent_schema": {"website": True},
+    "topic_schema": {"retailers": True},
+    "prime_category": "Navigational",
+    "research_notes": "amazon prime membership page",
+    "confidence_score": 0.9,
+}
+
+
+def unit_vectors(count, dimensions=16, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_exact_search_finds_the_nearest_row():
+    index = VectorIndex(16)
+    assert index.search(unit_vectors(1)[0]) is None
+
+    vectors = unit_vectors(50)
+    for row, vector in enumerate(vectors):
+        index.add(vector, f"key{row}", f"text{row}")
+    index.add(vectors[0], "key0", "duplicate key is ignored")
+
+    assert len(index) == 50
+    assert index.centroids is None
+    row, similarity = index.search(vectors[17])
+    assert row == 17
+    assert similarity == pytest.approx(1.0)
+
+
+def test_ivf_is_trained_past_the_exact_limit():
+    vectors = unit_vectors(400)
+    index = VectorIndex(16, exact_limit=100, nprobe=3)
+    for row, vector in enumerate(vectors):
+        index.add(vector, f"key{row}", f"text{row}")
+
+    assert index.centroids is not None
+    # Trained at 101 rows, then retrained once the index doubled to 202
+    assert index._trained_size == 202
+    # A stored vector always lies in its own nearest list
+    for row in (0, 150, 399):
+        assert index.search(vectors[row])[0] == row
+
+
+def test_ivf_with_every_list_probed_matches_exact_search():
+    vectors = unit_vectors(300)
+    exact = VectorIndex(16)
+    ivf = VectorIndex(16, exact_limit=50, nprobe=1000)
+    for row, vector in enumerate(vectors):
+        exact.add(vector, f"key{row}", f"text{row}")
+        ivf.add(vector, f"key{row}", f"text{row}")
+
+    for query in unit_vectors(20, seed=1):
+        assert ivf.search(query)[0] == exact.search(query)[0]
+
+
+def test_index_round_trips_through_a_file(tmp_path):
+    vectors = unit_vectors(120)
+    index = VectorIndex(16, exact_limit=60)
+    for row, vector in enumerate(vectors):
+        index.add(vector, f"key{row}", f"text{row}")
+    index.save(tmp_path / "index.npz")
+
+    loaded = VectorIndex.load(tmp_path / "index.npz", 16, exact_limit=60)
+    assert loaded.keys == index.keys
+    assert loaded.texts == index.texts
+    assert np.array_equal(loaded.centroids, index.centroids)
+    assert loaded.search(vectors[42]) == index.search(vectors[42])
+    with pytest.raises(ValueError):
+        VectorIndex.load(tmp_path / "index.npz", 32)
+
+
+@pytest.fixture
+def semantic(tmp_path):
+    cache = ClassificationCache(tmp_path / "cache.sqlite")
+    cache.put("amazon-key", AMAZON, "amazon prime")
+    semantic = SemanticCache(cache, NgramEmbedder(), tmp_path, audit_rate=0.0, seed=0)
+    semantic.add("amazon prime", "amazon-key", "namespace")
+    yield semantic
+    cache.close()
+
+
+@pytest.mark.parametrize("query", ["amazon prime video", "amazn prime", "amazon prime login"])
+def test_default_threshold_reuses_near_duplicates(semantic, query):
+    assert semantic.threshold == NgramEmbedder.default_threshold
+    hit = semantic.lookup(query, "namespace")
+    assert hit.neighbour_text == "amazon prime"
+    assert hit.data["prime_category"] == "Navigational"
+
+
+@pytest.mark.parametrize("query", ["amazon music", "prime video", "harry potter"])
+def test_different_queries_miss(semantic, query):
+    assert semantic.lookup(query, "namespace") is None
+
+
+def test_explicit_threshold_and_namespaces(semantic):
+    semantic.threshold = 0.9
+    assert semantic.lookup("amazn prime", "namespace") is None
+    semantic.threshold = 0.5
+    assert semantic.lookup("amazn prime", "another namespace") is None
+    assert semantic.stats.lookups == 2
+    assert semantic.stats.hits == 0
+
+
+def test_evicted_neighbour_counts_as_stale(semantic):
+    semantic.add("amazon prime day", "evicted-key", "namespace")
+    assert semantic.lookup("amazon prime day", "namespace") is None
+    assert semantic.stats.stale == 1
+
+
+def test_reused_data_drops_query_specific_fields(semantic):
+    hit = semantic.lookup("amazn prime", "namespace")
+    reused = hit.reused_data()
+
+    assert reused["entity_schema"] == {"website": [], "specific_organization": []}
+    assert "'amazon prime'" in reused["research_notes"]
+    assert reused["prime_category"] == "Navigational"
+    assert reused["intent_schema"] == {"website": True}
+    assert hit.data["entity_schema"]["website"] == ["amazon.com"]
+
+
+@pytest.mark.parametrize("rate, expected", [(0.0, 0), (1.0, 1000)])
+def test_audit_rate_extremes(tmp_path, rate, expected):
+    semantic = SemanticCache(None, NgramEmbedder(), tmp_path, audit_rate=rate, seed=0)
+    assert sum(semantic.should_audit() for _ in range(1000)) == expected
+
+
+def test_audit_sampling_is_seeded(tmp_path):
+    first, second = (SemanticCache(None, NgramEmbedder(), tmp_path, audit_rate=0.1, seed=7) for _ in range(2))
+    assert [first.should_audit() for _ in range(100)] == [second.should_audit() for _ in range(100)]
+
+    semantic = SemanticCache(None, NgramEmbedder(), tmp_path, audit_rate=0.1, seed=7)
+    audited = sum(semantic.should_audit() for _ in range(10000))
+    assert 800 < audited < 1200
+
+
+def test_audits_measure_false_reuse(tmp_path):
+    semantic = SemanticCache(None, NgramEmbedder(), tmp_path, seed=0)
+    hit = SemanticHit(AMAZON, "amazon prime", 0.8)
+    semantic.record_audit("amazn prime", hit, "Navigational", "Navigational")
+    semantic.record_audit("amazon prime video", hit, "Navigational", "Shopping")
+
+    assert len(semantic.stats.audits) == 2
+    assert semantic.stats.false_reuse == 1
+    assert semantic.stats.false_reuse_rate == 0.5